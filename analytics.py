@@ -0,0 +1,269 @@
+"""
+计时段分析：把时间窗口内的开始/结束日志配对成计时段 (start, stop) 数组，再用 NumPy 向量化计算
+- 并发曲线：每个采样点进行中的事件数，以及每个步长内的峰值
+- 时长分布：按事件或负责人分组的 p50 / p90 / p99 和直方图
+日志来自 event_logs 和已归档的月份，配对规则与 fold_log_into_stats 相同（结束日志的前一条日志是开始才构成计时段）。
+"""
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # Optional, the analytics routes report it is unavailable
+    np = None
+
+from log_archive import fetch_columns, merge_arrays, to_datetime64
+
+QUANTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))
+# Histogram bin edges in seconds, the last bin is open-ended
+HISTOGRAM_EDGES = (0, 60, 300, 900, 1800, 3600, 7200, 14400, 28800, 86400)
+LABEL_CHUNK = 1000
+PROBE_CHUNK = 200 # UNION ALL branches per statement
+
+
+def _micros(value):
+    return np.datetime64(value, 'us').astype(np.int64)
+
+
+def _to_datetime(micros):
+    return np.int64(micros).astype('datetime64[us]').item()
+
+
+def _previous_logs(conn, archive, event_ids, before):
+    """每个事件在 before 之前的最后一条日志 {event_id: (log_type, log_time)}，先查热表，找不到的再查归档"""
+    previous = {}
+    cursor = conn.cursor()
+    try:
+        for chunk_start in range(0, len(event_ids), PROBE_CHUNK):
+            chunk = event_ids[chunk_start:chunk_start + PROBE_CHUNK]
+            # One backwards idx_event_time probe per event; a GROUP BY MAX() would read each event's whole history
+            probes = " UNION ALL ".join(
+                f"""SELECT * FROM (SELECT event_id, log_type, log_time FROM event_logs
+                    WHERE event_id = %s AND log_time < %s ORDER BY log_time DESC, log_id DESC LIMIT 1) AS p{index}"""
+                for index in range(len(chunk)))
+            cursor.execute(probes, tuple(param for event_id in chunk for param in (event_id, before)))
+            for event_id, log_type, log_time in cursor.fetchall():
+                previous[event_id] = (log_type, log_time)
+    finally:
+        cursor.close()
+    archived_before = archive.archived_before()
+    if archived_before:
+        for event_id in event_ids:
+            if event_id not in previous:
+                rows = archive.event_logs(event_id, None, min(before, archived_before))
+                if rows:
+                    previous[event_id] = (rows[-1][1], rows[-1][2])
+    return previous
+
+
+def load_sessions(conn, archive, time_from, time_to, lookback, now=None):
+    """
+    返回与 [time_from, time_to) 有重叠的计时段 {'event_id', 'start', 'stop', 'complete'}（时间为微秒整数）。
+    读取 [time_from - lookback, time_to + lookback) 的日志：
+    - 开始后紧跟结束：完整的计时段
+    - 事件在读取范围内的最后一条是开始：结束时间取 min(now, 读取范围末尾)，裁剪到窗口后结果不变
+    - 事件在读取范围内的第一条是结束：查它之前的最后一条日志，是开始时补上这个计时段
+    - 读取范围内没有日志、但现在仍在进行的事件（event_statistics）：从 last_start_time 到 now
+    比 lookback 更长、在读取范围内没有任何日志且已经结束的计时段不会被统计到。
+    """
+    now = now or datetime.now()
+    read_from, read_to = time_from - lookback, time_to + lookback
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute("""
+            SELECT log_id, event_id, log_type, log_time FROM event_logs
+            WHERE log_time >= %s AND log_time < %s
+        """, (read_from, read_to))
+        hot = fetch_columns(cursor)
+    finally:
+        cursor.close()
+    parts = ([hot] if hot is not None else []) + archive.time_range(read_from, read_to)
+    empty = np.zeros(0, dtype=np.int64)
+    event_ids, starts, stops, complete = [empty], [empty], [empty], [np.zeros(0, dtype=bool)]
+
+    if parts:
+        logs = merge_arrays(parts) # Sorted by (event_id, log_time, log_id)
+        ev, types, times = logs['event_id'], logs['log_type'], logs['log_time'].astype(np.int64)
+        same_next = np.zeros(len(ev), dtype=bool)
+        same_next[:-1] = ev[1:] == ev[:-1]
+        next_is_stop = np.zeros(len(ev), dtype=bool)
+        next_is_stop[:-1] = types[1:] == 0
+
+        closed = np.flatnonzero((types == 1) & same_next & next_is_stop)
+        event_ids.append(ev[closed])
+        starts.append(times[closed])
+        stops.append(times[closed + 1])
+        complete.append(np.ones(len(closed), dtype=bool))
+
+        still_open = np.flatnonzero((types == 1) & ~same_next)
+        event_ids.append(ev[still_open])
+        starts.append(times[still_open])
+        stops.append(np.full(len(still_open), _micros(min(now, read_to)), dtype=np.int64))
+        complete.append(np.zeros(len(still_open), dtype=bool))
+
+        first = np.ones(len(ev), dtype=bool)
+        first[1:] = ev[1:] != ev[:-1]
+        orphans = np.flatnonzero((types == 0) & first)
+        if len(orphans):
+            previous = _previous_logs(conn, archive, ev[orphans].tolist(), read_from)
+            matched = [(index, previous[event_id][1]) for index, event_id in zip(orphans.tolist(), ev[orphans].tolist())
+                       if event_id in previous and previous[event_id][0] == 1]
+            if matched:
+                indexes = np.array([index for index, _ in matched], dtype=np.int64)
+                event_ids.append(ev[indexes])
+                starts.append(to_datetime64([start for _, start in matched]).astype(np.int64))
+                stops.append(times[indexes])
+                complete.append(np.ones(len(indexes), dtype=bool))
+        seen = np.unique(ev)
+    else:
+        seen = empty
+
+    # Running since before the read range, without a single log inside it
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT event_id, last_start_time FROM event_statistics
+            WHERE event_status = 1 AND last_start_time < %s
+        """, (read_from,))
+        running = [(event_id, start) for event_id, start in cursor.fetchall() if isinstance(start, datetime)]
+    finally:
+        cursor.close()
+    seen = set(seen.tolist())
+    running = [(event_id, start) for event_id, start in running if event_id not in seen]
+    if running:
+        event_ids.append(np.array([event_id for event_id, _ in running], dtype=np.int64))
+        starts.append(to_datetime64([start for _, start in running]).astype(np.int64))
+        stops.append(np.full(len(running), _micros(now), dtype=np.int64))
+        complete.append(np.zeros(len(running), dtype=bool))
+
+    sessions = {'event_id': np.concatenate(event_ids), 'start': np.concatenate(starts),
+                'stop': np.concatenate(stops), 'complete': np.concatenate(complete)}
+    overlap = (sessions['start'] < _micros(time_to)) & (sessions['stop'] > _micros(time_from))
+    return {name: column[overlap] for name, column in sessions.items()}
+
+
+def concurrency_curve(sessions, time_from, time_to, step_seconds):
+    """
+    每个采样点 time_from + k * step 正在进行的计时段数 (running)，以及 [采样点, 下一个采样点) 内的峰值 (peak)。
+    计时段按 [start, stop) 计算，先裁剪到窗口内。
+    """
+    window_start, window_end = _micros(time_from), _micros(time_to)
+    step = int(step_seconds * 1000000)
+    starts = np.clip(sessions['start'], window_start, window_end)
+    stops = np.clip(sessions['stop'], window_start, window_end)
+    keep = stops > starts
+    starts, stops = np.sort(starts[keep]), np.sort(stops[keep])
+
+    samples = np.arange(window_start, window_end, step, dtype=np.int64)
+    running = np.searchsorted(starts, samples, 'right') - np.searchsorted(stops, samples, 'right')
+    # The level only rises at a start, so each bucket's peak is the level right after one of its starts
+    level_at_starts = np.searchsorted(starts, starts, 'right') - np.searchsorted(stops, starts, 'right')
+    peak = running.copy()
+    np.maximum.at(peak, (starts - window_start) // step, level_at_starts)
+
+    points = [{'time': _to_datetime(sample).isoformat(), 'running': int(count), 'peak': int(top)}
+              for sample, count, top in zip(samples.tolist(), running.tolist(), peak.tolist())]
+    overall = None
+    if len(level_at_starts):
+        at = int(np.argmax(level_at_starts))
+        overall = {'running': int(level_at_starts[at]), 'time': _to_datetime(starts[at]).isoformat()}
+    return {'points': points, 'peak': overall, 'sessions': int(keep.sum())}
+
+
+def _group_quantiles(group_index, values, group_count):
+    """按组计算分位数（线性插值，与 np.percentile 默认方法相同），values 已在组内排好序"""
+    counts = np.bincount(group_index, minlength=group_count)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    results = {}
+    for name, quantile in QUANTILES:
+        position = offsets + quantile * (counts - 1)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        results[name] = values[low] + (values[high] - values[low]) * (position - low)
+    return counts, results
+
+
+def _histograms(group_index, values, group_count):
+    edges = np.array(HISTOGRAM_EDGES, dtype=np.float64)
+    bins = np.clip(np.searchsorted(edges, values, 'right') - 1, 0, len(edges) - 1)
+    return np.bincount(group_index * len(edges) + bins, minlength=group_count * len(edges)).reshape(
+        group_count, len(edges))
+
+
+def duration_summary(group_keys, durations):
+    """
+    按 group_keys（整数编码）汇总时长（秒）：{'groups': [(key, 统计)], 'overall': 统计}。
+    统计包含 count / total / mean / max / p50 / p90 / p99 / histogram（按 HISTOGRAM_EDGES 分桶）。
+    """
+    def summarize(group_index, values, group_count):
+        order = np.lexsort((values, group_index))
+        group_index, values = group_index[order], values[order]
+        counts, quantiles = _group_quantiles(group_index, values, group_count)
+        totals = np.bincount(group_index, weights=values, minlength=group_count)
+        maxima = np.zeros(group_count)
+        np.maximum.at(maxima, group_index, values)
+        histograms = _histograms(group_index, values, group_count)
+        return [{
+            'count': int(counts[index]),
+            'total_seconds': round(float(totals[index]), 4),
+            'mean_seconds': round(float(totals[index] / counts[index]), 4),
+            'max_seconds': round(float(maxima[index]), 4),
+            **{f"{name}_seconds": round(float(quantiles[name][index]), 4) for name, _ in QUANTILES},
+            'histogram': histograms[index].tolist(),
+        } for index in range(group_count)]
+
+    if not len(durations):
+        return {'groups': [], 'overall': None}
+    keys, group_index = np.unique(group_keys, return_inverse=True)
+    groups = summarize(group_index, durations, len(keys))
+    overall = summarize(np.zeros(len(durations), dtype=np.int64), durations, 1)[0]
+    return {'groups': list(zip(keys.tolist(), groups)), 'overall': overall}
+
+
+def event_labels(conn, event_ids):
+    """{event_id: (event_name, responsible_person)}"""
+    labels = {}
+    cursor = conn.cursor()
+    try:
+        for chunk_start in range(0, len(event_ids), LABEL_CHUNK):
+            chunk = event_ids[chunk_start:chunk_start + LABEL_CHUNK]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(f"SELECT event_id, event_name, responsible_person FROM event_info WHERE event_id IN ({placeholders})",
+                           tuple(chunk))
+            labels.update((event_id, (name, person)) for event_id, name, person in cursor.fetchall())
+    finally:
+        cursor.close()
+    return labels
+
+
+def session_durations(conn, sessions, time_from, time_to, group_by):
+    """
+    窗口内结束的完整计时段按事件或负责人分组的时长分布。
+    返回 (overall, [{'key', 'label', ...统计}])，组按总时长从大到小排列。
+    """
+    done = sessions['complete'] & (sessions['stop'] >= _micros(time_from)) & (sessions['stop'] < _micros(time_to))
+    event_ids = sessions['event_id'][done]
+    durations = (sessions['stop'][done] - sessions['start'][done]) / 1000000.0
+    labels = event_labels(conn, np.unique(event_ids).tolist())
+    if group_by == 'person':
+        persons = sorted({labels.get(event_id, (None, None))[1] or '' for event_id in labels} | {''})
+        codes = {person: code for code, person in enumerate(persons)}
+        group_keys = np.array([codes[labels.get(event_id, (None, None))[1] or ''] for event_id in event_ids.tolist()],
+                              dtype=np.int64)
+    else:
+        group_keys = event_ids
+    summary = duration_summary(group_keys, durations)
+    groups = []
+    for key, stats in summary['groups']:
+        if group_by == 'person':
+            person = persons[key] or None # '' and NULL both mean unassigned
+            groups.append({'key': person, 'label': person, **stats})
+        else:
+            groups.append({'key': key, 'label': labels.get(key, (None, None))[0], **stats})
+    groups.sort(key=lambda group: (-group['total_seconds'], str(group['key'])))
+    return summary['overall'], groups
+
+
+def default_window(days, now=None):
+    """到明天零点为止的 days 天"""
+    end = datetime.combine((now or datetime.now()).date() + timedelta(days=1), datetime.min.time())
+    return end - timedelta(days=days), end
@@ -1,13 +1,43 @@
 import os
 import math
+import time
+import atexit
+import functools
+import json
+import base64
+import hashlib
+import click
 import mysql.connector
-from flask import Flask, request, jsonify, render_template
-from datetime import datetime
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context, has_request_context
+from datetime import datetime, date, timedelta
 from decimal import Decimal # 用于精确计算
 from flask_cors import CORS
+from db_pool import ConnectionPool, PoolExhaustedError
+import storage
+from storage import DB_ERRORS
+from cache import TTLCache, VersionedResponseCache
+from event_stream import EventBroker
+from event_log_queue import EventLogQueue, LogQueueFullError, fold_log_into_stats
+from export_stream import stream_rows
+from event_queries import (EVENT_FROM_SQL, OrjsonProvider, json_value, parse_fields,
+                           fetch_event, fetch_event_stats, fetch_dashboard_events)
+import rollups
+import person_summary
+import name_search
+import log_archive
+import stats_rebuild
+import analytics
+import metrics
+import profiling
+import compression
+import replicas
+import migrations
+import query_check
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 CORS(app) # 允许跨域请求，方便本地开发
+if OrjsonProvider and os.environ.get('JSON_ENCODER', 'orjson').lower() == 'orjson':
+    app.json = OrjsonProvider(app) # orjson 可用时用它编码响应
 
 # --- 数据库配置 ---
 # !!! 警告：生产环境不要硬编码密码 !!!
@@ -22,224 +52,919 @@ DB_CONFIG = {
     'connection_timeout': 10 # Added connection timeout
 }
 
+# --- 存储后端：mysql (默认) / sqlite (嵌入式，WAL 模式，适合单节点部署) ---
+DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql').lower()
+SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'event_time_logger.db'))
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', 'true').lower() == 'true' # 启动时执行未执行的结构迁移 (migrations.py)
+
+storage_backend = storage.create_backend(DB_BACKEND, DB_CONFIG, SQLITE_PATH)
+if AUTO_MIGRATE:
+    try:
+        for version, description, created in storage_backend.ensure_schema():
+            print(f"Applied {storage_backend.name} migration {version} ({description}): {', '.join(created) or 'no changes'}")
+    except Exception as err: # Never block startup, requests report connection problems themselves
+        print(f"Warning: could not migrate the database schema: {err}")
+
+# --- 连接池配置 ---
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5)) # 连接池耗尽时最长等待秒数
+DB_POOL_VALIDATE_AFTER = float(os.environ.get('DB_POOL_VALIDATE_AFTER', 5)) # 空闲超过该秒数的连接借出前先 ping
+DB_PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', 'true').lower() == 'true' # 热点查询使用服务端预处理语句
+
+# --- 运行指标 (GET /metrics，Prometheus 文本格式) ---
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true' # 关闭后不再记录请求和查询耗时
+metrics_registry = metrics.Registry('event_time_logger')
+http_requests_total = metrics_registry.counter(
+    'http_requests_total', "HTTP requests by route, method and status", ['endpoint', 'method', 'status'])
+http_request_seconds = metrics_registry.histogram(
+    'http_request_duration_seconds', "Time until the handler returned its response, by route", ['endpoint', 'method'])
+errors_total = metrics_registry.counter('errors_total', "Errors by exception type", ['type'])
+db_instruments = metrics.DatabaseInstruments(metrics_registry, errors_total, enabled=METRICS_ENABLED)
+
+# --- 按需剖析和慢查询日志 (profiling.py) ---
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '') # 请求带 X-Profile: <令牌> 头时剖析该请求，为空则不接受该请求头
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0)) # 0..1，随机剖析的请求比例
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILE_CPROFILE = os.environ.get('PROFILE_CPROFILE', 'true').lower() == 'true' # 剖析的请求同时保存 cProfile 数据
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 1.0)) # 超过该秒数的语句写入慢查询日志，0 关闭
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'slow_queries.log'))
+
+def _slow_query_context():
+    return {'endpoint': request.endpoint, 'path': request.path} if has_request_context() else {}
+
+request_profiler = profiling.Profiler(PROFILE_DIR, token=PROFILE_TOKEN, sample_rate=PROFILE_SAMPLE_RATE,
+                                      cprofile=PROFILE_CPROFILE)
+if request_profiler.enabled:
+    db_instruments.add_listener(request_profiler)
+    profiling.instrument_json(app.json)
+slow_query_log = None
+if SLOW_QUERY_SECONDS > 0:
+    slow_query_log = profiling.SlowQueryLog(SLOW_QUERY_LOG, SLOW_QUERY_SECONDS,
+                                            explain=lambda sql, params: query_check.explain(storage_backend, sql, params),
+                                            context=_slow_query_context)
+    db_instruments.add_listener(slow_query_log)
+INSTRUMENT_QUERIES = METRICS_ENABLED or request_profiler.enabled or slow_query_log is not None
+
+db_pool = ConnectionPool(storage_backend.connect, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                         validate_after=DB_POOL_VALIDATE_AFTER,
+                         prepared_statements=DB_PREPARED_STATEMENTS and storage_backend.prepared_statements,
+                         cursor_wrapper=db_instruments.wrap_cursor if INSTRUMENT_QUERIES else None,
+                         on_checkout=db_instruments.observe_checkout if INSTRUMENT_QUERIES else None)
+
+# --- 读写分离 (replicas.py)：只读路由从副本读取，写入仍走主库；客户端写入之后的窗口期内读主库（读自己的写） ---
+# DB_REPLICAS: MySQL 为逗号分隔的 host[:port]，其余连接参数与主库相同；SQLite 为数据库文件路径，只读打开（可以就是 SQLITE_PATH）
+DB_REPLICAS = [address.strip() for address in os.environ.get('DB_REPLICAS', '').split(',') if address.strip()]
+REPLICA_POOL_SIZE = int(os.environ.get('REPLICA_POOL_SIZE', DB_POOL_SIZE)) # 每个副本的最大连接数
+REPLICA_POOL_TIMEOUT = float(os.environ.get('REPLICA_POOL_TIMEOUT', 0.5)) # 副本连接池耗尽时最长等待秒数，超时改读主库
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 30)) # 复制延迟超过该秒数的副本不参与读取
+REPLICA_RETRY_SECONDS = float(os.environ.get('REPLICA_RETRY_SECONDS', 30)) # 副本出错后改读其他副本或主库的秒数
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 1)) # 查询复制延迟的最小间隔秒数
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5)) # 写入后该客户端多少秒内只读主库，应大于正常的复制延迟
+
+read_router = replicas.create_router(
+    [(address, storage.create_replica_backend(DB_BACKEND, DB_CONFIG, SQLITE_PATH, address)) for address in DB_REPLICAS],
+    lambda connect, cursor_wrapper: ConnectionPool(
+        connect, size=REPLICA_POOL_SIZE, timeout=REPLICA_POOL_TIMEOUT, validate_after=DB_POOL_VALIDATE_AFTER,
+        prepared_statements=DB_PREPARED_STATEMENTS and storage_backend.prepared_statements,
+        cursor_wrapper=cursor_wrapper,
+        on_checkout=db_instruments.observe_checkout if INSTRUMENT_QUERIES else None),
+    inner_wrapper=db_instruments.wrap_cursor if INSTRUMENT_QUERIES else None,
+    window=READ_YOUR_WRITES_SECONDS, max_lag=REPLICA_MAX_LAG, retry_after=REPLICA_RETRY_SECONDS,
+    lag_check_interval=REPLICA_LAG_CHECK_INTERVAL)
+db_reads_total = metrics_registry.counter(
+    'db_reads_total', "Connections of read-only routes by database and routing reason", ['target', 'reason'])
+
+# --- 每日时长汇总表 (event_daily_durations)，停止计时时增量更新 ---
+DAILY_ROLLUPS = os.environ.get('DAILY_ROLLUPS', 'true').lower() == 'true'
+
+# --- 日志归档：保留期之前的整月日志压缩成列式文件并移出 event_logs (flask --app app archive-logs) ---
+LOG_ARCHIVE_DIR = os.environ.get('LOG_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+LOG_RETENTION_MONTHS = int(os.environ.get('LOG_RETENTION_MONTHS', 12)) # event_logs 保留的完整月份数（不含当月）
+EVENT_LOGS_LIMIT_MAX = int(os.environ.get('EVENT_LOGS_LIMIT_MAX', 10000))
+event_log_archive = log_archive.LogArchive(LOG_ARCHIVE_DIR)
+
 # --- 数据库连接辅助函数 ---
 def get_db_connection():
-    """获取数据库连接和游标"""
+    """从连接池获取数据库连接，conn.close() 会把连接归还连接池"""
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
+        conn = db_pool.get_connection()
         # print("Database connection successful") # Debug
         return conn
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error connecting to database: {err}")
         # 可以进一步处理错误，比如记录日志或抛出异常
         return None
+    # PoolExhaustedError propagates to the 503 error handler below
 
-# --- 辅助函数：更新统计信息 (No changes needed here based on requests) ---
-def update_event_statistics(cursor, event_id, log_type, log_time):
+def _client_last_write():
+    try:
+        return float(request.cookies[replicas.LAST_WRITE_COOKIE])
+    except (KeyError, ValueError):
+        return None
+
+def get_read_connection():
+    """
+    只读路由的连接：配置了副本时由 read_router 选择副本，客户端刚写入过（窗口期内）或副本都不可用时同 get_db_connection。
+    选中的副本记在 g.read_replica（主库为 None），决定结果能否进入响应缓存。
     """
-    根据日志更新事件统计信息。
+    g.read_replica = None
+    if read_router.enabled:
+        conn, replica, reason = read_router.acquire(_client_last_write())
+        if METRICS_ENABLED:
+            db_reads_total.inc(replica.name if replica else 'primary', reason)
+        if conn:
+            g.read_replica = replica
+            return conn
+    return get_db_connection()
+
+@app.after_request
+def track_client_writes(response):
+    # The cookie carries the write time to this client's next reads, whichever process serves them.
+    # Views commit before returning; write-behind logs commit later, at the time the queue expects.
+    if read_router.enabled:
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            committed_at = g.get('write_committed_at') or time.time()
+            max_age = committed_at - time.time() + READ_YOUR_WRITES_SECONDS
+            response.set_cookie(replicas.LAST_WRITE_COOKIE, f"{committed_at:.3f}",
+                                max_age=max(1, math.ceil(max_age)), httponly=True, samesite='Lax')
+        if 'read_replica' in g:
+            response.headers['X-Read-Source'] = g.read_replica.name if g.read_replica else 'primary'
+    return response
+
+@app.errorhandler(PoolExhaustedError)
+def handle_pool_exhausted(err):
+    print(f"Database pool exhausted: {err}")
+    if METRICS_ENABLED:
+        errors_total.inc(type(err).__name__)
+    response = jsonify({"error": "Database is busy, please retry shortly"})
+    response.headers['Retry-After'] = str(max(1, math.ceil(DB_POOL_TIMEOUT)))
+    return response, 503
+
+@app.before_request
+def start_request_timer():
+    if METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Also runs for responses built by error handlers, including the 500 page of an unhandled exception
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched' # 404s share one label instead of one per URL
+        http_request_seconds.observe(time.perf_counter() - started, endpoint, request.method)
+        http_requests_total.inc(endpoint, request.method, str(response.status_code))
+    return response
+
+@app.teardown_request
+def record_unhandled_error(err):
+    if err is not None and METRICS_ENABLED:
+        errors_total.inc(type(err).__name__)
+
+@app.before_request
+def start_request_profile():
+    if request_profiler.enabled:
+        reason = request_profiler.wanted(request.headers.get('X-Profile'))
+        if reason:
+            request_profiler.begin(request.method, request.full_path.rstrip('?'), reason)
+
+@app.after_request
+def finish_request_profile(response):
+    profile = profiling.current()
+    if profile is not None:
+        response.headers['Server-Timing'] = request_profiler.finish(profile, request.endpoint, response.status_code)
+        response.headers['X-Profile-Id'] = profile.id
+    return response
+
+@app.teardown_request
+def discard_request_profile(err):
+    if request_profiler.enabled:
+        request_profiler.discard()
+
+# --- 响应压缩 (compression.py)：按 Accept-Encoding 返回 br / gzip ---
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024)) # 小于该字节数的响应不压缩，0 关闭
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 5)) # 1-9，越大压缩率越高、越慢
+
+@app.after_request
+def compress_response(response):
+    # Registered after the profiling hook, so it runs first and is timed as a 'compress' span
+    if not compression.compressible(response, COMPRESS_MIN_SIZE):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = compression.choose_encoding(request.accept_encodings)
+    if encoding:
+        with profiling.span('compress'):
+            response.set_data(compression.encode(response.get_data(), encoding, COMPRESS_LEVEL))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def _pool_samples():
+    stats = db_pool.stats()
+    return [((name,), stats[name]) for name in ('size', 'in_use', 'idle', 'open', 'checkouts', 'waits', 'timeouts')]
+
+metrics_registry.gauge_callback('db_pool_connections', "Connection pool state and lifetime totals", _pool_samples, ['state'])
+
+def _replica_samples():
+    samples = []
+    for replica in read_router.stats():
+        samples += [((replica['name'], 'available'), int(replica['available'])),
+                    ((replica['name'], 'failures'), replica['failures']),
+                    ((replica['name'], 'in_use'), replica['pool']['in_use'])]
+        if replica['lag_seconds'] is not None:
+            samples.append(((replica['name'], 'lag_seconds'), replica['lag_seconds']))
+    return samples
+
+if read_router.enabled:
+    metrics_registry.gauge_callback('db_replica', "Read replica availability, replication lag and pool use",
+                                    _replica_samples, ['replica', 'stat'])
+
+# --- 辅助函数：更新统计信息 ---
+class EventStatusConflict(Exception):
+    """开始一个已经在进行中的事件"""
+
+# 开始/停止时的状态转换语句（async_app 的异步版本共用）
+STATS_START_SQL = """
+    UPDATE event_statistics
+    SET last_start_time = %s, event_status = 1
+    WHERE event_id = %s AND COALESCE(event_status, 0) = 0
+"""
+STATS_FIRST_START_SQL = """
+    INSERT INTO event_statistics (event_id, last_start_time, event_status, total_duration_seconds)
+    VALUES (%s, %s, 1, 0)
+"""
+STATS_LOCK_SQL = "SELECT last_start_time, event_status FROM event_statistics WHERE event_id = %s FOR UPDATE"
+# Assignments run left to right: the increment is computed before event_status is reset.
+# Stopping a stopped event only moves last_stop_time (duration increment is 0).
+STATS_STOP_SQL = """
+    UPDATE event_statistics
+    SET total_duration_seconds = COALESCE(total_duration_seconds, 0) +
+            IF(event_status = 1 AND last_start_time IS NOT NULL,
+               GREATEST(0, TIMESTAMPDIFF(MICROSECOND, last_start_time, %s) / 1000000), 0),
+        last_stop_time = %s,
+        event_status = 0
+    WHERE event_id = %s
+"""
+STATS_STOP_WITHOUT_ROW_SQL = """
+    INSERT INTO event_statistics (event_id, last_stop_time, event_status, total_duration_seconds)
+    VALUES (%s, %s, 0, 0)
+    ON DUPLICATE KEY UPDATE
+    last_stop_time = VALUES(last_stop_time), event_status = VALUES(event_status)
+"""
+EVENT_LOCK_FOR_LOG_SQL = """
+    SELECT event_id, event_del_status, responsible_person FROM event_info WHERE event_id = %s LOCK IN SHARE MODE
+"""
+INSERT_LOG_SQL = "INSERT INTO event_logs (event_id, log_type, log_time) VALUES (%s, %s, %s)"
+# Two first starts of one event can deadlock on InnoDB gap locks; the loser's transaction is retried
+LOG_DEADLOCK_RETRIES = int(os.environ.get('LOG_DEADLOCK_RETRIES', 1))
+
+def update_event_statistics(cursor, event_id, log_type, log_time, person=None):
+    """
+    根据日志更新事件统计信息。每个动作是一条带条件的原子语句，时长在 SQL 中累加，
+    是否冲突由影响行数判断，不需要先 SELECT（并发的开始/停止由行锁串行化）。
     log_type: 1 for start, 0 for stop
     log_time: datetime object for the log entry
+    person: 未删除事件的负责人，给出时同时更新负责人汇总表（已删除的事件不计入汇总，传 None）
+    开始一个已在进行中的事件时抛出 EventStatusConflict。
     """
     try:
-        # 使用字典游标获取
-        cursor.execute("SELECT stat_id, last_start_time, total_duration_seconds, event_status FROM event_statistics WHERE event_id = %s", (event_id,))
-        stat_record_dict = cursor.fetchone() # Fetch as dict
-
         if log_type == 1: # 事件开始
-            if stat_record_dict:
-                # 更新现有记录
-                cursor.execute("""
-                    UPDATE event_statistics
-                    SET last_start_time = %s, event_status = 1
-                    WHERE event_id = %s
-                """, (log_time, event_id))
-            else:
-                # 创建新记录
-                cursor.execute("""
-                    INSERT INTO event_statistics (event_id, last_start_time, event_status)
-                    VALUES (%s, %s, 1)
-                """, (event_id, log_time))
+            # Only a stopped event can start; the row lock serialises concurrent starts
+            cursor.execute(STATS_START_SQL, (log_time, event_id))
+            if cursor.rowcount == 0:
+                # Either the event is running or it has never been started
+                try:
+                    cursor.execute(STATS_FIRST_START_SQL, (event_id, log_time))
+                except DB_ERRORS as err:
+                    if not storage.is_duplicate_key(err):
+                        raise
+                    # The row exists and the conditional UPDATE did not match: already running
+                    raise EventStatusConflict(f"Event {event_id} is already running")
+            person_summary.log_delta(cursor, person, 1, 0)
 
         elif log_type == 0: # 事件结束
-            if stat_record_dict:
-                last_start_time = stat_record_dict.get('last_start_time')
-                total_duration_seconds = stat_record_dict.get('total_duration_seconds') # This might be Decimal, int, or None
-                event_status = stat_record_dict.get('event_status')
-
-                duration_increment = Decimal(0) # Initialize as Decimal zero
-                # 只有在事件是 '进行中' 状态且有合法的 'last_start_time' 时才计算增量
-                if event_status == 1 and last_start_time:
-                    # Ensure log_time and last_start_time are datetime objects
-                    # Assuming they are already datetime objects from the call
-                    if isinstance(log_time, datetime) and isinstance(last_start_time, datetime):
-                        time_difference = log_time - last_start_time
-                        # Use Decimal for precision from the start
-                        duration_increment = Decimal(max(0, time_difference.total_seconds()))
-                    else:
-                         print(f"Warning: Invalid datetime types for duration calculation. log_time: {type(log_time)}, last_start_time: {type(last_start_time)}")
-
-                # Ensure both operands are Decimal before adding
-                current_total_decimal = Decimal(total_duration_seconds or 0)
-                new_total_duration = current_total_decimal + duration_increment
-
-
-                cursor.execute("""
-                    UPDATE event_statistics
-                    SET last_stop_time = %s,
-                        total_duration_seconds = %s,
-                        event_status = 0
-                    WHERE event_id = %s
-                """, (log_time, new_total_duration, event_id))
-            else:
+            running = False
+            session = None
+            if DAILY_ROLLUPS or person:
+                # The daily rollup and the person summary need the session start; lock the row so it cannot move under us
+                cursor.execute(STATS_LOCK_SQL, (event_id,))
+                stat_rec = cursor.fetchone()
+                running = bool(stat_rec and stat_rec['event_status'] == 1)
+                if running and stat_rec['last_start_time']:
+                    session = (event_id, stat_rec['last_start_time'], log_time)
+            cursor.execute(STATS_STOP_SQL, (log_time, log_time, event_id))
+            if cursor.rowcount == 0:
                 # If no statistics record exists when stopping, handle appropriately
                 print(f"Warning: Stop log received for event_id {event_id} without a statistics record or prior start.")
-                # Decide policy: create a record with 0 duration or log error?
-                # Creating a record:
-                cursor.execute("""
-                    INSERT INTO event_statistics (event_id, last_stop_time, event_status, total_duration_seconds)
-                    VALUES (%s, %s, 0, 0)
-                    ON DUPLICATE KEY UPDATE
-                    last_stop_time = VALUES(last_stop_time), event_status = VALUES(event_status)
-                """, (event_id, log_time))
+                # Creating a record with zero duration:
+                cursor.execute(STATS_STOP_WITHOUT_ROW_SQL, (event_id, log_time))
+            if session and DAILY_ROLLUPS:
+                rollups.add_sessions(cursor, [session])
+            if running:
+                seconds = max(0.0, (log_time - session[1]).total_seconds()) if session else 0
+                person_summary.log_delta(cursor, person, -1, str(seconds))
 
         return True
-    except mysql.connector.Error as err:
+    except EventStatusConflict:
+        raise
+    except DB_ERRORS as err:
+        if storage.is_deadlock(err):
+            raise # The transaction is gone, the caller retries it from the start
         print(f"Error updating statistics for event {event_id}: {err}")
         return False
     except Exception as e:
         print(f"Unexpected error updating statistics: {e}")
         return False
 
-# --- API Endpoints ---
+# --- 辅助函数：事件列表分页 ---
+ALLOWED_SORT_COLUMNS = {
+    'name': 'e.event_name',
+    'person': 'e.responsible_person',
+    'create_time': 'e.create_time',
+    'update_time': 'e.update_time',
+    'status': 's.event_status',
+    'duration': 's.total_duration_seconds',
+    'relevance': name_search.RELEVANCE_SQL # Only with search_name, default sort while searching
+}
+# Columns that can be NULL (LEFT JOIN or optional field); MySQL sorts NULL first
+NULLABLE_SORT_KEYS = {'person', 'status', 'duration'}
 
-# 1. 获取事件列表 (MODIFIED: Added Pagination, Filtering, Sorting)
-@app.route('/api/events', methods=['GET'])
-def get_events():
+# search_name 走 event_name_grams n-gram 索引筛选候选（设为 false 时退回全表 LIKE 扫描）
+SEARCH_INDEX = os.environ.get('SEARCH_INDEX', 'true').lower() == 'true'
+SUGGEST_LIMIT_MAX = int(os.environ.get('SUGGEST_LIMIT_MAX', 20))
+
+# 列表总数缓存：按筛选条件缓存 COUNT(*)，写操作后清空
+EVENTS_COUNT_CACHE_TTL = float(os.environ.get('EVENTS_COUNT_CACHE_TTL', 10))
+events_count_cache = TTLCache(ttl=EVENTS_COUNT_CACHE_TTL, maxsize=256)
+
+def _build_event_filters(args, conn=None):
+    """
+    根据查询参数生成事件筛选条件 (event_info 别名为 e)，返回 (where_clauses, params)。
+    给出 conn 时名称搜索按片段频率决定是否走 n-gram 索引（见 name_search.search_condition）。
+    """
+    # --- Filtering Parameters ---
+    show_deleted = args.get('show_deleted', 'false').lower() == 'true'
+    search_name = args.get('search_name', None, type=str)
+    search_person = args.get('search_person', None, type=str)
+    search_created_after = args.get('search_created_after', None, type=str)
+    search_created_before = args.get('search_created_before', None, type=str)
+    search_updated_after = args.get('search_updated_after', None, type=str)
+    search_updated_before = args.get('search_updated_before', None, type=str)
+
+    where_clauses = []
+    params = []
+
+    if not show_deleted:
+        where_clauses.append("e.event_del_status = 1")
+
+    if search_name:
+        if SEARCH_INDEX and name_search.index_ready():
+            candidates_sql, candidates_params = name_search.search_condition(search_name, conn)
+            if candidates_sql:
+                where_clauses.append(candidates_sql)
+                params.extend(candidates_params)
+        # Still needed with the index: grams do not know their order
+        where_clauses.append("e.event_name LIKE %s")
+        params.append(f"%{search_name}%")
+    if search_person:
+        # Allows filtering by 'unassigned' or specific person
+        if search_person == '__unassigned__':
+             where_clauses.append("(e.responsible_person IS NULL OR e.responsible_person = '')")
+        else:
+            where_clauses.append("e.responsible_person = %s")
+            params.append(search_person)
+
+    # Add date range filters carefully
+    if search_created_after:
+        where_clauses.append("e.create_time >= %s")
+        params.append(search_created_after)
+    if search_created_before:
+         # Add time component to make it inclusive of the whole day
+        where_clauses.append("e.create_time < DATE_ADD(%s, INTERVAL 1 DAY)")
+        params.append(search_created_before)
+    if search_updated_after:
+        where_clauses.append("e.update_time >= %s")
+        params.append(search_updated_after)
+    if search_updated_before:
+         # Add time component to make it inclusive of the whole day
+        where_clauses.append("e.update_time < DATE_ADD(%s, INTERVAL 1 DAY)")
+        params.append(search_updated_before)
+
+    return where_clauses, params
+
+FILTER_ARGS = ('search_name', 'search_person', 'search_created_after', 'search_created_before',
+               'search_updated_after', 'search_updated_before')
+
+def _filter_signature(args):
+    """
+    筛选参数的短哈希，用作 COUNT 缓存键并绑定到游标上。
+    按参数值而不是生成的 SQL 计算：名称搜索是否走 n-gram 子查询随片段频率变化，不应该让游标失效。
+    """
+    values = [args.get('show_deleted', 'false').lower() == 'true'] + [args.get(name, '') or '' for name in FILTER_ARGS]
+    raw = json.dumps(values, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+def _encode_cursor(sort_by, sort_order, filter_key, value, event_id, direction):
+    """把排序键 + event_id 编码成不透明的游标字符串"""
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    elif isinstance(value, Decimal):
+        value = {"dec": str(value)}
+    payload = {"s": sort_by, "o": sort_order, "f": filter_key, "v": value, "id": event_id, "d": direction}
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(token):
+    """解析游标，格式不正确时返回 None"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        if (data['s'] not in ALLOWED_SORT_COLUMNS or data['o'] not in ('ASC', 'DESC')
+                or data['d'] not in ('next', 'prev') or not isinstance(data['id'], int)):
+            return None
+        _decode_cursor_value(data['v'])
+        return data
+    except (ValueError, KeyError, TypeError, ArithmeticError):
+        return None
+
+def _decode_cursor_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'dec' in value:
+            return Decimal(value['dec'])
+        raise ValueError("Unknown cursor value type")
+    return value
+
+def _keyset_condition(column_sql, nullable, descending, value, event_id, column_params=()):
+    """
+    生成“位于 (value, event_id) 之后”的 WHERE 条件（按扫描方向）。
+    NULL 在 MySQL 中最小：升序时排在最前，降序时排在最后。
+    column_params 是排序表达式自身的参数（relevance），表达式每出现一次都要重复一次。
+    """
+    col = list(column_params)
+    if descending:
+        if value is None:
+            return f"({column_sql} IS NULL AND e.event_id < %s)", col + [event_id]
+        null_tail = f" OR {column_sql} IS NULL" if nullable else ""
+        return (f"({column_sql} < %s OR ({column_sql} = %s AND e.event_id < %s){null_tail})",
+                col + [value] + col + [value, event_id] + (col if nullable else []))
+    if value is None:
+        return f"(({column_sql} IS NULL AND e.event_id > %s) OR {column_sql} IS NOT NULL)", col + [event_id] + col
+    return f"({column_sql} > %s OR ({column_sql} = %s AND e.event_id > %s))", col + [value] + col + [value, event_id]
+
+# --- 响应缓存：按写操作版本号失效，支持 ETag / If-None-Match ---
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 30))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 512))
+response_cache = VersionedResponseCache(ttl=RESPONSE_CACHE_TTL, maxsize=RESPONSE_CACHE_MAX_ENTRIES)
+
+def _events_changed(event_ids=(), membership=False):
+    """
+    写操作提交后调用：增加响应缓存版本号。
+    membership=True 表示事件的增删或筛选字段发生变化，列表总数缓存也要清空。
+    """
+    response_cache.bump(event_ids)
+    read_router.note_write()
+    if membership:
+        events_count_cache.clear()
+
+def cached_response(name, scope_arg=None):
+    """
+    缓存 GET 路由的 200 响应。scope_arg 指定一个路由参数（如 event_id）作为版本作用域，
+    否则使用全局版本号。If-None-Match 命中且本进程还有该版本未过期的缓存条目时返回 304，不访问数据库；
+    条目过期后重新查询，其他进程或命令行的写入最多滞后一个 TTL。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            scope = view_args.get(scope_arg) if scope_arg else None
+            version = response_cache.version(scope)
+            key = (name, scope, tuple(sorted(request.args.items(multi=True))))
+            etag = response_cache.etag(key, version)
+            cached = response_cache.get(key, version)
+
+            if cached is not None and request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                if cached is not None:
+                    body, mimetype = cached
+                    response = app.response_class(body, mimetype=mimetype)
+                else:
+                    response = app.make_response(view(**view_args))
+                    if response.status_code != 200:
+                        return response
+                    if not read_router.is_current(g.get('read_replica')):
+                        # The replica may not have this process's latest write yet: neither cache nor tag it
+                        response.headers['Cache-Control'] = 'no-cache'
+                        return response
+                    response_cache.set(key, version, (response.get_data(), response.mimetype))
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache' # Always revalidate, 304 is cheap
+            return response
+        return wrapper
+    return decorator
+
+# --- 事件变更推送 (SSE) ---
+STREAM_HEARTBEAT = float(os.environ.get('STREAM_HEARTBEAT', 15)) # 心跳间隔秒数
+STREAM_BUFFER_SIZE = int(os.environ.get('STREAM_BUFFER_SIZE', 1000)) # 断线重连可补发的消息条数
+event_broker = EventBroker(buffer_size=STREAM_BUFFER_SIZE, heartbeat=STREAM_HEARTBEAT)
+
+# --- 辅助函数：批量写日志与统计 ---
+BATCH_LOG_MAX_ITEMS = int(os.environ.get('BATCH_LOG_MAX_ITEMS', 5000))
+BATCH_LOG_INSERT_CHUNK = 1000 # Rows per multi-row INSERT, keeps packets under max_allowed_packet
+
+def _lock_stat_states(cursor, event_ids):
+    """一次查询并锁定多个事件的当前状态，返回 {event_id: state}"""
+    states = {}
+    event_ids = sorted(event_ids)
+    if not event_ids:
+        return states
+    placeholders = ", ".join(["%s"] * len(event_ids))
+    cursor.execute(f"""
+        SELECT e.event_id, e.event_del_status, e.responsible_person, s.stat_id,
+               s.last_start_time, s.last_stop_time, s.total_duration_seconds, s.event_status
+        FROM event_info e
+        LEFT JOIN event_statistics s ON e.event_id = s.event_id
+        WHERE e.event_id IN ({placeholders})
+        FOR UPDATE
+    """, tuple(event_ids))
+    for row in cursor.fetchall():
+        row['event_status'] = row['event_status'] or 0
+        row['changed'] = False
+        # Folding logs moves these, the person summary applies the difference (person_summary.state_deltas)
+        row['initial_status'] = row['event_status']
+        row['initial_total'] = row['total_duration_seconds']
+        states[row['event_id']] = row
+    return states
+
+def _insert_event_logs(cursor, log_rows):
+    """多行 INSERT 写入 [(event_id, log_type, log_time), ...]"""
+    for chunk_start in range(0, len(log_rows), BATCH_LOG_INSERT_CHUNK):
+        chunk = log_rows[chunk_start:chunk_start + BATCH_LOG_INSERT_CHUNK]
+        values_sql = ", ".join(["(%s, %s, %s)"] * len(chunk))
+        flat_params = [value for row in chunk for value in row]
+        cursor.execute(f"INSERT INTO event_logs (event_id, log_type, log_time) VALUES {values_sql}",
+                       tuple(flat_params))
+
+def _upsert_event_statistics(cursor, states):
+    """一条多行 upsert 写回多个事件的统计"""
+    if not states:
+        return
+    values_sql = ", ".join(["(%s, %s, %s, %s, %s)"] * len(states))
+    flat_params = []
+    for state in states:
+        flat_params.extend([state['event_id'], state['last_start_time'], state['last_stop_time'],
+                            Decimal(state['total_duration_seconds'] or 0), state['event_status']])
+    cursor.execute(f"""
+        INSERT INTO event_statistics
+            (event_id, last_start_time, last_stop_time, total_duration_seconds, event_status)
+        VALUES {values_sql}
+        ON DUPLICATE KEY UPDATE
+            last_start_time = VALUES(last_start_time),
+            last_stop_time = VALUES(last_stop_time),
+            total_duration_seconds = VALUES(total_duration_seconds),
+            event_status = VALUES(event_status)
+    """, tuple(flat_params))
+
+def _stats_payload(state):
+    """_lock_stat_states 的状态（已折叠新日志）转成返回和推送用的统计字典"""
+    return {
+        "event_id": state['event_id'],
+        "last_start_time": state['last_start_time'].isoformat() if state['last_start_time'] else None,
+        "last_stop_time": state['last_stop_time'].isoformat() if state['last_stop_time'] else None,
+        "total_duration_seconds": float(state['total_duration_seconds'] or 0),
+        "event_status": state['event_status']
+    }
+
+# --- 日志写入模式：sync (默认，逐条提交) / write_behind (队列 + 后台成组提交) ---
+LOG_WRITE_MODE = os.environ.get('LOG_WRITE_MODE', 'sync').lower()
+LOG_QUEUE_MAX_SIZE = int(os.environ.get('LOG_QUEUE_MAX_SIZE', 10000))
+LOG_QUEUE_FLUSH_SIZE = int(os.environ.get('LOG_QUEUE_FLUSH_SIZE', 500)) # 达到这个条数立即提交
+LOG_QUEUE_FLUSH_INTERVAL = float(os.environ.get('LOG_QUEUE_FLUSH_INTERVAL', 0.05)) # 最长攒批秒数
+LOG_QUEUE_PUT_TIMEOUT = float(os.environ.get('LOG_QUEUE_PUT_TIMEOUT', 1)) # 队列满时请求最长等待秒数
+LOG_QUEUE_MAX_RETRIES = int(os.environ.get('LOG_QUEUE_MAX_RETRIES', 5)) # 一批日志写入失败的重试次数，之后移出队列（连不上数据库时一直重试）
+
+def _load_event_log_state(event_id):
+    """write-behind 状态视图未命中时，从数据库读取一个事件的状态"""
     conn = get_db_connection()
     if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True) # 返回字典形式的结果
-
+        raise mysql.connector.errors.InterfaceError("Database connection failed")
+    cursor = conn.cursor(dictionary=True)
     try:
-        # --- Pagination Parameters ---
-        page = request.args.get('page', 1, type=int)
-        limit = request.args.get('limit', 10, type=int) # Default 10 items per page
-        if page < 1: page = 1
-        if limit < 1: limit = 1
-        offset = (page - 1) * limit
-
-        # --- Filtering Parameters ---
-        show_deleted = request.args.get('show_deleted', 'false').lower() == 'true'
-        search_name = request.args.get('search_name', None, type=str)
-        search_person = request.args.get('search_person', None, type=str)
-        search_created_after = request.args.get('search_created_after', None, type=str)
-        search_created_before = request.args.get('search_created_before', None, type=str)
-        search_updated_after = request.args.get('search_updated_after', None, type=str)
-        search_updated_before = request.args.get('search_updated_before', None, type=str)
-
-        # --- Sorting Parameters ---
-        sort_by = request.args.get('sort_by', 'create_time', type=str) # Default sort
-        sort_order = request.args.get('sort_order', 'DESC', type=str).upper()
-
-        # --- Build Query ---
-        base_query = """
+        cursor.execute("""
+            SELECT e.event_id, e.event_del_status,
+                   s.last_start_time, s.last_stop_time, s.total_duration_seconds, s.event_status
             FROM event_info e
             LEFT JOIN event_statistics s ON e.event_id = s.event_id
-        """
-        where_clauses = []
-        params = []
-
-        if not show_deleted:
-            where_clauses.append("e.event_del_status = 1")
-
-        if search_name:
-            where_clauses.append("e.event_name LIKE %s")
-            params.append(f"%{search_name}%")
-        if search_person:
-            # Allows filtering by 'unassigned' or specific person
-            if search_person == '__unassigned__':
-                 where_clauses.append("(e.responsible_person IS NULL OR e.responsible_person = '')")
-            else:
-                where_clauses.append("e.responsible_person = %s")
-                params.append(search_person)
-
-        # Add date range filters carefully
-        if search_created_after:
-            where_clauses.append("e.create_time >= %s")
-            params.append(search_created_after)
-        if search_created_before:
-             # Add time component to make it inclusive of the whole day
-            where_clauses.append("e.create_time < DATE_ADD(%s, INTERVAL 1 DAY)")
-            params.append(search_created_before)
-        if search_updated_after:
-            where_clauses.append("e.update_time >= %s")
-            params.append(search_updated_after)
-        if search_updated_before:
-             # Add time component to make it inclusive of the whole day
-            where_clauses.append("e.update_time < DATE_ADD(%s, INTERVAL 1 DAY)")
-            params.append(search_updated_before)
-
-
-        where_sql = ""
-        if where_clauses:
-            where_sql = " WHERE " + " AND ".join(where_clauses)
-
-        # --- Get Total Count for Pagination ---
-        count_query = f"SELECT COUNT(*) as total {base_query} {where_sql}"
-        cursor.execute(count_query, tuple(params))
-        total_items = cursor.fetchone()['total']
-        total_pages = math.ceil(total_items / limit) if limit > 0 else 0
+            WHERE e.event_id = %s
+        """, (event_id,))
+        state = cursor.fetchone()
+        if state:
+            state['event_status'] = state['event_status'] or 0
+            state['total_duration_seconds'] = state['total_duration_seconds'] or Decimal(0)
+        return state
+    finally:
+        cursor.close()
+        conn.close()
 
-        # --- Build Sorting ---
-        allowed_sort_columns = {
-            'name': 'e.event_name',
-            'person': 'e.responsible_person',
-            'create_time': 'e.create_time',
-            'update_time': 'e.update_time',
-            'status': 's.event_status',
-            'duration': 's.total_duration_seconds'
-        }
-        sort_column_sql = allowed_sort_columns.get(sort_by, 'e.create_time') # Default to create_time if invalid
-        sort_order_sql = "DESC" if sort_order == "DESC" else "ASC" # Sanitize sort order
-        order_by_sql = f" ORDER BY {sort_column_sql} {sort_order_sql}, e.event_id {sort_order_sql}" # Add secondary sort for stability
+def _write_log_group(items):
+    """后台线程：一个事务写入一组排队的日志，数据库状态不允许的条目被丢弃并返回丢弃数"""
+    conn = get_db_connection()
+    if not conn:
+        raise mysql.connector.errors.InterfaceError("Database connection failed")
+    cursor = conn.cursor(dictionary=True)
+    try:
+        states = _lock_stat_states(cursor, {event_id for event_id, _, _ in items})
+        log_rows = []
+        sessions = []
+        for event_id, log_type, log_time in items:
+            state = states.get(event_id)
+            if not state or state['event_del_status'] == 0 or (log_type == 1 and state['event_status'] == 1):
+                print(f"Warning: Dropping queued log for event {event_id} (log_type={log_type}), database state disagrees")
+                continue
+            session = fold_log_into_stats(state, log_type, log_time)
+            if session:
+                sessions.append((event_id, *session))
+            state['changed'] = True
+            log_rows.append((event_id, log_type, log_time))
+        _insert_event_logs(cursor, log_rows)
+        changed = [state for state in states.values() if state['changed']]
+        _upsert_event_statistics(cursor, changed)
+        if DAILY_ROLLUPS:
+            rollups.add_sessions(cursor, sessions)
+        person_summary.apply(cursor, person_summary.state_deltas({}, changed))
+        conn.commit()
+        read_router.note_write() # Replica reads from now on may miss this group, keep them out of the cache
+        dropped = len(items) - len(log_rows)
+        if dropped:
+            _events_changed({event_id for event_id, _, _ in items}) # Overlay was ahead of the database
+            event_broker.publish('reset', {}) # Clients saw the queued status, make them reload
+        return dropped
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
 
+def _log_write_transient(err):
+    """数据库暂时不可用（连接、连接池、死锁），排队的日志继续重试而不是移出队列"""
+    return isinstance(err, PoolExhaustedError) or (isinstance(err, DB_ERRORS) and (
+        storage.is_connection_error(err) or storage.is_deadlock(err)))
+
+def _discard_log_group(items):
+    """后台线程：一组日志重试多次仍然写不进去，已被移出队列"""
+    _events_changed({event_id for event_id, _, _ in items}) # Overlay was ahead of the database
+    event_broker.publish('reset', {}) # Clients saw the queued status, make them reload
+
+def _flush_log_queue():
+    """写路径之前把排队的日志写完；超时（数据库一直写不进去）时抛出 LogQueueFullError，返回 503"""
+    if event_log_queue and not event_log_queue.flush():
+        raise LogQueueFullError("Queued logs were not written within the flush timeout")
+
+event_log_queue = None
+if LOG_WRITE_MODE == 'write_behind':
+    event_log_queue = EventLogQueue(_load_event_log_state, _write_log_group,
+                                    max_size=LOG_QUEUE_MAX_SIZE, flush_size=LOG_QUEUE_FLUSH_SIZE,
+                                    flush_interval=LOG_QUEUE_FLUSH_INTERVAL, put_timeout=LOG_QUEUE_PUT_TIMEOUT,
+                                    max_retries=LOG_QUEUE_MAX_RETRIES, is_transient=_log_write_transient,
+                                    discard_group=_discard_log_group)
+    event_log_queue.start()
+    atexit.register(event_log_queue.stop) # Flush whatever is still queued on shutdown
+    metrics_registry.gauge_callback(
+        'log_queue', "Write-behind log queue depth and totals",
+        lambda: [((name,), value) for name, value in event_log_queue.stats().items()
+                 if name in ('queue_depth', 'in_flight', 'capacity', 'enqueued', 'flushed', 'dropped', 'rejected',
+                             'set_aside')],
+        ['stat'])
+
+@app.errorhandler(LogQueueFullError)
+def handle_log_queue_full(err):
+    print(f"Event log queue full: {err}")
+    if METRICS_ENABLED:
+        errors_total.inc(type(err).__name__)
+    response = jsonify({"error": "Too many pending log writes, please retry shortly"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def _overlay_pending_logs(events):
+    """write-behind 模式下，用还在队列里的状态覆盖查询结果"""
+    if event_log_queue:
+        for event in events:
+            event_log_queue.overlay(event, convert=json_value)
 
-        # --- Get Paginated Data ---
-        data_query = f"""
-            SELECT
-                e.event_id, e.event_name, e.event_desc, e.create_time, e.update_time,
-                e.responsible_person, e.event_del_status, e.event_mark_status,
-                COALESCE(s.event_status, 0) as event_status,
-                COALESCE(s.total_duration_seconds, 0) as total_duration_seconds,
-                s.last_start_time, s.last_stop_time
-            {base_query}
+def _plan_event_list(args, conn=None):
+    """
+    解析事件列表的查询参数，生成要执行的查询。返回 (plan, None)，参数不合法时返回 (None, (错误信息, 状态码))。
+    plan 里 count_query 为 None 表示不需要总数或总数已缓存；COUNT 和数据查询互不依赖，可以并发执行。
+    同步 (get_events) 和异步 (async_app) 两个版本共用，conn 只用于名称搜索读取 n-gram 统计。
+    """
+    # --- Pagination Parameters ---
+    page = args.get('page', 1, type=int)
+    limit = args.get('limit', 10, type=int) # Default 10 items per page
+    if page < 1: page = 1
+    if limit < 1: limit = 1
+    offset = (page - 1) * limit
+
+    # --- Field Projection (fields=a,b,c narrows the SELECT list and the JSON) ---
+    try:
+        projection = parse_fields(args.get('fields', '', type=str))
+    except ValueError as err:
+        return None, (str(err), 400)
+
+    # --- Sorting Parameters ---
+    search_name = args.get('search_name', '', type=str).strip()
+    # Searches default to best match first
+    sort_by = args.get('sort_by', 'relevance' if search_name else 'create_time', type=str)
+    sort_order = args.get('sort_order', 'ASC' if sort_by == 'relevance' else 'DESC', type=str).upper()
+
+    # --- Build Query ---
+    base_query = EVENT_FROM_SQL
+    where_clauses, params = _build_event_filters(args, conn)
+
+    where_sql = ""
+    if where_clauses:
+        where_sql = " WHERE " + " AND ".join(where_clauses)
+
+    # --- Cursor Parameters (a cursor carries its own sort order) ---
+    cursor_token = args.get('cursor', None, type=str)
+    cursor_mode = bool(cursor_token) or args.get('paginate', 'offset').lower() == 'cursor'
+    # Totals are optional: offset mode keeps them by default, cursor mode skips them
+    include_total = args.get('include_total', 'false' if cursor_mode else 'true').lower() == 'true'
+    filter_key = _filter_signature(args)
+
+    cursor_data = None
+    if cursor_token:
+        cursor_data = _decode_cursor(cursor_token)
+        if not cursor_data or cursor_data.get('f') != filter_key:
+            return None, ("Invalid or expired cursor for the current filters", 400)
+        sort_by = cursor_data['s']
+        sort_order = cursor_data['o']
+
+    # --- Build Sorting ---
+    if sort_by not in ALLOWED_SORT_COLUMNS or (sort_by == 'relevance' and not search_name):
+        sort_by = 'create_time' # Default to create_time if invalid
+    sort_column_sql = ALLOWED_SORT_COLUMNS[sort_by]
+    sort_params = name_search.relevance_params(search_name) if sort_by == 'relevance' else []
+    sort_order_sql = "DESC" if sort_order == "DESC" else "ASC" # Sanitize sort order
+
+    plan = {'limit': limit, 'page': page, 'cursor_mode': cursor_mode, 'cursor_data': cursor_data,
+            'sort_by': sort_by, 'sort_order': sort_order_sql, 'filter_key': filter_key,
+            'include_total': include_total, 'total_items': None, 'count_query': None, 'count_params': None,
+            'projection': projection}
+
+    # --- Total Count for Pagination (cached per filter set) ---
+    if include_total:
+        plan['total_items'] = events_count_cache.get(filter_key)
+        if plan['total_items'] is None:
+            plan['count_query'] = f"SELECT COUNT(*) as total {base_query} {where_sql}"
+            plan['count_params'] = tuple(params)
+
+    select_sql = f"""
+        {projection.select_sql},
+            {sort_column_sql} as sort_key
+        {base_query}
+    """
+
+    if cursor_mode:
+        # --- Keyset Pagination ---
+        direction = cursor_data['d'] if cursor_data else 'next'
+        # Walking backwards means scanning in the opposite order, then flipping the page
+        scan_desc = (sort_order_sql == "DESC") != (direction == 'prev')
+        scan_order_sql = "DESC" if scan_desc else "ASC"
+        keyset_clauses = list(where_clauses)
+        keyset_params = list(params)
+        if cursor_data:
+            keyset_sql, keyset_values = _keyset_condition(
+                sort_column_sql, sort_by in NULLABLE_SORT_KEYS, scan_desc,
+                _decode_cursor_value(cursor_data['v']), cursor_data['id'], sort_params)
+            keyset_clauses.append(keyset_sql)
+            keyset_params.extend(keyset_values)
+        keyset_where_sql = " WHERE " + " AND ".join(keyset_clauses) if keyset_clauses else ""
+        plan['direction'] = direction
+        plan['data_query'] = f"""
+            {select_sql}
+            {keyset_where_sql}
+            ORDER BY {sort_column_sql} {scan_order_sql}, e.event_id {scan_order_sql}
+            LIMIT %s
+        """
+        plan['data_params'] = tuple(sort_params + keyset_params + sort_params + [limit + 1])
+    else:
+        # --- Paginated Data ---
+        order_by_sql = f" ORDER BY {sort_column_sql} {sort_order_sql}, e.event_id {sort_order_sql}" # Add secondary sort for stability
+        plan['data_query'] = f"""
+            {select_sql}
             {where_sql}
             {order_by_sql}
             LIMIT %s OFFSET %s
         """
-        data_params = params + [limit, offset]
-        cursor.execute(data_query, tuple(data_params))
-        events = cursor.fetchall()
+        plan['data_params'] = tuple(sort_params + params + sort_params + [limit, offset])
+    return plan, None
+
+def _event_list_body(plan, rows, total_items):
+    """数据查询的结果行 + 总数 -> 事件列表的响应体；总数是刚查出来的时候写入 COUNT 缓存"""
+    limit = plan['limit']
+    if plan['count_query'] and total_items is not None and plan.get('cache_count', True):
+        events_count_cache.set(plan['filter_key'], total_items)
+    total_pages = None
+    if plan['include_total']:
+        total_pages = math.ceil(total_items / limit) if limit > 0 else 0
 
-        # Format datetime and Decimal objects
-        for event in events:
-            for key, value in event.items():
-                if isinstance(value, datetime):
-                    event[key] = value.isoformat()
-                if isinstance(value, Decimal):
-                    event[key] = float(value)
+    if plan['cursor_mode']:
+        cursor_data = plan['cursor_data']
+        direction = plan['direction']
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if direction == 'prev':
+            rows.reverse()
+
+        next_cursor = prev_cursor = None
+        if rows:
+            has_next = has_more if direction == 'next' else True
+            has_prev = (has_more if direction == 'prev' else True) if cursor_data else False
+            # event_id is the first column, the sort key the last
+            if has_next:
+                next_cursor = _encode_cursor(plan['sort_by'], plan['sort_order'], plan['filter_key'],
+                                             rows[-1][-1], rows[-1][0], 'next')
+            if has_prev:
+                prev_cursor = _encode_cursor(plan['sort_by'], plan['sort_order'], plan['filter_key'],
+                                             rows[0][-1], rows[0][0], 'prev')
+        pagination = {
+            "mode": "cursor",
+            "items_per_page": limit,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
+            "total_items": total_items,
+            "total_pages": total_pages
+        }
+    else:
+        pagination = {
+            "total_items": total_items,
+            "total_pages": total_pages,
+            "current_page": plan['page'],
+            "items_per_page": limit
+        }
 
-        return jsonify({
-            "events": events,
-            "pagination": {
-                "total_items": total_items,
-                "total_pages": total_pages,
-                "current_page": page,
-                "items_per_page": limit
-            }
-        })
-    except mysql.connector.Error as err:
+    # Format datetime and Decimal objects (column types are fixed, see event_queries)
+    with profiling.span('serialize'):
+        events = plan['projection'].list_row.many(rows)
+        _overlay_pending_logs(events)
+    return {
+        "events": events,
+        "pagination": pagination
+    }
+
+def _submit_queued_log(event_id, log_type):
+    """
+    write-behind 模式：按内存视图校验后入队并立即确认，返回 (响应体, 状态码)；队列满时抛出 LogQueueFullError。
+    不访问请求上下文，async_app 在线程里调用它。
+    """
+    now = datetime.now()
+    try:
+        status, result = event_log_queue.submit(event_id, log_type, now)
+    except DB_ERRORS as err:
+        print(f"Error loading state for event {event_id}: {err}")
+        return {"error": f"Failed to log action: {err}"}, 500
+    if status != 202:
+        return {"error": result}, status
+    _events_changed([event_id])
+    queued_stats = {
+        "event_id": event_id,
+        "last_start_time": result['last_start_time'].isoformat() if result['last_start_time'] else None,
+        "last_stop_time": result['last_stop_time'].isoformat() if result['last_stop_time'] else None,
+        "total_duration_seconds": float(result['total_duration_seconds'] or 0),
+        "event_status": result['event_status']
+    }
+    event_broker.publish('status', queued_stats)
+    return {
+        "message": f"Event {event_id} {'start' if log_type == 1 else 'stop'} queued",
+        "log_id": None,
+        "log_time": now.isoformat(),
+        "queued": True,
+        "statistics": queued_stats
+    }, 202
+
+# --- API Endpoints ---
+
+# 1. 获取事件列表 (MODIFIED: Added Pagination, Filtering, Sorting)
+@app.route('/api/events', methods=['GET'])
+def get_events():
+    conn = get_read_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor() # Tuple rows, converted by the projection's row converter
+
+    try:
+        plan, error = _plan_event_list(request.args, conn)
+        if error:
+            return jsonify({"error": error[0]}), error[1]
+        plan['cache_count'] = read_router.is_current(g.read_replica) # Counts from a lagging replica stay uncached
+        total_items = plan['total_items']
+        if plan['count_query']:
+            cursor.execute(plan['count_query'], plan['count_params'])
+            total_items = cursor.fetchone()[0]
+        cursor.execute(plan['data_query'], plan['data_params'])
+        rows = cursor.fetchall()
+        return jsonify(_event_list_body(plan, rows, total_items))
+    except DB_ERRORS as err:
         print(f"Error fetching events: {err}")
         return jsonify({"error": f"Failed to fetch events: {err}"}), 500
     except Exception as e:
@@ -266,36 +991,21 @@ def add_event():
             INSERT INTO event_info (event_name, event_desc, responsible_person)
             VALUES (%s, %s, %s)
         """
-        cursor.execute(sql, (
-            data['event_name'],
-            data.get('event_desc'),
-            # Ensure empty string becomes NULL if desired, or handle in DB schema/frontend
-            data.get('responsible_person') if data.get('responsible_person') else None
-        ))
-        conn.commit()
+        # Ensure empty string becomes NULL if desired, or handle in DB schema/frontend
+        person = data.get('responsible_person') if data.get('responsible_person') else None
+        cursor.execute(sql, (data['event_name'], data.get('event_desc'), person))
         new_event_id = cursor.lastrowid
+        name_search.index_event(cursor, new_event_id, data['event_name'], replace=False)
+        if person:
+            person_summary.apply(cursor, {person: (1, 0, 0, Decimal(0))})
+        conn.commit()
+        _events_changed([new_event_id], membership=True)
 
         # Retrieve the newly created event with statistics to return
-        cursor.execute("""
-             SELECT
-                e.event_id, e.event_name, e.event_desc, e.create_time, e.update_time,
-                e.responsible_person, e.event_del_status, e.event_mark_status,
-                COALESCE(s.event_status, 0) as event_status,
-                COALESCE(s.total_duration_seconds, 0) as total_duration_seconds,
-                s.last_start_time, s.last_stop_time
-            FROM event_info e
-            LEFT JOIN event_statistics s ON e.event_id = s.event_id
-            WHERE e.event_id = %s
-        """, (new_event_id,))
-        new_event_dict = cursor.fetchone()
+        new_event_dict = fetch_event(conn, new_event_id)
 
         if new_event_dict:
-             # Format datetime and Decimal
-            for key, value in new_event_dict.items():
-                if isinstance(value, datetime):
-                    new_event_dict[key] = value.isoformat()
-                if isinstance(value, Decimal):
-                    new_event_dict[key] = float(value)
+            event_broker.publish('created', new_event_dict)
             return jsonify(new_event_dict), 201
         else:
             # This case should ideally not happen if insert succeeded
@@ -303,7 +1013,7 @@ def add_event():
              return jsonify({"message": "Event created, but failed to retrieve details.", "event_id": new_event_id}), 201
 
 
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         conn.rollback()
         print(f"Error adding event: {err}")
         # Check for specific errors like duplicate entry if needed
@@ -337,12 +1047,14 @@ def update_event(event_id):
         fields_to_update.append("responsible_person = %s")
         # Allow setting person to empty/null
         params.append(data.get('responsible_person') if data.get('responsible_person') else None)
+        new_person = params[-1]
     if 'event_mark_status' in data:
         fields_to_update.append("event_mark_status = %s")
         params.append(int(data['event_mark_status']))
     if 'event_del_status' in data:
         fields_to_update.append("event_del_status = %s")
         params.append(int(data['event_del_status']))
+        new_del_status = params[-1]
 
     if not fields_to_update:
         return jsonify({"message": "No valid fields provided for update"}), 400
@@ -354,9 +1066,24 @@ def update_event(event_id):
     params.append(event_id)
 
     try:
+        # Reassigning, deleting or restoring moves the event between person summary rows
+        before = None
+        if 'responsible_person' in data or 'event_del_status' in data:
+            before = person_summary.snapshot(cursor, [event_id]).get(event_id)
         cursor.execute(sql, tuple(params))
+        updated_rows = cursor.rowcount
+        if updated_rows and 'event_name' in data:
+            name_search.index_event(cursor, event_id, data['event_name'])
+        if updated_rows and before:
+            person, del_status, event_status, total = before
+            after = (new_person if 'responsible_person' in data else person,
+                     new_del_status if 'event_del_status' in data else del_status, event_status, total)
+            person_summary.apply(cursor, person_summary.diff({}, before, after))
         conn.commit()
-        if cursor.rowcount == 0:
+        _events_changed([event_id], membership=True)
+        if event_log_queue and 'event_del_status' in data:
+            event_log_queue.invalidate([event_id])
+        if updated_rows == 0:
             # Check if the event actually exists before saying "not found"
             cursor.execute("SELECT event_id FROM event_info WHERE event_id = %s", (event_id,))
             if not cursor.fetchone():
@@ -366,31 +1093,15 @@ def update_event(event_id):
                  return jsonify({"message": "No changes detected"}), 200 # Or return updated data anyway
 
         # Return updated event info
-        cursor.execute("""
-             SELECT
-                e.event_id, e.event_name, e.event_desc, e.create_time, e.update_time,
-                e.responsible_person, e.event_del_status, e.event_mark_status,
-                COALESCE(s.event_status, 0) as event_status,
-                COALESCE(s.total_duration_seconds, 0) as total_duration_seconds,
-                s.last_start_time, s.last_stop_time
-            FROM event_info e
-            LEFT JOIN event_statistics s ON e.event_id = s.event_id
-            WHERE e.event_id = %s
-        """, (event_id,))
-        updated_event_dict = cursor.fetchone()
+        updated_event_dict = fetch_event(conn, event_id)
         if updated_event_dict:
-             # Format datetime and Decimal
-            for key, value in updated_event_dict.items():
-                if isinstance(value, datetime):
-                    updated_event_dict[key] = value.isoformat()
-                if isinstance(value, Decimal):
-                    updated_event_dict[key] = float(value)
+            event_broker.publish('updated', updated_event_dict)
             return jsonify(updated_event_dict)
         else:
              # Should not happen if update was successful
              return jsonify({"error": "Failed to retrieve updated event after update"}), 500
 
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         conn.rollback()
         print(f"Error updating event {event_id}: {err}")
         return jsonify({"error": f"Failed to update event: {err}"}), 500
@@ -401,6 +1112,7 @@ def update_event(event_id):
 # 4. 删除事件 (软删除) (No changes needed based on requests)
 @app.route('/api/events/<int:event_id>', methods=['DELETE'])
 def delete_event(event_id):
+    _flush_log_queue() # Queued starts/stops must land before checking running status
     conn = get_db_connection()
     if not conn: return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor(dictionary=True) # Use dictionary cursor
@@ -416,11 +1128,15 @@ def delete_event(event_id):
 
 
         # Soft delete
+        before = person_summary.snapshot(cursor, [event_id]).get(event_id)
         sql = "UPDATE event_info SET event_del_status = 0 WHERE event_id = %s"
         cursor.execute(sql, (event_id,))
+        if before:
+            # The stop below only moves the statistics row, a deleted event no longer counts for its person
+            person_summary.apply(cursor, person_summary.diff({}, before, (before[0], 0, 0, 0)))
 
         # If event was running, stop it
-        cursor.execute("SELECT event_status FROM event_statistics WHERE event_id = %s", (event_id,))
+        cursor.execute("SELECT event_status FROM event_statistics WHERE event_id = %s FOR UPDATE", (event_id,))
         stat_rec = cursor.fetchone()
         if stat_rec and stat_rec['event_status'] == 1:
              now = datetime.now()
@@ -432,9 +1148,13 @@ def delete_event(event_id):
                   return jsonify({"error": "Failed to stop running event during deletion"}), 500
 
         conn.commit()
+        _events_changed([event_id], membership=True)
+        if event_log_queue:
+            event_log_queue.invalidate([event_id])
+        event_broker.publish('deleted', {"event_id": event_id, "event_del_status": 0, "event_status": 0})
         return jsonify({"message": f"Event {event_id} marked as deleted"}), 200
 
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         conn.rollback()
         print(f"Error deleting event {event_id}: {err}")
         return jsonify({"error": f"Failed to delete event: {err}"}), 500
@@ -442,6 +1162,44 @@ def delete_event(event_id):
         cursor.close()
         conn.close()
 
+def _log_event_transaction(conn, cursor, event_id, log_type):
+    """记录一条开始/结束日志的事务，返回 (响应体, 状态码)；死锁时数据库异常原样抛出，由调用方重试"""
+    # Check event exists and is not deleted; the shared lock keeps a concurrent delete out
+    cursor.execute(EVENT_LOCK_FOR_LOG_SQL, (event_id,))
+    event_info_rec = cursor.fetchone()
+    if not event_info_rec:
+        conn.rollback()
+        return {"error": "Event not found"}, 404
+    if event_info_rec['event_del_status'] == 0:
+        conn.rollback()
+        return {"error": "Cannot log action for a deleted event"}, 400
+
+    # Perform logging and update
+    now = datetime.now()
+    # 1. Atomic status transition; starting a running event is rejected by the statement itself.
+    #    Stopping an already stopped event is allowed (idempotent).
+    try:
+        updated = update_event_statistics(cursor, event_id, log_type, now, event_info_rec['responsible_person'])
+    except EventStatusConflict:
+        conn.rollback()
+        return {"error": "Event is already running"}, 409 # Conflict
+    if not updated:
+        conn.rollback()
+        return {"error": "Failed to update event statistics"}, 500
+
+    # 2. Insert log record (same transaction, after the transition won the row lock)
+    cursor.execute(INSERT_LOG_SQL, (event_id, log_type, now))
+    log_id = cursor.lastrowid
+
+    conn.commit()
+    _events_changed([event_id])
+    return {
+        "message": f"Event {event_id} {'started' if log_type == 1 else 'stopped'} successfully",
+        "log_id": log_id,
+        "log_time": now.isoformat(),
+        "statistics": None
+    }, 200
+
 # 5. 记录事件日志 (开始/结束) 并更新统计 (No changes needed based on requests)
 @app.route('/api/events/<int:event_id>/log', methods=['POST'])
 def log_event_action(event_id):
@@ -451,73 +1209,35 @@ def log_event_action(event_id):
     if log_type not in [0, 1]:
         return jsonify({"error": "Invalid log_type. Use 1 for start, 0 for stop."}), 400
 
+    if event_log_queue:
+        # Write-behind mode: validate against the in-memory view, queue and acknowledge
+        body, status = _submit_queued_log(event_id, log_type)
+        if status == 202:
+            g.write_committed_at = time.time() + event_log_queue.commit_delay() # Read-your-writes starts at the commit
+        return jsonify(body), status
+
     conn = get_db_connection()
     if not conn: return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor(dictionary=True) # Use dictionary cursor
 
     try:
-        # Check event exists and is not deleted
-        cursor.execute("SELECT event_id, event_del_status FROM event_info WHERE event_id = %s", (event_id,))
-        event_info_rec = cursor.fetchone()
-        if not event_info_rec:
-            conn.close() # Close connection before returning
-            return jsonify({"error": "Event not found"}), 404
-        if event_info_rec['event_del_status'] == 0:
-            conn.close()
-            return jsonify({"error": "Cannot log action for a deleted event"}), 400
-
-        # Check current status to prevent conflicts
-        cursor.execute("SELECT event_status FROM event_statistics WHERE event_id = %s", (event_id,))
-        stat_rec = cursor.fetchone()
-        current_status = stat_rec['event_status'] if stat_rec else 0 # Assume stopped if no record
-
-        if log_type == 1 and current_status == 1:
-            conn.close()
-            return jsonify({"error": "Event is already running"}), 409 # Conflict
-        if log_type == 0 and current_status == 0:
-            # Check if it ever started - consult last_start_time?
-            # For simplicity, allow stopping an already stopped event (idempotent),
-            # or return conflict. Let's allow it for now.
-            # return jsonify({"error": "Event is already stopped"}), 409 # Conflict
-            pass # Allow stopping again, update_statistics handles this
-
-        # Perform logging and update
-        now = datetime.now()
-        # 1. Insert log record
-        cursor.execute("INSERT INTO event_logs (event_id, log_type, log_time) VALUES (%s, %s, %s)",
-                       (event_id, log_type, now))
-        log_id = cursor.lastrowid
-
-        # 2. Update statistics (function now needs dictionary cursor)
-        if not update_event_statistics(cursor, event_id, log_type, now):
-             conn.rollback()
-             conn.close()
-             return jsonify({"error": "Failed to update event statistics"}), 500
-
-        conn.commit()
-
-        # Return updated statistics
-        cursor.execute("""
-            SELECT event_id, last_start_time, last_stop_time, total_duration_seconds, event_status
-            FROM event_statistics WHERE event_id = %s
-        """, (event_id,))
-        updated_stats = cursor.fetchone()
-        if updated_stats:
-            # Format datetime and Decimal
-            for key, value in updated_stats.items():
-                if isinstance(value, datetime):
-                    updated_stats[key] = value.isoformat()
-                if isinstance(value, Decimal):
-                    updated_stats[key] = float(value)
-
-        return jsonify({
-            "message": f"Event {event_id} {'started' if log_type == 1 else 'stopped'} successfully",
-            "log_id": log_id,
-            "log_time": now.isoformat(),
-            "statistics": updated_stats
-        }), 200
-
-    except mysql.connector.Error as err:
+        for attempt in range(LOG_DEADLOCK_RETRIES + 1):
+            try:
+                body, status = _log_event_transaction(conn, cursor, event_id, log_type)
+                break
+            except DB_ERRORS as err:
+                if not storage.is_deadlock(err) or attempt == LOG_DEADLOCK_RETRIES:
+                    raise
+                conn.rollback()
+                print(f"Warning: Deadlock logging action for event {event_id}, retrying: {err}")
+        if status == 200:
+            # Return updated statistics
+            body['statistics'] = fetch_event_stats(conn, event_id)
+            if body['statistics']:
+                event_broker.publish('status', body['statistics'])
+        return jsonify(body), status
+
+    except DB_ERRORS as err:
         conn.rollback()
         print(f"Error logging action for event {event_id}: {err}")
         return jsonify({"error": f"Failed to log action: {err}"}), 500
@@ -526,122 +1246,74 @@ def log_event_action(event_id):
         print(f"Unexpected error logging action: {e}")
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
     finally:
-        if conn and conn.is_connected(): # Check if connection is still valid
-             if cursor: cursor.close()
-             conn.close()
+        cursor.close()
+        conn.close() # Back to the pool even when dropped, release() discards broken connections
 
 
 # 6. 获取 Dashboard 数据 (No changes needed based on requests)
 @app.route('/api/dashboard', methods=['GET'])
+@cached_response('dashboard')
 def get_dashboard_data():
-    conn = get_db_connection()
+    try:
+        projection = parse_fields(request.args.get('fields', '', type=str))
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    conn = get_read_connection()
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True)
     try:
-        # 查询标记且未删除的事件
-        query = """
-            SELECT
-                e.event_id, e.event_name, e.event_desc, e.create_time, e.update_time,
-                e.responsible_person, e.event_del_status, e.event_mark_status,
-                COALESCE(s.event_status, 0) as event_status,
-                COALESCE(s.total_duration_seconds, 0) as total_duration_seconds,
-                s.last_start_time, s.last_stop_time
-            FROM event_info e
-            LEFT JOIN event_statistics s ON e.event_id = s.event_id
-            WHERE e.event_mark_status = 1 AND e.event_del_status = 1
-            -- *** MODIFIED ORDER BY CLAUSE ***
-            -- Change from: ORDER BY s.event_status DESC, e.create_time ASC
-            -- Change to (for example, sort purely by creation time):
-            ORDER BY e.create_time ASC
-            -- Or, if you want running ones grouped but stable within groups:
-            -- ORDER BY s.event_status DESC, e.create_time ASC
-            -- Let's use create_time ASC for stability as requested
-        """
-        # --- Choose ONE of the ORDER BY options above ---
-        # --- Let's proceed with `ORDER BY e.create_time ASC` for stable order ---
-        final_query = query.replace("ORDER BY s.event_status DESC, e.create_time ASC", "ORDER BY e.create_time ASC") # Make sure to use the chosen order
-
-        cursor.execute(final_query) # Execute the modified query
-        dashboard_events = cursor.fetchall()
-        # Format datetime and Decimal
-        for event in dashboard_events:
-            for key, value in event.items():
-                if isinstance(value, datetime):
-                    event[key] = value.isoformat()
-                if isinstance(value, Decimal):
-                    event[key] = float(value)
+        # 查询标记且未删除的事件，按创建时间升序保持顺序稳定
+        dashboard_events = fetch_dashboard_events(conn, projection)
+        _overlay_pending_logs(dashboard_events)
         return jsonify(dashboard_events)
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error fetching dashboard data: {err}")
         return jsonify({"error": f"Failed to fetch dashboard data: {err}"}), 500
     finally:
-        if cursor: cursor.close()
         if conn: conn.close()
 
 # 7. 获取单个事件详情 (No changes needed based on requests)
 @app.route('/api/events/<int:event_id>', methods=['GET'])
+@cached_response('event_details', scope_arg='event_id')
 def get_event_details(event_id):
     # This endpoint might be implicitly used by edit functionality, ensure it's working
-    conn = get_db_connection()
+    conn = get_read_connection()
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True)
     try:
-        query = """
-            SELECT
-                e.event_id, e.event_name, e.event_desc, e.create_time, e.update_time,
-                e.responsible_person, e.event_del_status, e.event_mark_status,
-                COALESCE(s.event_status, 0) as event_status,
-                COALESCE(s.total_duration_seconds, 0) as total_duration_seconds,
-                s.last_start_time, s.last_stop_time
-            FROM event_info e
-            LEFT JOIN event_statistics s ON e.event_id = s.event_id
-            WHERE e.event_id = %s
-        """
-        cursor.execute(query, (event_id,))
-        event = cursor.fetchone()
+        event = fetch_event(conn, event_id)
 
         if not event:
             return jsonify({"error": "Event not found"}), 404
-
-        # Format datetime and Decimal
-        for key, value in event.items():
-            if isinstance(value, datetime):
-                event[key] = value.isoformat()
-            if isinstance(value, Decimal):
-                event[key] = float(value)
+        _overlay_pending_logs([event])
 
         return jsonify(event)
 
-    except mysql.connector.Error as err:
+    except DB_ERRORS as err:
         print(f"Error fetching event details for {event_id}: {err}")
         return jsonify({"error": f"Failed to fetch event details: {err}"}), 500
     except Exception as e:
          print(f"Unexpected error fetching event details {event_id}: {e}")
          return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
     finally:
-        if cursor: cursor.close()
         if conn: conn.close()
 
 # 8. NEW: Get Distinct Responsible Persons
+# 读负责人汇总表 (person_summary.py)，不扫描 event_info；with_stats=true 时返回每个负责人的事件数、进行中数和累计时长
 @app.route('/api/persons', methods=['GET'])
+@cached_response('persons')
 def get_responsible_persons():
-    conn = get_db_connection()
+    with_stats = request.args.get('with_stats', 'false').lower() == 'true'
+    conn = get_read_connection()
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor() # No dictionary needed, just fetching one column
+    cursor = conn.cursor() # No dictionary needed, rows are unpacked positionally
     try:
-        query = """
-            SELECT DISTINCT responsible_person
-            FROM event_info
-            WHERE responsible_person IS NOT NULL AND responsible_person != ''
-            ORDER BY responsible_person ASC
-        """
-        cursor.execute(query)
-        persons = [row[0] for row in cursor.fetchall()]
-        return jsonify(persons)
-    except mysql.connector.Error as err:
+        rows = person_summary.fetch(cursor)
+        if with_stats:
+            return jsonify([person_summary.as_dict(row) for row in rows])
+        return jsonify([row[0] for row in rows])
+    except DB_ERRORS as err:
         print(f"Error fetching responsible persons: {err}")
         return jsonify({"error": f"Failed to fetch persons: {err}"}), 500
     finally:
@@ -649,6 +1321,907 @@ def get_responsible_persons():
         if conn: conn.close()
 
 
+# 9. 连接池统计
+@app.route('/api/db/pool', methods=['GET'])
+def get_pool_stats():
+    stats = db_pool.stats()
+    if read_router.enabled:
+        stats['replicas'] = read_router.stats()
+    return jsonify(stats)
+
+
+# 10. 批量记录事件日志 (开始/结束)，一个事务内完成
+@app.route('/api/events/logs/batch', methods=['POST'])
+def log_event_actions_batch():
+    data = request.get_json(silent=True)
+    atomic = False
+    if isinstance(data, dict):
+        atomic = bool(data.get('atomic', False)) # Reject the whole batch if any item fails
+        data = data.get('logs')
+    if not isinstance(data, list) or not data:
+        return jsonify({"error": "Expected a non-empty array of {event_id, log_type, log_time}"}), 400
+    if len(data) > BATCH_LOG_MAX_ITEMS:
+        return jsonify({"error": f"Too many items in one batch (max {BATCH_LOG_MAX_ITEMS})"}), 413
+
+    now = datetime.now()
+    archived_before = event_log_archive.archived_before()
+    results = []
+    parsed = [] # (index, event_id, log_type, log_time) for items that passed shape validation
+
+    # --- 1. Validate item shape ---
+    for index, item in enumerate(data):
+        result = {"index": index, "event_id": None, "log_type": None}
+        results.append(result)
+        if not isinstance(item, dict):
+            result.update(status=400, error="Item must be an object")
+            continue
+        event_id = item.get('event_id')
+        log_type = item.get('log_type')
+        result.update(event_id=event_id, log_type=log_type)
+        if not isinstance(event_id, int) or isinstance(event_id, bool):
+            result.update(status=400, error="Invalid event_id")
+            continue
+        if log_type not in [0, 1] or isinstance(log_type, bool):
+            result.update(status=400, error="Invalid log_type. Use 1 for start, 0 for stop.")
+            continue
+        log_time = now
+        if item.get('log_time'):
+            try:
+                log_time = datetime.fromisoformat(str(item['log_time']))
+            except ValueError:
+                result.update(status=400, error="Invalid log_time, expected ISO 8601")
+                continue
+            if log_time.tzinfo is not None:
+                # Stored times are naive local time, like datetime.now() in log_event_action
+                log_time = log_time.astimezone().replace(tzinfo=None)
+            if archived_before and log_time < archived_before:
+                result.update(status=400, error="log_time falls in an archived month")
+                continue
+        parsed.append((index, event_id, log_type, log_time))
+
+    if atomic and len(parsed) != len(data):
+        return jsonify({"error": "Batch rejected", "results": results}), 400
+
+    _flush_log_queue() # Apply on top of anything still queued
+
+    conn = get_db_connection()
+    if not conn: return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        # --- 2. Load (and lock) the current state of every referenced event at once ---
+        states = _lock_stat_states(cursor, {event_id for _, event_id, _, _ in parsed})
+
+        # --- 3. Apply transitions in order, folding statistics in memory ---
+        log_rows = []
+        sessions = [] # Completed (event_id, start, stop) sessions for the daily rollups
+        for index, event_id, log_type, log_time in parsed:
+            result = results[index]
+            state = states.get(event_id)
+            if not state:
+                result.update(status=404, error="Event not found")
+                continue
+            if state['event_del_status'] == 0:
+                result.update(status=400, error="Cannot log action for a deleted event")
+                continue
+            if log_type == 1 and state['event_status'] == 1:
+                result.update(status=409, error="Event is already running")
+                continue
+            # Stopping an already stopped event is allowed, same as the single-item endpoint
+            session = fold_log_into_stats(state, log_type, log_time)
+            if session:
+                sessions.append((event_id, *session))
+            state['changed'] = True
+            log_rows.append((event_id, log_type, log_time))
+            result.update(status=200, log_time=log_time.isoformat())
+
+        if atomic and len(log_rows) != len(data):
+            conn.rollback()
+            for result in results:
+                if result.get('status') == 200:
+                    result.update(status=409, error="Not applied: batch rejected")
+                    result.pop('log_time', None)
+            return jsonify({"error": "Batch rejected", "results": results}), 409
+
+        # --- 4. Multi-row insert of the accepted logs ---
+        _insert_event_logs(cursor, log_rows)
+
+        # --- 5. One statistics write per touched event (single upsert statement) ---
+        changed = [state for state in states.values() if state['changed']]
+        _upsert_event_statistics(cursor, changed)
+        if DAILY_ROLLUPS:
+            rollups.add_sessions(cursor, sessions)
+        person_summary.apply(cursor, person_summary.state_deltas({}, changed))
+
+        conn.commit()
+        _events_changed([state['event_id'] for state in changed])
+        if event_log_queue:
+            event_log_queue.invalidate([state['event_id'] for state in changed])
+        if any(isinstance(item, dict) and item.get('log_time') for item in data):
+            analytics_closed_cache.clear() # Explicit times can land in windows that were already final
+
+        statistics = {}
+        for state in changed:
+            statistics[state['event_id']] = _stats_payload(state)
+            event_broker.publish('status', statistics[state['event_id']])
+
+        return jsonify({
+            "accepted": len(log_rows),
+            "rejected": len(data) - len(log_rows),
+            "results": results,
+            "statistics": statistics
+        }), 200
+
+    except DB_ERRORS as err:
+        conn.rollback()
+        print(f"Error logging batch actions: {err}")
+        return jsonify({"error": f"Failed to log batch actions: {err}"}), 500
+    except Exception as e:
+        conn.rollback()
+        print(f"Unexpected error logging batch actions: {e}")
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# 11. write-behind 日志队列指标
+@app.route('/api/ingest/stats', methods=['GET'])
+def get_ingest_stats():
+    if not event_log_queue:
+        return jsonify({"mode": LOG_WRITE_MODE})
+    return jsonify({"mode": LOG_WRITE_MODE, **event_log_queue.stats()})
+
+
+# 12. 事件变更推送 (Server-Sent Events)
+@app.route('/api/stream', methods=['GET'])
+def stream_event_changes():
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    response = Response(stream_with_context(event_broker.subscribe(last_event_id)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Keep reverse proxies from buffering the stream
+    return response
+
+
+# 13. 时长报表 (基于每日汇总表)
+REPORT_GROUPS = {
+    'event': {
+        'select': "r.event_id, e.event_name, e.responsible_person",
+        'group_by': "r.event_id, e.event_name, e.responsible_person",
+        'extra': "COUNT(*) AS active_days",
+        'order_by': "total_duration_seconds DESC, r.event_id ASC"
+    },
+    'person': {
+        'select': "COALESCE(e.responsible_person, '') AS responsible_person",
+        'group_by': "COALESCE(e.responsible_person, '')",
+        'extra': "COUNT(DISTINCT r.event_id) AS event_count",
+        'order_by': "total_duration_seconds DESC, responsible_person ASC"
+    },
+    'day': {
+        'select': "r.day",
+        'group_by': "r.day",
+        'extra': "COUNT(DISTINCT r.event_id) AS event_count",
+        'order_by': "r.day ASC"
+    }
+}
+
+def _report_group_key(group_by, event_id, responsible_person, day):
+    if group_by == 'event':
+        return event_id
+    if group_by == 'person':
+        return responsible_person or ''
+    return day
+
+@app.route('/api/reports/durations', methods=['GET'])
+def get_duration_report():
+    group_by = request.args.get('group_by', 'event', type=str)
+    if group_by not in REPORT_GROUPS:
+        return jsonify({"error": "group_by must be one of: event, person, day"}), 400
+    try:
+        date_to = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+        date_from = date.fromisoformat(request.args['from']) if request.args.get('from') else date_to - timedelta(days=6)
+    except ValueError:
+        return jsonify({"error": "from/to must be dates in YYYY-MM-DD format"}), 400
+    if date_from > date_to:
+        return jsonify({"error": "from must not be after to"}), 400
+    event_id = request.args.get('event_id', None, type=int)
+    person = request.args.get('person', None, type=str)
+    include_deleted = request.args.get('include_deleted', 'false').lower() == 'true'
+    include_running = request.args.get('include_running', 'true').lower() == 'true'
+
+    where_clauses = []
+    params = []
+    if not include_deleted:
+        where_clauses.append("e.event_del_status = 1")
+    if event_id is not None:
+        where_clauses.append("e.event_id = %s")
+        params.append(event_id)
+    if person:
+        where_clauses.append("e.responsible_person = %s")
+        params.append(person)
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor(dictionary=True)
+    try:
+        group = REPORT_GROUPS[group_by]
+        filter_sql = "".join(f" AND {clause}" for clause in where_clauses)
+        cursor.execute(f"""
+            SELECT {group['select']},
+                   SUM(r.duration_seconds) AS total_duration_seconds,
+                   {group['extra']}
+            FROM event_daily_durations r
+            JOIN event_info e ON e.event_id = r.event_id
+            WHERE r.day BETWEEN %s AND %s {filter_sql}
+            GROUP BY {group['group_by']}
+            ORDER BY {group['order_by']}
+        """, tuple([date_from, date_to] + params))
+        rows = cursor.fetchall()
+        by_key = {}
+        for row in rows:
+            # SQLite returns SUM() as a float, keep Decimal arithmetic on both backends
+            row['total_duration_seconds'] = Decimal(str(row['total_duration_seconds'] or 0))
+            by_key[_report_group_key(group_by, row.get('event_id'), row.get('responsible_person'), row.get('day'))] = row
+
+        if include_running:
+            # Open sessions are not in the rollups yet: add their elapsed time per day, and the days and events
+            # the rollup rows above did not count already (rolled_day lists the event's rollup days in the range)
+            now = datetime.now()
+            cursor.execute(f"""
+                SELECT e.event_id, e.event_name, e.responsible_person, s.last_start_time, r.day AS rolled_day
+                FROM event_statistics s
+                JOIN event_info e ON e.event_id = s.event_id
+                LEFT JOIN event_daily_durations r ON r.event_id = s.event_id AND r.day BETWEEN %s AND %s
+                WHERE s.event_status = 1 AND s.last_start_time IS NOT NULL
+                      AND s.last_start_time < %s {filter_sql}
+            """, tuple([date_from, date_to, datetime.combine(date_to + timedelta(days=1), datetime.min.time())] + params))
+            running_events = {}
+            for running in cursor.fetchall():
+                rolled_days = running_events.setdefault(running['event_id'], (running, set()))[1]
+                if running['rolled_day'] is not None:
+                    rolled_days.add(running['rolled_day'])
+            for running, rolled_days in running_events.values():
+                counted = bool(rolled_days) # Already in its person's event_count
+                for day, seconds in rollups.split_session(running['last_start_time'], now):
+                    if not date_from <= day <= date_to:
+                        continue
+                    key = _report_group_key(group_by, running['event_id'], running['responsible_person'], day)
+                    row = by_key.get(key)
+                    if row is None:
+                        row = {'total_duration_seconds': Decimal(0)}
+                        if group_by == 'event':
+                            row.update(event_id=running['event_id'], event_name=running['event_name'],
+                                       responsible_person=running['responsible_person'], active_days=0)
+                        elif group_by == 'person':
+                            row.update(responsible_person=key, event_count=0)
+                        else:
+                            row.update(day=day, event_count=0)
+                        by_key[key] = row
+                        rows.append(row)
+                    row['total_duration_seconds'] += seconds
+                    if group_by == 'person':
+                        if not counted:
+                            row['event_count'] += 1
+                            counted = True
+                    elif day not in rolled_days:
+                        row['active_days' if group_by == 'event' else 'event_count'] += 1
+            if group_by == 'day':
+                rows.sort(key=lambda row: row['day'])
+            else:
+                # Same order as the SQL: total descending, then the group key
+                rows.sort(key=lambda row: (-row['total_duration_seconds'], _report_group_key(
+                    group_by, row.get('event_id'), row.get('responsible_person'), row.get('day'))))
+
+        total = sum((row['total_duration_seconds'] for row in rows), Decimal(0))
+        for row in rows:
+            for key, value in row.items():
+                if isinstance(value, (date, datetime)):
+                    row[key] = value.isoformat()
+                if isinstance(value, Decimal):
+                    row[key] = float(value)
+
+        return jsonify({
+            "from": date_from.isoformat(),
+            "to": date_to.isoformat(),
+            "group_by": group_by,
+            "total_duration_seconds": float(total),
+            "rows": rows
+        })
+    except DB_ERRORS as err:
+        print(f"Error building duration report: {err}")
+        return jsonify({"error": f"Failed to build duration report: {err}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# 14. 流式导出 (CSV / NDJSON)，非缓冲游标逐批读取，内存占用与导出行数无关
+EXPORT_FETCH_SIZE = int(os.environ.get('EXPORT_FETCH_SIZE', 1000)) # 每批从游标读取的行数
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8'
+}
+
+def _parse_export_time(value, end=False):
+    """解析 from/to 参数：支持 YYYY-MM-DD 或 ISO 时间；只给日期的 to 包含当天整天"""
+    if not value:
+        return None
+    if len(value) == 10:
+        day = date.fromisoformat(value)
+        return datetime.combine(day + timedelta(days=1) if end else day, datetime.min.time())
+    return datetime.fromisoformat(value)
+
+def _export_response(name, query, params):
+    fmt = request.args.get('format', 'csv', type=str).lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be one of: csv, ndjson"}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(query, tuple(params))
+    except DB_ERRORS as err:
+        print(f"Error exporting {name}: {err}")
+        conn.discard()
+        return jsonify({"error": f"Failed to export {name}: {err}"}), 500
+
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    chunks, release = stream_rows(conn, cursor, fmt, EXPORT_FETCH_SIZE)
+    response = Response(chunks, mimetype=EXPORT_FORMATS[fmt])
+    response.call_on_close(release) # Runs after the body is closed, even if it was never iterated
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/export/events', methods=['GET'])
+def export_events():
+    """导出事件及其统计，筛选参数与 /api/events 相同，另支持按创建时间 from/to 筛选"""
+    try:
+        time_from = _parse_export_time(request.args.get('from'))
+        time_to = _parse_export_time(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD or ISO datetime"}), 400
+    where_clauses, params = _build_event_filters(request.args)
+    if time_from:
+        where_clauses.append("e.create_time >= %s")
+        params.append(time_from)
+    if time_to:
+        where_clauses.append("e.create_time < %s")
+        params.append(time_to)
+    where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    query = f"""
+        SELECT e.event_id, e.event_name, e.event_desc, e.responsible_person,
+               e.create_time, e.update_time, e.event_del_status, e.event_mark_status,
+               COALESCE(s.event_status, 0) AS event_status,
+               s.last_start_time, s.last_stop_time,
+               COALESCE(s.total_duration_seconds, 0) AS total_duration_seconds
+        FROM event_info e
+        LEFT JOIN event_statistics s ON e.event_id = s.event_id
+        {where_sql}
+        ORDER BY e.create_time, e.event_id
+    """
+    return _export_response('events', query, params)
+
+@app.route('/api/export/logs', methods=['GET'])
+def export_logs():
+    """导出事件日志，事件筛选参数与 /api/events 相同，from/to 按日志时间筛选"""
+    try:
+        time_from = _parse_export_time(request.args.get('from'))
+        time_to = _parse_export_time(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD or ISO datetime"}), 400
+    event_id = request.args.get('event_id', None, type=int)
+    where_clauses, params = _build_event_filters(request.args)
+    if event_id is not None:
+        where_clauses.append("l.event_id = %s")
+        params.append(event_id)
+    if time_from:
+        where_clauses.append("l.log_time >= %s")
+        params.append(time_from)
+    if time_to:
+        where_clauses.append("l.log_time < %s")
+        params.append(time_to)
+    where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+    if event_log_queue:
+        event_log_queue.flush() # Include logs accepted but not yet written
+    query = f"""
+        SELECT l.log_id, l.event_id, e.event_name, e.responsible_person,
+               l.log_type, l.log_time
+        FROM event_logs l
+        JOIN event_info e ON e.event_id = l.event_id
+        {where_sql}
+        ORDER BY l.log_time, l.log_id
+    """
+    return _export_response('logs', query, params)
+
+# 15. 事件名称前缀补全 (n-gram 索引，名称越短越靠前)
+SUGGEST_SQL = """
+    SELECT e.event_id, e.event_name
+    FROM event_info e
+    WHERE {candidates} e.event_del_status = 1 AND e.event_name LIKE %s ESCAPE '!'
+    ORDER BY CHAR_LENGTH(e.event_name), e.event_name, e.event_id
+    LIMIT %s
+"""
+
+@app.route('/api/events/suggest', methods=['GET'])
+@cached_response('suggest')
+def suggest_event_names():
+    term = request.args.get('q', '', type=str).strip()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), SUGGEST_LIMIT_MAX)
+    if not term:
+        return jsonify([])
+    candidates_sql, params = (name_search.prefix_condition(term) if SEARCH_INDEX and name_search.index_ready()
+                              else (None, []))
+    escaped = term.replace('!', '!!').replace('%', '!%').replace('_', '!_') # '!' works as ESCAPE on both backends
+    query = SUGGEST_SQL.format(candidates=f"{candidates_sql} AND" if candidates_sql else "")
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, tuple(params + [f"{escaped}%", limit]))
+        return jsonify([{"event_id": event_id, "event_name": name} for event_id, name in cursor.fetchall()])
+    except DB_ERRORS as err:
+        print(f"Error suggesting event names: {err}")
+        return jsonify({"error": f"Failed to suggest event names: {err}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+# 16. 单个事件的日志 (from/to 按日志时间筛选)，透明合并 event_logs 和已归档的月份
+@app.route('/api/events/<int:event_id>/logs', methods=['GET'])
+def get_event_logs(event_id):
+    try:
+        time_from = _parse_export_time(request.args.get('from'))
+        time_to = _parse_export_time(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD or ISO datetime"}), 400
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), EVENT_LOGS_LIMIT_MAX)
+    if event_log_queue:
+        event_log_queue.flush() # Include logs accepted but not yet written
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT event_id FROM event_info WHERE event_id = %s", (event_id,))
+        if not cursor.fetchone():
+            return jsonify({"error": "Event not found"}), 404
+        where_clauses, params = ["event_id = %s"], [event_id]
+        if time_from:
+            where_clauses.append("log_time >= %s")
+            params.append(time_from)
+        if time_to:
+            where_clauses.append("log_time < %s")
+            params.append(time_to)
+        cursor.execute(f"""
+            SELECT log_id, log_type, log_time FROM event_logs
+            WHERE {' AND '.join(where_clauses)}
+            ORDER BY log_time, log_id
+            LIMIT %s
+        """, tuple(params + [limit + 1]))
+        hot_rows = cursor.fetchall()
+    except DB_ERRORS as err:
+        print(f"Error fetching logs for event {event_id}: {err}")
+        return jsonify({"error": f"Failed to fetch event logs: {err}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+    # Archived months are older than every hot log, so the archive is only read when the range reaches them
+    archived_before = event_log_archive.archived_before()
+    archived_rows = []
+    if archived_before and (time_from is None or time_from < archived_before):
+        try:
+            archived_rows = event_log_archive.event_logs(event_id, time_from, time_to)[:limit + 1]
+        except log_archive.ArchiveUnavailable as err:
+            print(f"Error reading archived logs for event {event_id}: {err}")
+            return jsonify({"error": "Archived logs are unavailable"}), 503
+    rows = log_archive.merge_event_logs(hot_rows, archived_rows)
+    return jsonify({
+        "event_id": event_id,
+        "logs": [{"log_id": log_id, "log_type": log_type, "log_time": log_time.isoformat()}
+                 for log_id, log_type, log_time in rows[:limit]],
+        "has_more": len(rows) > limit,
+        "archived_before": archived_before.isoformat() if archived_before else None
+    })
+
+# --- 计时段分析 (analytics.py)：结果按时间窗口缓存，已经结束的窗口缓存更久 ---
+ANALYTICS_LOOKBACK_HOURS = float(os.environ.get('ANALYTICS_LOOKBACK_HOURS', 24)) # 窗口前后多读的日志，用于配对跨越窗口边界的计时段
+ANALYTICS_MAX_DAYS = int(os.environ.get('ANALYTICS_MAX_DAYS', 366))
+ANALYTICS_MAX_POINTS = int(os.environ.get('ANALYTICS_MAX_POINTS', 5000))
+ANALYTICS_GROUPS_MAX = int(os.environ.get('ANALYTICS_GROUPS_MAX', 500))
+ANALYTICS_CACHE_TTL = float(os.environ.get('ANALYTICS_CACHE_TTL', 30)) # 包含当前时间的窗口
+ANALYTICS_CLOSED_CACHE_TTL = float(os.environ.get('ANALYTICS_CLOSED_CACHE_TTL', 3600)) # 只有补录历史日志才会改变
+analytics_cache = TTLCache(ttl=ANALYTICS_CACHE_TTL, maxsize=256)
+analytics_closed_cache = TTLCache(ttl=ANALYTICS_CLOSED_CACHE_TTL, maxsize=256)
+
+def _analytics_window(default_days):
+    """解析 from/to（同导出接口），返回 (from, to, 错误响应)"""
+    try:
+        time_from = _parse_export_time(request.args.get('from'))
+        time_to = _parse_export_time(request.args.get('to'), end=True)
+    except ValueError:
+        return None, None, (jsonify({"error": "from/to must be YYYY-MM-DD or ISO datetime"}), 400)
+    if time_from is None and time_to is None:
+        time_from, time_to = analytics.default_window(default_days)
+    elif time_from is None:
+        time_from = time_to - timedelta(days=default_days)
+    elif time_to is None:
+        time_to = time_from + timedelta(days=default_days)
+    if time_to <= time_from:
+        return None, None, (jsonify({"error": "to must be later than from"}), 400)
+    if time_to - time_from > timedelta(days=ANALYTICS_MAX_DAYS):
+        return None, None, (jsonify({"error": f"Window too long (max {ANALYTICS_MAX_DAYS} days)"}), 400)
+    return time_from, time_to, None
+
+def _analytics_response(key, time_to, compute):
+    """按窗口缓存 compute() 的结果；窗口已经结束时放进长期缓存"""
+    closed = time_to <= datetime.now()
+    cache = analytics_closed_cache if closed else analytics_cache
+    result = cache.get(key)
+    if result is None:
+        if analytics.np is None:
+            return jsonify({"error": "Analytics require numpy"}), 503
+        if event_log_queue and not closed:
+            event_log_queue.flush() # Include logs accepted but not yet written
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        try:
+            result = compute(conn)
+        except DB_ERRORS as err:
+            print(f"Error computing {key[0]} analytics: {err}")
+            return jsonify({"error": f"Failed to compute analytics: {err}"}), 500
+        except log_archive.ArchiveUnavailable as err:
+            print(f"Error reading archived logs for {key[0]} analytics: {err}")
+            return jsonify({"error": "Archived logs are unavailable"}), 503
+        finally:
+            conn.close()
+        cache.set(key, result)
+    response = jsonify(result)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# 17. 并发曲线：每 step 秒采样一次正在进行的事件数，并给出每个步长内的峰值（默认今天）
+@app.route('/api/analytics/concurrency', methods=['GET'])
+def get_concurrency():
+    time_from, time_to, error = _analytics_window(default_days=1)
+    if error:
+        return error
+    step = request.args.get('step', 300, type=int)
+    if step < 1:
+        return jsonify({"error": "step must be a positive number of seconds"}), 400
+    if (time_to - time_from).total_seconds() / step > ANALYTICS_MAX_POINTS:
+        return jsonify({"error": f"step too small for this window (max {ANALYTICS_MAX_POINTS} points)"}), 400
+
+    def compute(conn):
+        sessions = analytics.load_sessions(conn, event_log_archive, time_from, time_to,
+                                           timedelta(hours=ANALYTICS_LOOKBACK_HOURS))
+        curve = analytics.concurrency_curve(sessions, time_from, time_to, step)
+        return {"from": time_from.isoformat(), "to": time_to.isoformat(), "step": step, **curve}
+
+    return _analytics_response(('concurrency', time_from, time_to, step), time_to, compute)
+
+# 18. 计时段时长分布：按事件或负责人分组的 p50 / p90 / p99 与直方图（默认最近 30 天内结束的计时段）
+@app.route('/api/analytics/sessions', methods=['GET'])
+def get_session_analytics():
+    time_from, time_to, error = _analytics_window(default_days=30)
+    if error:
+        return error
+    group_by = request.args.get('group_by', 'event', type=str)
+    if group_by not in ('event', 'person'):
+        return jsonify({"error": "group_by must be one of: event, person"}), 400
+    limit = min(max(request.args.get('limit', 50, type=int), 1), ANALYTICS_GROUPS_MAX)
+
+    def compute(conn):
+        sessions = analytics.load_sessions(conn, event_log_archive, time_from, time_to,
+                                           timedelta(hours=ANALYTICS_LOOKBACK_HOURS))
+        overall, groups = analytics.session_durations(conn, sessions, time_from, time_to, group_by)
+        return {"from": time_from.isoformat(), "to": time_to.isoformat(), "group_by": group_by,
+                "histogram_edges": list(analytics.HISTOGRAM_EDGES), "overall": overall,
+                "total_groups": len(groups), "groups": groups[:limit]}
+
+    return _analytics_response(('sessions', time_from, time_to, group_by, limit), time_to, compute)
+
+
+# 19. Prometheus 指标 (每个进程各自计数)
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+# 20. 批量操作：一组事件的标记 / 取消标记 / 删除 / 分配负责人 / 开始 / 停止，一个事务内用集合语句完成
+BULK_OPERATIONS = ('mark', 'unmark', 'delete', 'reassign', 'start', 'stop')
+BULK_MAX_EVENTS = int(os.environ.get('BULK_MAX_EVENTS', 1000))
+
+def _lock_event_fields(cursor, event_ids):
+    """一次查询并锁定多个事件的可批量修改字段（以及改派时移动负责人汇总所需的统计），返回 {event_id: row}"""
+    placeholders = ", ".join(["%s"] * len(event_ids))
+    cursor.execute(f"""
+        SELECT e.event_id, e.event_del_status, e.event_mark_status, e.responsible_person,
+               COALESCE(s.event_status, 0) AS event_status,
+               COALESCE(s.total_duration_seconds, 0) AS total_duration_seconds
+        FROM event_info e
+        LEFT JOIN event_statistics s ON e.event_id = s.event_id
+        WHERE e.event_id IN ({placeholders})
+        FOR UPDATE
+    """, tuple(sorted(event_ids)))
+    return {row['event_id']: row for row in cursor.fetchall()}
+
+@app.route('/api/events/bulk', methods=['POST'])
+def bulk_event_operation():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected an object with operation and event_ids"}), 400
+    operation = data.get('operation')
+    if operation not in BULK_OPERATIONS:
+        return jsonify({"error": f"Invalid operation. Use one of: {', '.join(BULK_OPERATIONS)}"}), 400
+    event_ids = data.get('event_ids')
+    if (not isinstance(event_ids, list) or not event_ids
+            or not all(isinstance(event_id, int) and not isinstance(event_id, bool) for event_id in event_ids)):
+        return jsonify({"error": "event_ids must be a non-empty array of integers"}), 400
+    event_ids = list(dict.fromkeys(event_ids)) # Drop duplicates, keep the request order
+    if len(event_ids) > BULK_MAX_EVENTS:
+        return jsonify({"error": f"Too many events in one request (max {BULK_MAX_EVENTS})"}), 413
+    person = None
+    if operation == 'reassign':
+        if 'responsible_person' not in data:
+            return jsonify({"error": "responsible_person is required for reassign"}), 400
+        person = data.get('responsible_person') or None # Empty string unassigns, same as PUT
+
+    if operation in ('delete', 'start', 'stop'):
+        _flush_log_queue() # Queued starts/stops must land before checking running status
+
+    conn = get_db_connection()
+    if not conn: return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        now = datetime.now()
+        results = {event_id: {"event_id": event_id} for event_id in event_ids}
+        targets = [] # Events the operation changes
+        statistics = {}
+
+        if operation in ('mark', 'unmark', 'reassign'):
+            column, value = (('responsible_person', person) if operation == 'reassign'
+                             else ('event_mark_status', 1 if operation == 'mark' else 0))
+            rows = _lock_event_fields(cursor, event_ids)
+            for event_id, result in results.items():
+                row = rows.get(event_id)
+                if not row:
+                    result.update(status=404, error="Event not found")
+                elif row[column] == value:
+                    result.update(status=200, result="unchanged")
+                else:
+                    result.update(status=200, result="updated")
+                    targets.append(event_id)
+            if targets:
+                placeholders = ", ".join(["%s"] * len(targets))
+                cursor.execute(f"UPDATE event_info SET {column} = %s WHERE event_id IN ({placeholders})",
+                               (value, *targets))
+            if operation == 'reassign':
+                deltas = {}
+                for event_id in targets:
+                    row = rows[event_id]
+                    before = (row['responsible_person'], row['event_del_status'],
+                              row['event_status'], row['total_duration_seconds'])
+                    person_summary.diff(deltas, before, (person, *before[1:]))
+                person_summary.apply(cursor, deltas)
+            changes = {column: value}
+        else:
+            states = _lock_stat_states(cursor, event_ids)
+            log_type = 1 if operation == 'start' else 0 # Deleting writes stop logs
+            for event_id, result in results.items():
+                state = states.get(event_id)
+                if not state:
+                    result.update(status=404, error="Event not found")
+                elif operation == 'delete':
+                    if state['event_del_status'] == 0:
+                        result.update(status=200, result="unchanged") # Already deleted
+                    else:
+                        result.update(status=200, result="updated")
+                        targets.append(event_id)
+                elif state['event_del_status'] == 0:
+                    result.update(status=400, error="Cannot log action for a deleted event")
+                elif operation == 'start' and state['event_status'] == 1:
+                    result.update(status=409, error="Event is already running")
+                elif operation == 'stop' and state['event_status'] == 0:
+                    result.update(status=200, result="unchanged") # No stop log for a stopped event
+                else:
+                    result.update(status=200, result="updated")
+                    targets.append(event_id)
+
+            if operation == 'delete' and targets:
+                placeholders = ", ".join(["%s"] * len(targets))
+                cursor.execute(f"UPDATE event_info SET event_del_status = 0 WHERE event_id IN ({placeholders})",
+                               tuple(targets))
+            # Deleting stops whatever is running among the deleted events
+            loggable = [event_id for event_id in targets if operation != 'delete' or states[event_id]['event_status'] == 1]
+            sessions = []
+            for event_id in loggable:
+                session = fold_log_into_stats(states[event_id], log_type, now)
+                if session:
+                    sessions.append((event_id, *session))
+            _insert_event_logs(cursor, [(event_id, log_type, now) for event_id in loggable])
+            _upsert_event_statistics(cursor, [states[event_id] for event_id in loggable])
+            if DAILY_ROLLUPS:
+                rollups.add_sessions(cursor, sessions)
+            if operation == 'delete':
+                deltas = {}
+                for event_id in targets:
+                    state = states[event_id]
+                    person_summary.diff(deltas, (state['responsible_person'], state['event_del_status'],
+                                                 state['initial_status'], state['initial_total']),
+                                        (state['responsible_person'], 0, 0, 0))
+            else:
+                deltas = person_summary.state_deltas({}, [states[event_id] for event_id in loggable])
+            person_summary.apply(cursor, deltas)
+            statistics = {event_id: _stats_payload(states[event_id]) for event_id in loggable}
+            changes = {"event_del_status": 0, "event_status": 0} if operation == 'delete' else None
+
+        conn.commit()
+        if targets:
+            _events_changed(targets, membership=operation not in ('start', 'stop'))
+            if event_log_queue and operation in ('delete', 'start', 'stop'):
+                event_log_queue.invalidate(targets)
+        for event_id in targets:
+            if changes is None:
+                event_broker.publish('status', statistics[event_id])
+            else:
+                event_broker.publish('deleted' if operation == 'delete' else 'updated', {"event_id": event_id, **changes})
+
+        return jsonify({
+            "operation": operation,
+            "changed": len(targets),
+            "results": list(results.values()),
+            "statistics": statistics
+        }), 200
+
+    except DB_ERRORS as err:
+        conn.rollback()
+        print(f"Error applying bulk {operation}: {err}")
+        return jsonify({"error": f"Failed to apply bulk {operation}: {err}"}), 500
+    except Exception as e:
+        conn.rollback()
+        print(f"Unexpected error applying bulk {operation}: {e}")
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# --- 命令行工具 (flask --app app <command>) ---
+@app.cli.command('backfill-rollups')
+def backfill_rollups_command():
+    """从 event_logs 全量重建每日时长汇总表 event_daily_durations"""
+    started = time.monotonic()
+    count = rollups.backfill(storage_backend, archive=event_log_archive,
+                             progress=lambda n: print(f"  {n} logs processed", end='\r'))
+    print(f"Rebuilt event_daily_durations from {count} logs in {time.monotonic() - started:.1f}s")
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """从 event_info 全量重建事件名称的 n-gram 索引 event_name_grams"""
+    started = time.monotonic()
+    count = name_search.rebuild(storage_backend, progress=lambda n: print(f"  {n} events indexed", end='\r'))
+    _events_changed(membership=True)
+    print(f"Indexed {count} event names in {time.monotonic() - started:.1f}s")
+
+
+@app.cli.command('migrate')
+@click.option('--status', is_flag=True, help="只列出迁移及其执行状态")
+@click.option('--to', 'target', type=int, default=None, help="只执行到这个版本")
+def migrate_command(status, target):
+    """执行 migrations.py 里未执行的结构迁移（建表、索引）"""
+    if status:
+        applied = migrations.applied_versions(storage_backend)
+        for version, description, _ in migrations.MIGRATIONS:
+            state = f"applied {applied[version]}" if version in applied else "pending"
+            print(f"{version:>4}  {state:<28} {description}")
+        return
+    applied = migrations.migrate(storage_backend, target=target,
+                                 progress=lambda version, description: print(f"Applying {version}: {description}"))
+    for version, _, created in applied:
+        print(f"  {version}: {', '.join(created) or 'objects already existed'}")
+    print(f"Schema is at version {max(migrations.applied_versions(storage_backend), default=0)}")
+
+
+@app.cli.command('check-indexes')
+@click.option('--strict', is_flag=True, help="发现全表扫描或文件排序时以非零状态退出")
+@click.option('--verbose', is_flag=True, help="打印每个查询的完整执行计划")
+def check_indexes_command(strict, verbose):
+    """对接口生成的每种查询执行 EXPLAIN，标出全表扫描和文件排序"""
+    results = query_check.check(app, storage_backend, db_pool, verbose=verbose,
+                                reset=lambda: _events_changed(membership=True))
+    flagged = [result for result in results if not result['expected']]
+    print(f"{len(results)} query shapes checked, {len(flagged)} flagged")
+    if strict and flagged:
+        raise SystemExit(1)
+
+
+@app.cli.command('archive-logs')
+@click.option('--retention', type=click.IntRange(min=0), default=None,
+              help="event_logs 保留的完整月份数，默认 LOG_RETENTION_MONTHS")
+@click.option('--dry-run', is_flag=True, help="只统计每个月要归档的日志条数")
+def archive_logs_command(retention, dry_run):
+    """把保留期之前的整月日志写入列式归档 (LOG_ARCHIVE_DIR)，并从 event_logs 删除"""
+    started = time.monotonic()
+    months = LOG_RETENTION_MONTHS if retention is None else retention
+    cutoff = log_archive.add_months(log_archive.month_start(datetime.now()), -months)
+    results = log_archive.archive_logs(storage_backend, event_log_archive, cutoff, dry_run=dry_run,
+                                       progress=lambda line: print(f"  {line}"))
+    action = "Would archive" if dry_run else "Archived"
+    print(f"{action} {len(results)} months before {cutoff:%Y-%m} in {time.monotonic() - started:.1f}s")
+
+
+@app.cli.command('partition-logs')
+def partition_logs_command():
+    """把 event_logs 改为按月分区（MySQL，大表上是一次全表重建，请在维护窗口执行）；已分区时补上未来的分区"""
+    if storage_backend.name != 'mysql':
+        print("Only MySQL partitions event_logs, SQLite archives by time range without it")
+        return
+    started = time.monotonic()
+    rebuilt, created = log_archive.partition_logs(storage_backend)
+    action = "Partitioned event_logs" if rebuilt else "event_logs already partitioned, added"
+    print(f"{action}: {', '.join(created) or 'no new partitions'} in {time.monotonic() - started:.1f}s")
+
+
+@app.cli.command('rebuild-stats')
+@click.option('--apply', is_flag=True, help="重写不一致的统计行（默认只报告差异）")
+@click.option('--workers', type=click.IntRange(min=1), default=None, help="进程数，默认 CPU 核数")
+@click.option('--shard-size', type=click.IntRange(min=1), default=stats_rebuild.SHARD_SIZE,
+              help="每个分片的 event_id 个数")
+@click.option('--tolerance', type=float, default=stats_rebuild.DURATION_TOLERANCE, help="总时长允许的误差秒数")
+@click.option('--show', type=click.IntRange(min=0), default=20, help="最多打印多少个不一致的事件")
+def rebuild_stats_command(apply, workers, shard_size, tolerance, show):
+    """从 event_logs（含已归档的月份）重新计算 event_statistics，报告差异，--apply 时批量重写"""
+    started = time.monotonic()
+    summary = stats_rebuild.rebuild((DB_BACKEND, DB_CONFIG, SQLITE_PATH), LOG_ARCHIVE_DIR, apply=apply,
+                                    workers=workers, shard_size=shard_size, tolerance=tolerance, samples=show,
+                                    progress=lambda done, total: print(f"  {done}/{total} shards", end='\r'))
+    for event_id, fields in summary['samples']:
+        changes = ", ".join(f"{name} {current} -> {expected}" for name, (current, expected) in fields.items())
+        print(f"  event {event_id}: {changes}")
+    by_field = ", ".join(f"{name} {count}" for name, count in sorted(summary['fields'].items()))
+    print(f"Checked {summary['events']} events ({summary['logs']} logs, {summary['shards']} shards, "
+          f"{summary['workers']} workers) in {time.monotonic() - started:.1f}s: "
+          f"{summary['differences']} differ" + (f" ({by_field})" if by_field else ""))
+    if apply:
+        print(f"Rewrote {summary['written']} event_statistics rows")
+        if summary['written']:
+            persons, differences = person_summary.check(storage_backend, apply_fixes=True)
+            print(f"Rebuilt person_summary ({persons} persons, {len(differences)} differed)")
+            _events_changed(membership=True)
+
+
+@app.cli.command('rebuild-person-summary')
+@click.option('--apply', is_flag=True, help="有差异时重写整张汇总表（默认只报告差异）")
+@click.option('--tolerance', type=float, default=person_summary.DURATION_TOLERANCE, help="累计时长允许的误差秒数")
+@click.option('--show', type=click.IntRange(min=0), default=20, help="最多打印多少个不一致的负责人")
+def rebuild_person_summary_command(apply, tolerance, show):
+    """从 event_info + event_statistics 重新聚合负责人汇总表 person_summary，报告差异，--apply 时重写"""
+    started = time.monotonic()
+    persons, differences = person_summary.check(storage_backend, apply_fixes=apply, tolerance=tolerance)
+    for person, fields in differences[:show]:
+        changes = ", ".join(f"{name} {current} -> {expected}" for name, (current, expected) in fields.items())
+        print(f"  {person}: {changes}")
+    print(f"Checked {persons} persons in {time.monotonic() - started:.1f}s: {len(differences)} differ")
+    if apply and differences:
+        _events_changed(membership=True)
+        print("Rewrote person_summary")
+
+
 # --- 前端页面路由 ---
 @app.route('/')
 def index():
@@ -0,0 +1,435 @@
+"""
+API 的异步版本 (ASGI)：路由和 JSON 格式与 app.py 相同，跑在 Hypercorn 上，数据库使用异步连接池 (async_storage.py)，
+MySQL / MariaDB 用 aiomysql，SQLite 用 aiosqlite。
+- 热点路由在这里用 async 实现，等待数据库时不占用线程，一个 worker 可以同时服务大量客户端：
+  事件列表（COUNT 和数据查询用两个连接并发执行）、开始/停止、Dashboard、事件详情、负责人列表、SSE 推送
+- 其余路由交给 app.py 的 Flask 应用，在线程池里执行 (hypercorn 的 WSGI 适配)；
+  两边在同一个进程里，共用响应缓存、COUNT 缓存、变更广播、write-behind 队列和 /metrics 指标
+- 异步路由只读主库（DB_REPLICAS 只用于 Flask 路由），写入同样设置 read-your-writes cookie
+需要 pip install quart hypercorn aiomysql（SQLite 后端换成 aiosqlite），用法:
+    hypercorn async_app:asgi_app --bind 127.0.0.1:5001
+吞吐量对比见 bench/compare_async.py。
+"""
+import os
+import math
+import time
+import asyncio
+import functools
+from datetime import datetime
+
+from werkzeug.exceptions import HTTPException
+
+try:
+    from quart import Quart, Response, g, request, jsonify, make_response
+    from hypercorn.middleware import AsyncioWSGIMiddleware
+except ImportError as err:  # Optional, only needed to serve the async variant
+    raise ImportError("async_app needs quart and hypercorn: pip install quart hypercorn aiomysql (or aiosqlite)") from err
+
+import app as sync_app
+import rollups
+import replicas
+import compression
+import person_summary
+import async_storage
+from db_pool import PoolExhaustedError
+from event_log_queue import LogQueueFullError
+from event_queries import (EVENT_ROW, STATS_ROW, EVENT_BY_ID_SQL, EVENT_STATS_BY_ID_SQL, OrjsonProvider,
+                           parse_fields)
+
+quart_app = Quart(__name__, static_folder=None) # Static files and the page are served by the Flask app
+if OrjsonProvider and os.environ.get('JSON_ENCODER', 'orjson').lower() == 'orjson':
+    quart_app.json = OrjsonProvider(quart_app)
+
+# --- 异步连接池 ---
+ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 50)) # 并发查询数上限，不再受线程数限制
+db = async_storage.create_backend(sync_app.DB_BACKEND, sync_app.DB_CONFIG, sync_app.SQLITE_PATH,
+                                  ASYNC_DB_POOL_SIZE, sync_app.DB_POOL_TIMEOUT, sync_app.db_instruments)
+# Async driver errors, plus the sync ones raised by helpers run in worker threads
+DB_ERRORS = async_storage.DB_ERRORS + sync_app.DB_ERRORS
+
+
+@quart_app.before_serving
+async def open_pool():
+    await db.open()
+
+
+@quart_app.after_serving
+async def close_pool():
+    await db.close()
+
+
+async def fetch_all(sql, params=()):
+    """用单独借出的连接执行只读查询，返回 tuple 行；互不依赖的查询可以用 asyncio.gather 并发"""
+    async with db.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            await cursor.execute(sql, params)
+            return await cursor.fetchall()
+        finally:
+            await cursor.close()
+
+
+async def fetch_one(sql, params=()):
+    rows = await fetch_all(sql, params)
+    return rows[0] if rows else None
+
+
+# --- 错误处理和请求指标 ---
+@quart_app.errorhandler(PoolExhaustedError)
+async def handle_pool_exhausted(err):
+    print(f"Database pool exhausted: {err}")
+    if sync_app.METRICS_ENABLED:
+        sync_app.errors_total.inc(type(err).__name__)
+    response = jsonify({"error": "Database is busy, please retry shortly"})
+    response.headers['Retry-After'] = str(max(1, math.ceil(sync_app.DB_POOL_TIMEOUT)))
+    return response, 503
+
+
+@quart_app.errorhandler(LogQueueFullError)
+async def handle_log_queue_full(err):
+    print(f"Event log queue full: {err}")
+    if sync_app.METRICS_ENABLED:
+        sync_app.errors_total.inc(type(err).__name__)
+    response = jsonify({"error": "Too many pending log writes, please retry shortly"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+@quart_app.after_request
+async def track_client_writes(response):
+    # Same cookie as app.track_client_writes, so this client's next reads on the Flask routes avoid lagging replicas
+    if sync_app.read_router.enabled and request.method not in ('GET', 'HEAD', 'OPTIONS') \
+            and response.status_code < 400:
+        committed_at = g.get('write_committed_at') or time.time()
+        max_age = committed_at - time.time() + sync_app.READ_YOUR_WRITES_SECONDS
+        response.set_cookie(replicas.LAST_WRITE_COOKIE, f"{committed_at:.3f}",
+                            max_age=max(1, math.ceil(max_age)), httponly=True, samesite='Lax')
+    return response
+
+
+@quart_app.before_request
+async def start_request_timer():
+    if sync_app.METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+
+
+@quart_app.after_request
+async def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Same endpoint names as the Flask routes, so both variants share the series
+        endpoint = request.endpoint or 'unmatched'
+        sync_app.http_request_seconds.observe(time.perf_counter() - started, endpoint, request.method)
+        sync_app.http_requests_total.inc(endpoint, request.method, str(response.status_code))
+    return response
+
+
+@quart_app.after_request
+async def compress_response(response):
+    if not compression.compressible(response, sync_app.COMPRESS_MIN_SIZE):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = compression.choose_encoding(request.accept_encodings)
+    if encoding:
+        response.set_data(compression.encode(await response.get_data(), encoding, sync_app.COMPRESS_LEVEL))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def cached_response(name, scope_arg=None):
+    """app.cached_response 的异步版本，使用同一个响应缓存，两边的写操作都会让它失效（异步路由只读主库，结果总是可以缓存）"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(**view_args):
+            scope = view_args.get(scope_arg) if scope_arg else None
+            version = sync_app.response_cache.version(scope)
+            key = (name, scope, tuple(sorted(request.args.items(multi=True))))
+            etag = sync_app.response_cache.etag(key, version)
+            cached = sync_app.response_cache.get(key, version)
+
+            if cached is not None and request.if_none_match.contains_weak(etag):
+                response = quart_app.response_class(b"", status=304)
+            else:
+                if cached is not None:
+                    body, mimetype = cached
+                    response = quart_app.response_class(body, mimetype=mimetype)
+                else:
+                    response = await make_response(await view(**view_args))
+                    if response.status_code != 200:
+                        return response
+                    sync_app.response_cache.set(key, version, (await response.get_data(), response.mimetype))
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache' # Always revalidate, 304 is cheap
+            return response
+        return wrapper
+    return decorator
+
+
+# --- API Endpoints (与 app.py 中同名路由的请求和响应一致) ---
+
+class _LazySyncConnection:
+    """名称搜索的 n-gram 统计只在缓存过期时才查询，那时再从同步连接池借连接"""
+
+    def __init__(self):
+        self.conn = None
+
+    def cursor(self, *args, **kwargs):
+        if self.conn is None:
+            self.conn = sync_app.db_pool.get_connection()
+        return self.conn.cursor(*args, **kwargs)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def _plan_with_gram_stats(args):
+    conn = _LazySyncConnection()
+    try:
+        return sync_app._plan_event_list(args, conn)
+    finally:
+        conn.close()
+
+
+# 1. 获取事件列表：COUNT 和数据查询并发执行
+@quart_app.route('/api/events', methods=['GET'])
+async def get_events():
+    args = request.args
+    try:
+        if args.get('search_name', '').strip():
+            # Gram statistics may need a (blocking) query, keep it off the event loop
+            plan, error = await asyncio.to_thread(_plan_with_gram_stats, args)
+        else:
+            plan, error = sync_app._plan_event_list(args)
+        if error:
+            return jsonify({"error": error[0]}), error[1]
+
+        async def count():
+            if not plan['count_query']:
+                return plan['total_items']
+            row = await fetch_one(plan['count_query'], plan['count_params'])
+            return row[0]
+
+        total_items, rows = await asyncio.gather(count(), fetch_all(plan['data_query'], plan['data_params']))
+        return jsonify(sync_app._event_list_body(plan, rows, total_items))
+    except DB_ERRORS as err:
+        print(f"Error fetching events: {err}")
+        return jsonify({"error": f"Failed to fetch events: {err}"}), 500
+
+
+async def _update_event_statistics(cursor, event_id, log_type, log_time, person=None):
+    """
+    app.update_event_statistics 的异步版本，语句和返回值相同：
+    开始一个已在进行中的事件时抛出 EventStatusConflict，死锁原样抛出，其他数据库错误返回 False。
+    """
+    try:
+        if log_type == 1:
+            await cursor.execute(sync_app.STATS_START_SQL, (log_time, event_id))
+            if cursor.rowcount == 0:
+                try:
+                    await cursor.execute(sync_app.STATS_FIRST_START_SQL, (event_id, log_time))
+                except DB_ERRORS as err:
+                    if not db.is_duplicate_key(err):
+                        raise
+                    raise sync_app.EventStatusConflict(f"Event {event_id} is already running")
+            await person_summary.log_delta_async(cursor, person, 1, 0, DB_ERRORS, db.is_missing_table)
+            return True
+
+        running = False
+        session = None
+        if sync_app.DAILY_ROLLUPS or person:
+            await cursor.execute(sync_app.STATS_LOCK_SQL, (event_id,))
+            stat_rec = await cursor.fetchone()
+            running = bool(stat_rec and stat_rec['event_status'] == 1)
+            if running and stat_rec['last_start_time']:
+                session = (event_id, stat_rec['last_start_time'], log_time)
+        await cursor.execute(sync_app.STATS_STOP_SQL, (log_time, log_time, event_id))
+        if cursor.rowcount == 0:
+            print(f"Warning: Stop log received for event_id {event_id} without a statistics record or prior start.")
+            await cursor.execute(sync_app.STATS_STOP_WITHOUT_ROW_SQL, (event_id, log_time))
+        if session and sync_app.DAILY_ROLLUPS:
+            await rollups.add_sessions_async(cursor, [session], DB_ERRORS, db.is_missing_table)
+        if running:
+            seconds = max(0.0, (log_time - session[1]).total_seconds()) if session else 0
+            await person_summary.log_delta_async(cursor, person, -1, str(seconds), DB_ERRORS, db.is_missing_table)
+        return True
+    except DB_ERRORS as err:
+        if db.is_deadlock(err):
+            raise # The transaction is gone, the caller retries it from the start
+        print(f"Error updating statistics for event {event_id}: {err}")
+        return False
+
+
+async def _log_event_transaction(conn, cursor, event_id, log_type):
+    """app._log_event_transaction 的异步版本，返回 (响应体, 状态码)；死锁时数据库异常原样抛出，由调用方重试"""
+    await conn.begin()
+    await cursor.execute(sync_app.EVENT_LOCK_FOR_LOG_SQL, (event_id,))
+    event_info_rec = await cursor.fetchone()
+    if not event_info_rec:
+        await conn.rollback()
+        return {"error": "Event not found"}, 404
+    if event_info_rec['event_del_status'] == 0:
+        await conn.rollback()
+        return {"error": "Cannot log action for a deleted event"}, 400
+
+    now = datetime.now()
+    try:
+        updated = await _update_event_statistics(cursor, event_id, log_type, now,
+                                                 event_info_rec['responsible_person'])
+    except sync_app.EventStatusConflict:
+        await conn.rollback()
+        return {"error": "Event is already running"}, 409
+    if not updated:
+        await conn.rollback()
+        return {"error": "Failed to update event statistics"}, 500
+
+    await cursor.execute(sync_app.INSERT_LOG_SQL, (event_id, log_type, now))
+    log_id = cursor.lastrowid
+    await conn.commit()
+    sync_app._events_changed([event_id])
+    return {
+        "message": f"Event {event_id} {'started' if log_type == 1 else 'stopped'} successfully",
+        "log_id": log_id,
+        "log_time": now.isoformat(),
+        "statistics": None
+    }, 200
+
+
+# 5. 记录事件日志 (开始/结束) 并更新统计
+@quart_app.route('/api/events/<int:event_id>/log', methods=['POST'])
+async def log_event_action(event_id):
+    data = await request.get_json()
+    log_type = data.get('log_type') if isinstance(data, dict) else None # 1 for start, 0 for stop
+
+    if log_type not in [0, 1]:
+        return jsonify({"error": "Invalid log_type. Use 1 for start, 0 for stop."}), 400
+
+    if sync_app.event_log_queue:
+        # The queue may load the event state or wait for room, both block
+        body, status = await asyncio.to_thread(sync_app._submit_queued_log, event_id, log_type)
+        if status == 202:
+            g.write_committed_at = time.time() + sync_app.event_log_queue.commit_delay()
+        return jsonify(body), status
+
+    async with db.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            for attempt in range(sync_app.LOG_DEADLOCK_RETRIES + 1):
+                try:
+                    body, status = await _log_event_transaction(conn, cursor, event_id, log_type)
+                    break
+                except DB_ERRORS as err:
+                    if not db.is_deadlock(err) or attempt == sync_app.LOG_DEADLOCK_RETRIES:
+                        raise
+                    await conn.rollback()
+                    print(f"Warning: Deadlock logging action for event {event_id}, retrying: {err}")
+            if status == 200:
+                stats_cursor = conn.cursor() # Tuple rows for STATS_ROW
+                try:
+                    await stats_cursor.execute(EVENT_STATS_BY_ID_SQL, (event_id,))
+                    row = await stats_cursor.fetchone()
+                finally:
+                    await stats_cursor.close()
+                body['statistics'] = STATS_ROW(row) if row else None
+                if body['statistics']:
+                    sync_app.event_broker.publish('status', body['statistics'])
+            return jsonify(body), status
+        except DB_ERRORS as err:
+            await conn.rollback()
+            print(f"Error logging action for event {event_id}: {err}")
+            return jsonify({"error": f"Failed to log action: {err}"}), 500
+        finally:
+            await cursor.close()
+
+
+# 6. 获取 Dashboard 数据
+@quart_app.route('/api/dashboard', methods=['GET'])
+@cached_response('dashboard')
+async def get_dashboard_data():
+    try:
+        projection = parse_fields(request.args.get('fields', '', type=str))
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    try:
+        dashboard_events = projection.row.many(await fetch_all(projection.dashboard_sql))
+        sync_app._overlay_pending_logs(dashboard_events)
+        return jsonify(dashboard_events)
+    except DB_ERRORS as err:
+        print(f"Error fetching dashboard data: {err}")
+        return jsonify({"error": f"Failed to fetch dashboard data: {err}"}), 500
+
+
+# 7. 获取单个事件详情
+@quart_app.route('/api/events/<int:event_id>', methods=['GET'])
+@cached_response('event_details', scope_arg='event_id')
+async def get_event_details(event_id):
+    try:
+        row = await fetch_one(EVENT_BY_ID_SQL, (event_id,))
+        if not row:
+            return jsonify({"error": "Event not found"}), 404
+        event = EVENT_ROW(row)
+        sync_app._overlay_pending_logs([event])
+        return jsonify(event)
+    except DB_ERRORS as err:
+        print(f"Error fetching event details for {event_id}: {err}")
+        return jsonify({"error": f"Failed to fetch event details: {err}"}), 500
+
+
+# 8. 负责人列表（读负责人汇总表，with_stats=true 时附带每人的统计）
+@quart_app.route('/api/persons', methods=['GET'])
+@cached_response('persons')
+async def get_responsible_persons():
+    with_stats = request.args.get('with_stats', 'false').lower() == 'true'
+    try:
+        try:
+            rows = await fetch_all(person_summary.SUMMARY_SQL)
+        except DB_ERRORS as err:
+            if not db.is_missing_table(err):
+                raise
+            rows = sorted(await fetch_all(person_summary.AGGREGATE_SQL)) # Not migrated yet
+        if with_stats:
+            return jsonify([person_summary.as_dict(row) for row in rows])
+        return jsonify([row[0] for row in rows])
+    except DB_ERRORS as err:
+        print(f"Error fetching responsible persons: {err}")
+        return jsonify({"error": f"Failed to fetch persons: {err}"}), 500
+
+
+# 12. 事件变更推送 (Server-Sent Events)，每个连接只占用一个协程
+@quart_app.route('/api/stream', methods=['GET'])
+async def stream_event_changes():
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    response = Response(sync_app.event_broker.subscribe_async(last_event_id), mimetype='text/event-stream')
+    response.timeout = None # Long-lived, no response timeout
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# --- ASGI 入口 ---
+class FallbackDispatcher:
+    """Quart 有对应路由（路径和方法都匹配）的请求交给 Quart，其余交给 Flask 应用"""
+
+    def __init__(self, app, fallback):
+        self.app = app
+        self.fallback = fallback
+        self.adapter = app.url_map.bind('localhost')
+
+    def handles(self, path, method):
+        try:
+            self.adapter.match(path, method=method)
+            return True
+        except HTTPException: # NotFound, MethodNotAllowed, redirects
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not self.handles(scope['path'], scope['method']):
+            return await self.fallback(scope, receive, send)
+        return await self.app(scope, receive, send) # Lifespan events go to Quart (pool setup)
+
+
+asgi_app = FallbackDispatcher(quart_app, AsyncioWSGIMiddleware(sync_app.app))
@@ -0,0 +1,321 @@
+"""
+async_app 的异步数据库访问：MySQL / MariaDB 用 aiomysql 连接池，SQLite 用 aiosqlite（每个连接一个后台线程）。
+连接和游标只提供路由用到的一小部分接口（execute / fetchone / fetchall / rowcount / lastrowid，begin / commit / rollback），
+SQL 仍是 MySQL 写法，SQLite 上同样经过 storage.translate_sql 改写。
+语句耗时、连接获取耗时和错误数计入同步连接池的 metrics.DatabaseInstruments，两个版本共用 /metrics 指标。
+"""
+import time
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+
+from mysql.connector import errorcode
+
+import storage
+from db_pool import PoolExhaustedError
+
+try:
+    import aiomysql
+except ImportError:  # Optional, only needed for DB_BACKEND=mysql
+    aiomysql = None
+
+try:
+    import aiosqlite
+except ImportError:  # Optional, only needed for DB_BACKEND=sqlite
+    aiosqlite = None
+
+# 异步路由里统一捕获的数据库异常（aiosqlite 抛出的就是 sqlite3 的异常）
+DB_ERRORS = (sqlite3.Error,) + ((aiomysql.Error,) if aiomysql else ())
+
+
+class AsyncCursor:
+    """游标：每次 execute 取得驱动的结果游标，dictionary=True 时按列名返回 dict 行"""
+
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._dictionary = dictionary
+        self._result = None
+        self._label = None
+
+    async def execute(self, sql, params=()):
+        await self.close()
+        instruments = self._connection.instruments
+        label = self._label = instruments.shapes.label(sql)
+        started = time.perf_counter()
+        try:
+            self._result = await self._connection._run(sql, tuple(params or ()))
+        except Exception as err:
+            if instruments.enabled:
+                instruments.errors.inc(type(err).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if instruments.enabled:
+                instruments.query_seconds.observe(elapsed, label)
+            for hook in instruments.statement_hooks:
+                hook(label, sql, params, elapsed)
+
+    async def _fetch(self, method):
+        started = time.perf_counter()
+        try:
+            return await method()
+        finally:
+            instruments = self._connection.instruments
+            elapsed = time.perf_counter() - started
+            if instruments.enabled:
+                instruments.fetch_seconds.inc(self._label or 'unknown', amount=elapsed)
+            for hook in instruments.fetch_hooks:
+                hook(self._label, elapsed)
+
+    def _names(self):
+        return [column[0] for column in self._result.description]
+
+    async def fetchone(self):
+        row = await self._fetch(self._result.fetchone)
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip(self._names(), row))
+
+    async def fetchall(self):
+        rows = await self._fetch(self._result.fetchall)
+        if not self._dictionary:
+            return list(rows)
+        names = self._names()
+        return [dict(zip(names, row)) for row in rows]
+
+    @property
+    def rowcount(self):
+        return self._result.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._result.lastrowid
+
+    async def close(self):
+        result, self._result = self._result, None
+        if result is not None:
+            await result.close()
+
+
+# --- MySQL / MariaDB (aiomysql) ---
+def _mysql_errno(err):
+    return err.args[0] if err.args and isinstance(err.args[0], int) else None
+
+
+class AsyncMySQLConnection:
+    """aiomysql 连接，连接池里是 autocommit 模式；写事务用 begin() 显式开始"""
+
+    def __init__(self, conn, instruments):
+        self._conn = conn
+        self.instruments = instruments
+
+    def cursor(self, dictionary=False):
+        return AsyncCursor(self, dictionary=dictionary)
+
+    async def _run(self, sql, params):
+        cursor = await self._conn.cursor()
+        # pymysql formats the SQL with % only when params are given, statements without placeholders stay as is
+        await cursor.execute(sql, params or None)
+        return cursor
+
+    async def begin(self):
+        await self._conn.begin()
+
+    async def commit(self):
+        await self._conn.commit()
+
+    async def rollback(self):
+        await self._conn.rollback()
+
+
+# --- SQLite (aiosqlite) ---
+class AsyncSQLiteConnection:
+    """
+    aiosqlite 连接，事务规则与 storage.SQLiteConnection 相同：语句默认自动提交，
+    第一条写语句或加锁读之前执行 BEGIN IMMEDIATE，直到 commit() / rollback()。
+    写事务先在事件循环里排队拿 write_lock（SQLite 同一时间本来就只有一个写者），
+    不让几十个连接在 busy_timeout 里轮询数据库锁。
+    """
+
+    def __init__(self, conn, instruments, write_lock):
+        self._conn = conn
+        self.instruments = instruments
+        self._write_lock = write_lock
+        self._writing = False
+
+    def cursor(self, dictionary=False):
+        return AsyncCursor(self, dictionary=dictionary)
+
+    async def _run(self, sql, params):
+        statement = storage.translate_sql(sql)
+        if statement.writes:
+            await self.begin()
+        return await self._conn.execute(statement.sql, params)
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    async def begin(self):
+        if not self._conn.in_transaction:
+            await self._write_lock.acquire()
+            self._writing = True
+            try:
+                await self._conn.execute("BEGIN IMMEDIATE")
+            except BaseException:
+                self._end_write()
+                raise
+
+    def _end_write(self):
+        if self._writing:
+            self._writing = False
+            self._write_lock.release()
+
+    async def commit(self):
+        try:
+            if self._conn.in_transaction:
+                await self._conn.execute("COMMIT")
+        finally:
+            self._end_write()
+
+    async def rollback(self):
+        try:
+            if self._conn.in_transaction:
+                await self._conn.execute("ROLLBACK")
+        finally:
+            self._end_write()
+
+
+# --- 连接池 ---
+class AsyncBackend:
+    """
+    异步连接池的公共部分：connection() 借出连接，timeout 秒内借不到时抛出 PoolExhaustedError，
+    与同步连接池一样由错误处理返回 503。open() / close() 在服务启动和停止时调用（需要运行中的事件循环）。
+    """
+    name = None
+
+    def __init__(self, size, timeout, instruments):
+        self.size = size
+        self.timeout = timeout
+        self.instruments = instruments
+
+    @asynccontextmanager
+    async def connection(self):
+        started = time.perf_counter()
+        try:
+            conn = await asyncio.wait_for(self._acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolExhaustedError(self.timeout) from None
+        self.instruments.observe_checkout(time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            await self._release(conn)
+
+
+class AsyncMySQLBackend(AsyncBackend):
+    name = 'mysql'
+
+    def __init__(self, config, size, timeout, instruments):
+        if aiomysql is None:
+            raise RuntimeError("DB_BACKEND=mysql needs aiomysql for the async variant: pip install aiomysql")
+        super().__init__(size, timeout, instruments)
+        self.config = config
+        self._pool = None
+
+    async def open(self):
+        config = self.config
+        # autocommit: reads see the latest commit; writes open their own transaction with begin()
+        self._pool = await aiomysql.create_pool(host=config['host'], port=config.get('port', 3306),
+                                                user=config['user'], password=config['password'],
+                                                db=config['database'],
+                                                connect_timeout=config.get('connection_timeout', 10),
+                                                minsize=1, maxsize=self.size, autocommit=True)
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+
+    async def _acquire(self):
+        return AsyncMySQLConnection(await self._pool.acquire(), self.instruments)
+
+    async def _release(self, conn):
+        if conn._conn.get_transaction_status():
+            try:
+                await conn.rollback()
+            except aiomysql.Error:
+                pass # aiomysql closes a connection returned inside a transaction
+        self._pool.release(conn._conn)
+
+    @staticmethod
+    def is_duplicate_key(err):
+        return _mysql_errno(err) == errorcode.ER_DUP_ENTRY
+
+    @staticmethod
+    def is_missing_table(err):
+        return _mysql_errno(err) == errorcode.ER_NO_SUCH_TABLE
+
+    @staticmethod
+    def is_deadlock(err):
+        return _mysql_errno(err) == errorcode.ER_LOCK_DEADLOCK
+
+
+class AsyncSQLiteBackend(AsyncBackend):
+    """最多 size 个 aiosqlite 连接，PRAGMA 与 storage.SQLiteBackend 相同（WAL，读写不互相阻塞）"""
+    name = 'sqlite'
+
+    def __init__(self, path, size, timeout, instruments, pragmas=None):
+        if aiosqlite is None:
+            raise RuntimeError("DB_BACKEND=sqlite needs aiosqlite for the async variant: pip install aiosqlite")
+        super().__init__(size, timeout, instruments)
+        self.path = path
+        self.pragmas = dict(storage.SQLITE_PRAGMAS, **(pragmas or {}))
+        self._idle = []
+        self._slots = None
+        self._write_lock = None
+
+    async def open(self):
+        self._slots = asyncio.Semaphore(self.size)
+        self._write_lock = asyncio.Lock()
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn._conn.close()
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+                                       cached_statements=256)
+        for name, value in self.pragmas.items():
+            await conn.execute(f"PRAGMA {name} = {value}")
+        return AsyncSQLiteConnection(conn, self.instruments, self._write_lock)
+
+    async def _acquire(self):
+        await self._slots.acquire()
+        try:
+            return self._idle.pop() if self._idle else await self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _release(self, conn):
+        try:
+            await conn.rollback()
+            self._idle.append(conn)
+        except sqlite3.Error:
+            await conn._conn.close()
+        finally:
+            self._slots.release()
+
+    is_duplicate_key = staticmethod(storage.is_duplicate_key)
+    is_missing_table = staticmethod(storage.is_missing_table)
+    is_deadlock = staticmethod(storage.is_deadlock)
+
+
+def create_backend(name, mysql_config, sqlite_path, size, timeout, instruments):
+    if name == 'mysql':
+        return AsyncMySQLBackend(mysql_config, size, timeout, instruments)
+    if name == 'sqlite':
+        return AsyncSQLiteBackend(sqlite_path, size, timeout, instruments)
+    raise ValueError(f"Unknown DB_BACKEND {name!r}, expected 'mysql' or 'sqlite'")
@@ -0,0 +1,89 @@
+"""
+行转换与 JSON 编码的微基准：对比旧的 dict 行 + 逐值 isinstance 循环 + 标准库 json，
+和 event_queries 里按列类型预编译的转换器 + orjson。不需要数据库。
+
+用法:
+    python bench/bench_row_serialization.py --rows 1000 --repeat 50
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from event_queries import EVENT_COLUMNS, EVENT_ROW, OrjsonProvider  # noqa: E402
+
+
+def make_rows(count):
+    base = datetime(2024, 1, 1, 9, 0, 0)
+    rows = []
+    for i in range(count):
+        started = base + timedelta(minutes=i)
+        rows.append((
+            i + 1, f"Event {i}", "Some description text" if i % 3 else None,
+            base, started, "alice" if i % 2 else None, 1, i % 2,
+            i % 2, Decimal(i * 37) / Decimal(7),
+            started if i % 2 else None, started + timedelta(seconds=30),
+        ))
+    return rows
+
+
+def legacy_convert(rows):
+    # What every route used to do with dictionary cursor rows
+    names = [name for name, _ in EVENT_COLUMNS]
+    events = [dict(zip(names, row)) for row in rows]  # dictionary=True cursor
+    for event in events:
+        for key, value in event.items():
+            if isinstance(value, datetime):
+                event[key] = value.isoformat()
+            if isinstance(value, Decimal):
+                event[key] = float(value)
+    return events
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    app = Flask(__name__)
+    stdlib_json = DefaultJSONProvider(app)
+    fast_json = OrjsonProvider(app) if OrjsonProvider else stdlib_json
+    if OrjsonProvider is None:
+        print("orjson is not installed, the encoder comparison uses the stdlib provider on both sides")
+
+    assert json.loads(stdlib_json.dumps(legacy_convert(rows))) == json.loads(fast_json.dumps(EVENT_ROW.many(rows)))
+
+    converted = EVENT_ROW.many(rows)
+    results = [
+        ("convert: dict rows + isinstance loop", timed(lambda: legacy_convert(rows), args.repeat)),
+        ("convert: precompiled RowConverter", timed(lambda: EVENT_ROW.many(rows), args.repeat)),
+        ("encode: stdlib json provider", timed(lambda: stdlib_json.dumps(converted), args.repeat)),
+        ("encode: orjson provider", timed(lambda: fast_json.dumps(converted), args.repeat)),
+        ("total before", timed(lambda: stdlib_json.dumps(legacy_convert(rows)), args.repeat)),
+        ("total after", timed(lambda: fast_json.dumps(EVENT_ROW.many(rows)), args.repeat)),
+    ]
+    print(f"{args.rows} rows, best of {args.repeat}")
+    for label, seconds in results:
+        print(f"  {label:<40} {seconds * 1e6 / args.rows:8.3f} us/row")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,518 @@
+"""
+存储后端行为检查：通过 Flask test client 走一遍主要接口（增删改查、开始/停止、批量日志、分页、
+报表、导出、缓存），断言返回结果。同一个脚本分别在两个后端上运行，结果应当一致。
+
+MySQL 需要一个可写的测试库；SQLite 默认使用临时文件。用法:
+    DB_BACKEND=sqlite python bench/check_backend.py
+    DB_BACKEND=mysql python bench/check_backend.py
+读写分离另外用 DB_REPLICAS 指向副本运行（SQLite 可以只读打开同一个文件）:
+    DB_BACKEND=sqlite SQLITE_PATH=/tmp/check.db DB_REPLICAS=/tmp/check.db python bench/check_backend.py
+"""
+import os
+import sys
+import gzip
+import json
+import sqlite3
+import asyncio
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+if os.environ.get('DB_BACKEND', 'mysql').lower() == 'sqlite' and 'SQLITE_PATH' not in os.environ:
+    os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='event_logger_check_'), 'check.db')
+
+import app as event_app  # noqa: E402
+import db_pool  # noqa: E402
+
+failures = []
+
+
+def decompress(response):
+    """按 Content-Encoding 解码响应体"""
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'br':
+        return event_app.compression.brotli.decompress(response.get_data())
+    if encoding == 'gzip':
+        return gzip.decompress(response.get_data())
+    return response.get_data()
+
+
+def check(condition, message):
+    if not condition:
+        failures.append(message)
+        print(f"  FAIL {message}")
+
+
+async def _check_async_variant(async_app, client, tag):
+    event_id = client.post('/api/events', json={"event_name": f"{tag} async",
+                                                "responsible_person": f'{tag}-p4'}).get_json()['event_id']
+    check(async_app.asgi_app.handles('/api/events', 'GET') and not async_app.asgi_app.handles('/api/events', 'POST'),
+          "async dispatcher")
+    async with async_app.quart_app.test_app() as test_app:
+        aclient = test_app.test_client()
+        for path in (f'/api/events?search_name={tag}&limit=3&sort_by=name&sort_order=ASC',
+                     f'/api/events?search_person={tag}-p1&paginate=cursor&limit=1&include_total=true',
+                     '/api/events?limit=5&fields=event_id,event_status', f'/api/events/{event_id}',
+                     '/api/events/999999999', '/api/dashboard', '/api/persons?with_stats=true', '/api/persons'):
+            # Empty both caches, each side runs its own queries (the async one its COUNT and page concurrently)
+            event_app._events_changed([event_id], membership=True)
+            response = await aclient.get(path)
+            body = await response.get_json()
+            event_app._events_changed([event_id], membership=True)
+            expected = client.get(path)
+            check(response.status_code == expected.status_code and body == expected.get_json(),
+                  f"async {path}: {response.status_code} {body}")
+
+        queued = bool(event_app.event_log_queue)
+        response = await aclient.post(f'/api/events/{event_id}/log', json={"log_type": 1})
+        body = await response.get_json()
+        check(response.status_code == (202 if queued else 200) and body['statistics']['event_status'] == 1,
+              f"async start {response.status_code} {body}")
+        if event_app.read_router.enabled:
+            import replicas
+            check(replicas.LAST_WRITE_COOKIE in response.headers.get('Set-Cookie', ''), "async write sets the cookie")
+        if not queued:
+            check((await aclient.post(f'/api/events/{event_id}/log', json={"log_type": 1})).status_code == 409,
+                  "async start running event")
+        check((await aclient.post(f'/api/events/{event_id}/log', json={"log_type": 2})).status_code == 400,
+              "async invalid log_type")
+        check((await aclient.post('/api/events/999999999/log', json={"log_type": 1})).status_code == 404,
+              "async log missing event")
+        response = await aclient.post(f'/api/events/{event_id}/log', json={"log_type": 0})
+        check(response.status_code == (202 if queued else 200), f"async stop {response.status_code}")
+        if queued:
+            event_app.event_log_queue.flush()
+        detail = client.get(f'/api/events/{event_id}').get_json()
+        check(detail['event_status'] == 0 and detail['last_stop_time'], f"async logs committed {detail}")
+        p4 = [row for row in client.get('/api/persons?with_stats=true').get_json()
+              if row['responsible_person'] == f'{tag}-p4']
+        check(p4 and p4[0]['running_count'] == 0 and p4[0]['event_count'] == 1, f"async person summary {p4}")
+
+    stream = event_app.event_broker.subscribe_async()
+    check(await stream.__anext__() == "retry: 3000\n\n", "async stream retry")
+    threading.Timer(0.05, event_app.event_broker.publish, ('status', {"event_id": event_id})).start()
+    chunk = await asyncio.wait_for(stream.__anext__(), 5)
+    check(f'"event_id":{event_id}' in chunk, f"async stream wakes on publish {chunk!r}")
+    await stream.aclose()
+
+
+def check_async_variant(client, tag):
+    """async_app 的路由与 Flask 路由返回相同的结果；没有安装 quart / hypercorn / 异步驱动时跳过"""
+    try:
+        import async_app
+    except (ImportError, RuntimeError) as err:
+        print(f"  skip async variant: {err}")
+        return
+    asyncio.run(_check_async_variant(async_app, client, tag))
+
+
+def check_sqlite_dialect():
+    """storage.translate_sql 的每种改写（小写写法）在内存 SQLite 上执行，与后端无关"""
+    storage = event_app.storage
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    conn.execute("CREATE TABLE person_summary (responsible_person TEXT PRIMARY KEY, event_count INTEGER)")
+
+    def run(sql, params=()):
+        statement = storage.translate_sql(sql)
+        return statement, conn.execute(statement.sql, params).fetchall()
+
+    for sql, expected in (("select if(1 > 0, 'yes', 'no')", 'yes'),
+                          ("select If(%s = 1, 'yes', 'no')", 'no'),
+                          ("select greatest(%s, 3)", 3),
+                          ("select char_length('事件')", 2),
+                          ("select date_add('2024-02-28 10:00:00', interval 2 day)", '2024-03-01 10:00:00'),
+                          ("select timestampdiff(microsecond, '2024-01-01 00:00:00', '2024-01-01 00:01:30') / 1000000",
+                           90.0)):
+        statement, rows = run(sql, (2,) if '%s' in sql else ())
+        value = rows[0][0]
+        check(value == expected or isinstance(expected, float) and abs(value - expected) < 1e-3,
+              f"translate {sql!r}: {statement.sql!r} -> {value!r}")
+    for sql in ("select event_count from person_summary where responsible_person = %s for update",
+                "select event_count from person_summary where responsible_person = %s lock in share mode"):
+        statement, rows = run(sql, ('nobody',))
+        check(statement.writes and rows == [] and 'update' not in statement.sql.lower().split('where')[1]
+              and 'share' not in statement.sql.lower(), f"translate locking read {statement.sql!r}")
+    upsert = ("insert into person_summary (responsible_person, event_count) values (%s, %s) "
+              "on duplicate key update event_count = event_count + values(event_count)")
+    for _ in range(2):
+        statement, _rows = run(upsert, ('p', 2))
+    check(statement.writes and conn.execute("SELECT event_count FROM person_summary").fetchall() == [(4,)],
+          f"translate upsert {statement.sql!r}")
+    conn.close()
+
+
+def main():
+    client = event_app.app.test_client()
+    tag = datetime.now().strftime('check-%H%M%S%f')
+    print(f"backend={event_app.storage_backend.name} tag={tag}")
+
+    # --- CRUD ---
+    created = {}
+    for key, person in (('a', f'{tag}-p1'), ('b', None), ('c', f'{tag}-p1')):
+        response = client.post('/api/events', json={"event_name": f"{tag} {key}", "responsible_person": person})
+        check(response.status_code == 201, f"create {key}: {response.status_code}")
+        created[key] = response.get_json()
+    a, b, c = (created[key]['event_id'] for key in 'abc')
+    check(created['a']['event_status'] == 0 and created['a']['total_duration_seconds'] == 0, "new event stats")
+    check(isinstance(created['a']['create_time'], str), "create_time serialized")
+
+    response = client.put(f'/api/events/{a}', json={"event_mark_status": 1, "event_desc": "marked"})
+    check(response.status_code == 200 and response.get_json()['event_mark_status'] == 1, "update mark")
+    check(client.put('/api/events/999999999', json={"event_desc": "x"}).status_code == 404, "update missing")
+    check(client.get('/api/events/999999999').status_code == 404, "detail missing")
+
+    # --- Filters ---
+    def listed(query):
+        body = client.get(f'/api/events?limit=100&search_name={tag}&{query}').get_json()
+        return [event['event_id'] for event in body['events']], body['pagination']
+
+    ids, pagination = listed('sort_by=create_time&sort_order=ASC')
+    check(ids == [a, b, c] and pagination['total_items'] == 3, f"search_name {ids}")
+    check(listed(f'search_person={tag}-p1&sort_by=create_time')[0] == [c, a], "search_person")
+    ids, _ = listed('')
+    check(sorted(ids) == sorted([a, b, c]) and ids[0] in (a, b, c), "search_name ranked by relevance")
+    suggested = client.get(f'/api/events/suggest?q={tag}&limit=20').get_json()
+    check(sorted(event['event_id'] for event in suggested) == sorted([a, b, c]), f"suggest {suggested}")
+    check(client.put(f'/api/events/{c}', json={"event_name": f"{tag} c renamed"}).status_code == 200, "rename")
+    check([event['event_id'] for event in client.get(f'/api/events?search_name={tag} c ren').get_json()['events']] == [c],
+          "search finds the new name")
+    check(b in listed('search_person=__unassigned__')[0], "unassigned filter")
+    today = date.today().isoformat()
+    check(len(listed(f'search_created_after={today}&search_created_before={today}')[0]) == 3, "created range")
+    check(listed('search_created_before=2000-01-01')[0] == [], "created before")
+
+    # --- Start / stop ---
+    check(client.post(f'/api/events/{a}/log', json={"log_type": 1}).status_code in (200, 202), "start a")
+    check(client.post(f'/api/events/{a}/log', json={"log_type": 1}).status_code == 409, "start a twice")
+    response = client.post(f'/api/events/{a}/log', json={"log_type": 0})
+    stats = response.get_json()['statistics']
+    check(response.status_code in (200, 202) and stats['event_status'] == 0 and stats['total_duration_seconds'] >= 0,
+          f"stop a {stats}")
+    check(client.post(f'/api/events/{a}/log', json={"log_type": 0}).status_code in (200, 202), "stop a twice")
+    if not event_app.event_log_queue:
+        # The deadlock victim of two concurrent first starts (InnoDB) is retried, simulated here on any backend
+        update, deadlocks = event_app.update_event_statistics, []
+        def deadlock_once(*args):
+            if not deadlocks:
+                deadlocks.append(args)
+                raise event_app.mysql.connector.errors.InternalError(msg="Deadlock found", errno=1213)
+            return update(*args)
+        fresh = client.post('/api/events', json={"event_name": "deadlock check"}).get_json()['event_id']
+        event_app.update_event_statistics = deadlock_once
+        try:
+            response = client.post(f'/api/events/{fresh}/log', json={"log_type": 1})
+        finally:
+            event_app.update_event_statistics = update
+        check(response.status_code == 200 and deadlocks and response.get_json()['statistics']['event_status'] == 1,
+              f"deadlock retried {response.status_code}")
+        # A connection that reports itself dropped still goes back to the pool, release() discards broken ones
+        in_use = event_app.db_pool.stats()['in_use']
+        is_connected = db_pool.PooledConnection.is_connected
+        db_pool.PooledConnection.is_connected = lambda self: False
+        try:
+            for log_type in (0, 1, 0):
+                client.post(f'/api/events/{fresh}/log', json={"log_type": log_type})
+        finally:
+            db_pool.PooledConnection.is_connected = is_connected
+        check(event_app.db_pool.stats()['in_use'] == in_use, f"log action releases its connection {event_app.db_pool.stats()}")
+        client.delete(f'/api/events/{fresh}')
+
+    # --- Batch with explicit times: exact durations ---
+    start = datetime.now().replace(microsecond=0) - timedelta(hours=2)
+    response = client.post('/api/events/logs/batch', json=[
+        {"event_id": c, "log_type": 1, "log_time": start.isoformat()},
+        {"event_id": c, "log_type": 0, "log_time": (start + timedelta(seconds=90)).isoformat()},
+        {"event_id": c, "log_type": 1, "log_time": (start + timedelta(seconds=100)).isoformat()},
+        {"event_id": c, "log_type": 0, "log_time": (start + timedelta(seconds=130.5)).isoformat()},
+    ])
+    check(response.status_code == 200, f"batch {response.status_code} {response.get_data(as_text=True)[:200]}")
+    detail = client.get(f'/api/events/{c}').get_json()
+    check(abs(detail['total_duration_seconds'] - 120.5) < 0.01, f"batch duration {detail['total_duration_seconds']}")
+    event_logs = client.get(f'/api/events/{c}/logs?from={start.isoformat()}&limit=3').get_json()
+    check([log['log_type'] for log in event_logs['logs']] == [1, 0, 1] and event_logs['has_more'],
+          f"event logs {event_logs}")
+    check(client.get('/api/events/999999999/logs').status_code == 404, "event logs missing")
+    report = client.get('/api/analytics/sessions?group_by=event&limit=500').get_json()
+    group = next((group for group in report['groups'] if group['key'] == c), None)
+    check(group is not None and group['count'] == 2 and abs(group['p50_seconds'] - 60.25) < 0.01,
+          f"session analytics {group}")
+    curve = client.get(f'/api/analytics/concurrency?from={start.isoformat()}&to={(start + timedelta(seconds=120)).isoformat()}'
+                       '&step=60').get_json()
+    check([point['peak'] >= 1 for point in curve['points']] == [True, True], f"concurrency {curve}")
+
+    # --- Delete stops a running event ---
+    check(client.post(f'/api/events/{b}/log', json={"log_type": 1}).status_code in (200, 202), "start b")
+    check(client.delete(f'/api/events/{b}').status_code == 200, "delete b")
+    detail = client.get(f'/api/events/{b}').get_json()
+    check(detail['event_del_status'] == 0 and detail['event_status'] == 0, f"deleted b stopped {detail}")
+    check(b not in listed('')[0], "deleted hidden")
+    check(b in listed('show_deleted=true')[0], "show_deleted")
+
+    # --- Cursor pagination matches offset pagination ---
+    for sort_by in ('name', 'duration', 'status', 'person', 'create_time'):
+        expected, _ = listed(f'sort_by={sort_by}&sort_order=DESC&show_deleted=true')
+        seen = []
+        body = client.get(f'/api/events?limit=1&paginate=cursor&search_name={tag}&show_deleted=true'
+                          f'&sort_by={sort_by}&sort_order=DESC').get_json()
+        while True:
+            seen += [event['event_id'] for event in body['events']]
+            token = body['pagination']['next_cursor']
+            if not token or len(seen) > 10:
+                break
+            body = client.get(f'/api/events?limit=1&search_name={tag}&show_deleted=true&cursor={token}').get_json()
+        check(seen == expected, f"cursor walk {sort_by}: {seen} != {expected}")
+    # The cursor is bound to the filters, not to the plan of the name search
+    token = client.get(f'/api/events?limit=1&paginate=cursor&search_name={tag}').get_json()['pagination']['next_cursor']
+    search_condition = event_app.name_search.search_condition
+    event_app.name_search.search_condition = lambda term, conn=None: ("1 = 1", []) # As if the grams became too common
+    try:
+        response = client.get(f'/api/events?limit=1&search_name={tag}&cursor={token}')
+    finally:
+        event_app.name_search.search_condition = search_condition
+    check(response.status_code == 200, f"cursor survives a plan change {response.status_code}")
+
+    # --- Dashboard, persons, caching ---
+    response = client.get('/api/dashboard')
+    check(a in [event['event_id'] for event in response.get_json()], "dashboard has marked event")
+    etag = response.headers.get('ETag')
+    check(client.get('/api/dashboard', headers={'If-None-Match': etag}).status_code == 304, "dashboard 304")
+    event_app.response_cache.clear() # As if the entry expired: writes of other processes must show up again
+    check(client.get('/api/dashboard', headers={'If-None-Match': etag}).status_code == 200, "dashboard 200 after expiry")
+    check(f'{tag}-p1' in client.get('/api/persons').get_json(), "persons")
+
+    # --- Field projection and compression ---
+    body = client.get(f'/api/events?search_name={tag}&show_deleted=true'
+                      f'&fields=event_status,total_duration_seconds').get_json()
+    check([sorted(event) for event in body['events']] == [['event_id', 'event_status', 'total_duration_seconds']] * 3,
+          f"fields projection {body['events'][:1]}")
+    body = client.get(f'/api/events?search_name={tag}&paginate=cursor&limit=1&fields=event_name').get_json()
+    check(body['pagination']['next_cursor'] and sorted(body['events'][0]) == ['event_id', 'event_name'],
+          "fields projection with cursor")
+    check(client.get('/api/events?fields=event_id,password').status_code == 400, "fields unknown")
+    dashboard = client.get('/api/dashboard?fields=event_mark_status').get_json()
+    check(dashboard and all(sorted(event) == ['event_id', 'event_mark_status'] for event in dashboard),
+          f"dashboard projection {dashboard[:1]}")
+    response = client.get(f'/api/events?search_name={tag}&limit=100', headers={'Accept-Encoding': 'gzip'})
+    if event_app.COMPRESS_MIN_SIZE and response.content_length > event_app.COMPRESS_MIN_SIZE:
+        check(response.headers.get('Content-Encoding') in ('gzip', 'br') and 'Accept-Encoding' in response.headers.get('Vary', ''),
+              "compressed response")
+        check(json.loads(decompress(response))['events'], "compressed body decodes")
+        # Relative weights decide, not the server's preference for br
+        response = client.get(f'/api/events?search_name={tag}&limit=100', headers={'Accept-Encoding': 'br;q=0.5, gzip'})
+        check(response.headers.get('Content-Encoding') == 'gzip', "q weights prefer gzip")
+        if event_app.compression.brotli:
+            response = client.get(f'/api/events?search_name={tag}&limit=100',
+                                  headers={'Accept-Encoding': 'gzip;q=0.5, br'})
+            check(response.headers.get('Content-Encoding') == 'br' and json.loads(decompress(response))['events'],
+                  "q weights prefer br")
+    check('Content-Encoding' not in client.get(f'/api/events?search_name={tag}').headers, "identity without Accept-Encoding")
+
+    # --- Report and export ---
+    report = client.get(f'/api/reports/durations?group_by=event&event_id={c}&from={start.date().isoformat()}'
+                        f'&to={today}').get_json()
+    if event_app.DAILY_ROLLUPS:
+        check(report['rows'] and abs(report['total_duration_seconds'] - 120.5) < 0.01, f"report {report}")
+        # Running sessions add their days and events once: x has a rollup day yesterday and runs since then,
+        # y and z started at midnight (equal totals, ordered by event_id)
+        midnight = datetime.combine(date.today(), datetime.min.time())
+        yesterday = midnight - timedelta(days=1)
+        x, y, z = (client.post('/api/events', json={"event_name": f"report running {key}", "responsible_person": f'{tag}-p5'})
+                   .get_json()['event_id'] for key in 'xyz')
+        client.post('/api/events/logs/batch', json=[
+            {"event_id": x, "log_type": 1, "log_time": (yesterday + timedelta(hours=10)).isoformat()},
+            {"event_id": x, "log_type": 0, "log_time": (yesterday + timedelta(hours=10, minutes=1)).isoformat()},
+            {"event_id": x, "log_type": 1, "log_time": (yesterday + timedelta(hours=23)).isoformat()},
+            {"event_id": y, "log_type": 1, "log_time": midnight.isoformat()},
+            {"event_id": z, "log_type": 1, "log_time": midnight.isoformat()},
+        ])
+        def running_report(group_by):
+            return client.get(f'/api/reports/durations?group_by={group_by}&person={tag}-p5'
+                              f'&from={yesterday.date().isoformat()}&to={today}').get_json()['rows']
+        rows = running_report('event')
+        check([row['event_id'] for row in rows] == [x, y, z] and [row['active_days'] for row in rows] == [2, 1, 1],
+              f"report running by event {rows}")
+        rows = running_report('person')
+        check(len(rows) == 1 and rows[0]['event_count'] == 3, f"report running by person {rows}")
+        rows = running_report('day')
+        check([row['event_count'] for row in rows] == [1, 3], f"report running by day {rows}")
+        for event_id in (x, y, z):
+            client.delete(f'/api/events/{event_id}')
+    lines = client.get(f'/api/export/logs?format=ndjson&search_name={tag}&show_deleted=true').get_data(as_text=True)
+    logs = [json.loads(line) for line in lines.splitlines()]
+    check(len(logs) == 9, f"export logs {len(logs)}") # a: 3, b: start + stop on delete, c: 4
+    csv_text = client.get(f'/api/export/events?search_name={tag}&show_deleted=true').get_data(as_text=True)
+    check(len(csv_text.strip().splitlines()) == 4, "export events csv")
+    in_use = event_app.db_pool.stats()['in_use']
+    client.head(f'/api/export/events?search_name={tag}').close() # HEAD: the body generator never starts
+    check(event_app.db_pool.stats()['in_use'] == in_use, "export releases an unread stream")
+
+    # --- Bulk operations ---
+    bulk = [client.post('/api/events', json={"event_name": f"{tag} bulk {i}"}).get_json()['event_id'] for i in range(3)]
+    d, e, f = bulk
+
+    def bulk_op(operation, event_ids, **extra):
+        response = client.post('/api/events/bulk', json={"operation": operation, "event_ids": event_ids, **extra})
+        body = response.get_json()
+        return response.status_code, body, {result['event_id']: result for result in body.get('results', [])}
+
+    status, body, results = bulk_op('mark', [d, e, 999999999, d])
+    check(status == 200 and body['changed'] == 2 and results[999999999]['status'] == 404, f"bulk mark {body}")
+    check(bulk_op('mark', [d])[2][d]['result'] == 'unchanged', "bulk mark unchanged")
+    dashboard_ids = [event['event_id'] for event in client.get('/api/dashboard').get_json()]
+    check(d in dashboard_ids and e in dashboard_ids, "bulk mark on dashboard")
+    check(bulk_op('reassign', [d, e], responsible_person=f'{tag}-p2')[1]['changed'] == 2, "bulk reassign")
+    check(sorted(listed(f'search_person={tag}-p2')[0]) == sorted([d, e]), "bulk reassign filter")
+    status, body, results = bulk_op('start', [d, e])
+    check(status == 200 and body['statistics'][str(d)]['event_status'] == 1, f"bulk start {body}")
+    check(bulk_op('start', [d])[2][d]['status'] == 409, "bulk start running")
+    check(bulk_op('stop', [e, f])[2][f]['result'] == 'unchanged', "bulk stop stopped")
+    status, body, results = bulk_op('delete', [d, e])
+    check(status == 200 and body['changed'] == 2 and list(body['statistics']) == [str(d)], f"bulk delete {body}")
+    detail = client.get(f'/api/events/{d}').get_json()
+    check(detail['event_del_status'] == 0 and detail['event_status'] == 0, f"bulk delete stops {detail}")
+    check([log['log_type'] for log in client.get(f'/api/events/{d}/logs').get_json()['logs']] == [1, 0],
+          "bulk delete writes the stop log")
+    check(bulk_op('start', [d])[2][d]['status'] == 400, "bulk start deleted")
+    check(client.post('/api/events/bulk', json={"operation": "explode", "event_ids": [d]}).status_code == 400,
+          "bulk invalid operation")
+
+    # --- Person summary ---
+    def person_stats(person):
+        if event_app.event_log_queue:
+            event_app.event_log_queue.flush()
+        rows = client.get('/api/persons?with_stats=true').get_json()
+        return next((row for row in rows if row['responsible_person'] == person), None)
+
+    expected_total = sum(client.get(f'/api/events/{event_id}').get_json()['total_duration_seconds'] for event_id in (a, c))
+    p1 = person_stats(f'{tag}-p1')
+    check(p1 and (p1['event_count'], p1['deleted_count'], p1['running_count']) == (2, 0, 0)
+          and abs(p1['total_duration_seconds'] - expected_total) < 0.01, f"person summary p1 {p1}")
+    p2 = person_stats(f'{tag}-p2')
+    check(p2 and (p2['event_count'], p2['deleted_count'], p2['total_duration_seconds']) == (0, 2, 0),
+          f"person summary deleted {p2}")
+    check(f'{tag}-p2' in client.get('/api/persons').get_json(), "persons keeps deleted events' persons")
+    check(client.put(f'/api/events/{c}', json={"responsible_person": f'{tag}-p3'}).status_code == 200, "reassign c")
+    client.post(f'/api/events/{c}/log', json={"log_type": 1})
+    p3 = person_stats(f'{tag}-p3')
+    check(p3 and p3['running_count'] == 1 and p3['total_duration_seconds'] >= 120.5, f"person summary reassign {p3}")
+    check(person_stats(f'{tag}-p1')['event_count'] == 1, "person summary reassign source")
+    client.post(f'/api/events/{c}/log', json={"log_type": 0})
+    check(person_stats(f'{tag}-p3')['running_count'] == 0, "person summary stop")
+    persons, differences = event_app.person_summary.check(event_app.storage_backend)
+    check(persons >= 3 and not differences, f"person summary consistent {differences[:3]}")
+
+    # --- Read replicas (only with DB_REPLICAS) ---
+    router = event_app.read_router
+    if router.enabled:
+        import replicas
+        reader = event_app.app.test_client() # No write cookie
+        # Distinct query strings, a response cache hit does not touch the database
+        check(reader.get(f'/api/events?search_name={tag}&limit=4').headers.get('X-Read-Source') == router.replicas[0].name,
+              "read from replica")
+        response = client.post('/api/events', json={"event_name": f"{tag} replica", "responsible_person": f'{tag}-p1'})
+        check(replicas.LAST_WRITE_COOKIE in response.headers.get('Set-Cookie', ''), "write sets the cookie")
+        new_id = response.get_json()['event_id']
+        response = client.get(f'/api/events/{new_id}')
+        check(response.status_code == 200 and response.headers.get('X-Read-Source') == 'primary',
+              f"read your writes {response.status_code} {response.headers.get('X-Read-Source')}")
+        # Pinned for the whole window even though the replica reports no lag
+        check(router.acquire(time.time() - router.window / 2)[2] == 'read_your_writes', "pinned for the window")
+        conn, _, reason = router.acquire(time.time() - router.window - 1)
+        check(reason == 'replica', "replica after the window")
+        conn.close()
+        before = time.time()
+        response = client.post(f'/api/events/{new_id}/log', json={"log_type": 1})
+        stamped = float(response.headers['Set-Cookie'].split(';')[0].split('=', 1)[1])
+        # Write-behind logs commit after the response, the window starts at the expected commit
+        check(stamped >= before + (event_app.LOG_QUEUE_FLUSH_INTERVAL if event_app.event_log_queue else 0),
+              "write time after the commit")
+        response = reader.get(f'/api/events?search_name={tag}&limit=3')
+        check(response.headers.get('X-Read-Source') != 'primary' and 'ETag' not in response.headers,
+              "replica read after a write is not cached")
+        for replica in router.replicas:
+            router.mark_down(replica, RuntimeError("check"))
+        check(reader.get(f'/api/events?search_name={tag}&limit=5').headers.get('X-Read-Source') == 'primary',
+              "fallback to primary")
+        for replica in router.replicas:
+            replica.down_until = 0.0
+        missing = replicas.create_router(
+            [('missing', event_app.storage.create_replica_backend(event_app.DB_BACKEND, dict(event_app.DB_CONFIG, port=1),
+                                                                  '/nonexistent/x.db', '/nonexistent/x.db:1'))],
+            lambda connect, wrapper: event_app.ConnectionPool(connect, size=1, timeout=0.1, cursor_wrapper=wrapper))
+        check(missing.acquire()[2] == 'fallback' and not missing.stats()[0]['available'], "broken replica skipped")
+        check(client.get('/api/db/pool').get_json()['replicas'][0]['available'], "replica stats")
+
+    # --- Write-behind queue (only with LOG_WRITE_MODE=write_behind) ---
+    queue = event_app.event_log_queue
+    if queue:
+        poisoned = client.post('/api/events', json={"event_name": f"{tag} poison"}).get_json()['event_id']
+        write_group, retries = queue.write_group, queue.max_retries
+        def fail(items):
+            raise ValueError("poison")
+        queue.write_group, queue.max_retries = fail, 1
+        try:
+            check(client.post(f'/api/events/{poisoned}/log', json={"log_type": 1}).status_code == 202, "queue poison")
+            check(queue.flush(timeout=10) and queue.stats()['set_aside'] == 1 and queue.set_aside[-1]['attempts'] == 2,
+                  f"poison batch set aside {queue.stats()}")
+        finally:
+            queue.write_group, queue.max_retries = write_group, retries
+        check(client.get(f'/api/events/{poisoned}').get_json()['event_status'] == 0, "set aside log not overlaid")
+        # The view entry found by submit() is trimmed before it takes the lock again: loaded again, not a 500
+        class VanishingView(dict):
+            def __contains__(self, key):
+                found = dict.__contains__(self, key)
+                if found and not self.vanished:
+                    self.vanished = True
+                    del self[key]
+                return found
+        vanishing = client.post('/api/events', json={"event_name": f"{tag} vanishing"}).get_json()['event_id']
+        check(client.post(f'/api/events/{vanishing}/log', json={"log_type": 1}).status_code == 202, "queue start")
+        with queue._lock:
+            queue._view = VanishingView(queue._view)
+            queue._view.vanished = False
+        try:
+            response = client.post(f'/api/events/{vanishing}/log', json={"log_type": 0})
+        finally:
+            with queue._lock:
+                view, queue._view = queue._view, dict(queue._view)
+        check(response.status_code == 202 and view.vanished and response.get_json()['statistics']['event_status'] == 0,
+              f"view entry trimmed during submit {response.status_code}")
+        flush = queue.flush
+        queue.flush = lambda timeout=5.0: False
+        try:
+            check(client.delete(f'/api/events/{poisoned}').status_code == 503, "delete waits for the queue")
+        finally:
+            queue.flush = flush
+
+    # --- SQL dialect (storage.translate_sql) ---
+    check_sqlite_dialect()
+
+    # --- Async variant (async_app) ---
+    check_async_variant(client, tag)
+
+    # --- Metrics ---
+    with event_app.app.test_request_context():
+        check(event_app.handle_pool_exhausted(db_pool.PoolExhaustedError(0.1))[1] == 503, "pool exhausted 503")
+        check(event_app.handle_log_queue_full(event_app.LogQueueFullError("check"))[1] == 503, "log queue full 503")
+    text = client.get('/metrics').get_data(as_text=True)
+    check(text.startswith('# HELP'), "metrics format")
+    if event_app.METRICS_ENABLED:
+        check('http_requests_total{endpoint="get_events",method="GET",status="200"}' in text, "metrics requests")
+        check('db_query_duration_seconds_count{query="SELECT event_info' in text, "metrics query shapes")
+        check('db_pool_acquire_seconds_count' in text, "metrics pool acquire")
+        check('errors_total{type="PoolExhaustedError"}' in text and 'errors_total{type="LogQueueFullError"}' in text,
+              "metrics 503 errors")
+    else:
+        # The slow-query log (SLOW_QUERY_SECONDS) still wraps cursors, the histograms stay empty
+        check('db_query_duration_seconds_count' not in text and 'db_pool_acquire_seconds_count' not in text
+              and 'errors_total{' not in text, "metrics disabled")
+
+    print("OK" if not failures else f"FAILED ({len(failures)})")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+同步 (Flask, 线程) 与异步 (async_app, Hypercorn + aiomysql / aiosqlite) 两个版本的吞吐量对比。
+对两个已经启动的服务用 run_benchmarks.py 的场景和逐级增加的并发客户端数压测，输出 rps 和 p95 延迟的对照表。
+并发数超过同步服务的线程数之后，同步版本的吞吐量不再增长、延迟随排队上升，异步版本应继续增长直到数据库饱和。
+SQLite 的写入本来就是串行的，异步版本只能缩短排队的尾延迟，提高不了开始/停止的吞吐量。
+
+两个服务连同一个数据库（先用 bench/seed_data.py 生成数据）。Hypercorn 也能直接跑 Flask 应用
+（WSGI 请求在默认线程池里执行），两边只差在路由是否异步，例如:
+    hypercorn -w 1 -b 127.0.0.1:5000 app:app
+    hypercorn -w 1 -b 127.0.0.1:5001 async_app:asgi_app
+    python bench/compare_async.py --sync-url http://127.0.0.1:5000 --async-url http://127.0.0.1:5001 --clients 8 32 128
+单个服务也可以用 run_benchmarks.py 压测并和另一个的基线对比:
+    python bench/run_benchmarks.py --base-url http://127.0.0.1:5000 --clients 32 --save-baseline sync.json
+    python bench/run_benchmarks.py --base-url http://127.0.0.1:5001 --clients 32 --compare sync.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_benchmarks import Context, HttpClient, SCENARIOS, STEP_SCENARIOS, run_scenario  # noqa: E402
+
+DEFAULT_SCENARIOS = ['events_first_page', 'events_filter_person', 'events_sort_duration', 'event_detail', 'log_toggle']
+
+
+def measure(base_url, names, clients, duration, warmup, seed):
+    make_client = lambda: HttpClient(base_url)  # noqa: E731
+    ctx = Context(make_client())
+    results = {}
+    for name in names:
+        if warmup > 0:
+            run_scenario(name, make_client, ctx, clients, warmup, 0, seed + 1)
+        for label, summary in run_scenario(name, make_client, ctx, clients, duration, 0, seed).items():
+            if label != 'log_setup':
+                results[label] = summary
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sync-url', required=True, help="running Flask server (app:app)")
+    parser.add_argument('--async-url', required=True, help="running ASGI server (async_app:asgi_app)")
+    parser.add_argument('--clients', type=int, nargs='+', default=[8, 32, 128], help="concurrency levels")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per scenario and level")
+    parser.add_argument('--warmup', type=float, default=1.0)
+    parser.add_argument('--only', nargs='*', help="scenario names (default: %s)" % ' '.join(DEFAULT_SCENARIOS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write results as JSON")
+    args = parser.parse_args()
+
+    names = args.only or DEFAULT_SCENARIOS
+    unknown = [name for name in names if name not in SCENARIOS and name not in STEP_SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+
+    report = {"created_at": time.strftime('%Y-%m-%dT%H:%M:%S'), "duration": args.duration, "levels": {}}
+    print(f"{'scenario':<22} {'clients':>7} {'sync rps':>10} {'async rps':>10} {'ratio':>7} "
+          f"{'sync p95':>10} {'async p95':>10} {'errors':>8}")
+    for clients in args.clients:
+        sync_results = measure(args.sync_url, names, clients, args.duration, args.warmup, args.seed)
+        async_results = measure(args.async_url, names, clients, args.duration, args.warmup, args.seed)
+        report["levels"][clients] = {"sync": sync_results, "async": async_results}
+        for label in sync_results:
+            sync, other = sync_results[label], async_results.get(label)
+            if not other:
+                continue
+            ratio = other['throughput_rps'] / sync['throughput_rps'] if sync['throughput_rps'] else 0.0
+            print(f"{label:<22} {clients:>7} {sync['throughput_rps']:>10.1f} {other['throughput_rps']:>10.1f} "
+                  f"{ratio:>6.2f}x {sync['p95_ms']:>8.1f}ms {other['p95_ms']:>8.1f}ms "
+                  f"{sync['errors']:>3}/{other['errors']:<4}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""
+接口基准测试：并发客户端请求各个路由，输出 p50/p95/p99 延迟和吞吐量，并可与保存的基线对比。
+
+默认在进程内通过 Flask test client 调用（不经过网络），数据库使用 app 当前配置的存储后端（DB_BACKEND=sqlite 时不需要数据库服务）；
+也可以用 --base-url 压测一个已经启动的服务。先用 bench/seed_data.py 生成数据。用法:
+    python bench/run_benchmarks.py --clients 8 --duration 10 --save-baseline bench/baseline.json
+    python bench/run_benchmarks.py --clients 8 --duration 10 --compare bench/baseline.json
+    python bench/run_benchmarks.py --only events_ dashboard --no-response-cache
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+# --- Clients ---
+class InProcessClient:
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        response.get_data()
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                payload = response.read()
+                status = response.status
+        except urllib.error.HTTPError as err:
+            payload = err.read()
+            status = err.code
+        try:
+            return status, json.loads(payload) if payload else None
+        except ValueError:
+            return status, None
+
+
+# --- Scenarios ---
+class Context:
+    """压测开始前从接口读取的样本数据（事件 id、负责人、名称片段）"""
+
+    def __init__(self, client):
+        status, body = client.request('GET', '/api/events?limit=200&sort_by=create_time&sort_order=DESC')
+        if status != 200:
+            raise SystemExit(f"GET /api/events failed with {status}, is the database seeded?")
+        events = body['events']
+        if not events:
+            raise SystemExit("No events found, run bench/seed_data.py first")
+        self.event_ids = [event['event_id'] for event in events]
+        self.total_pages = (body['pagination'].get('total_pages') or 1)
+        self.name_terms = sorted({event['event_name'].split()[0] for event in events})
+        status, persons = client.request('GET', '/api/persons')
+        self.persons = persons if status == 200 and persons else ['__unassigned__']
+
+
+def _page_depth(ctx, rng, limit=20):
+    # total_pages above is for limit=200
+    return rng.randint(1, max(1, ctx.total_pages * 200 // limit))
+
+
+SCENARIOS = {
+    'events_first_page': lambda ctx, rng: ('GET', '/api/events?limit=20', None),
+    'events_deep_offset': lambda ctx, rng: ('GET', f'/api/events?limit=20&page={_page_depth(ctx, rng)}', None),
+    'events_cursor': lambda ctx, rng: ('GET', '/api/events?limit=20&paginate=cursor', None),
+    'events_filter_person': lambda ctx, rng: (
+        'GET', f'/api/events?limit=20&search_person={rng.choice(ctx.persons)}', None),
+    'events_search_name': lambda ctx, rng: (
+        'GET', f'/api/events?limit=20&search_name={rng.choice(ctx.name_terms)}', None),
+    'events_sort_name': lambda ctx, rng: ('GET', '/api/events?limit=20&sort_by=name&sort_order=ASC', None),
+    'events_sort_duration': lambda ctx, rng: ('GET', '/api/events?limit=20&sort_by=duration&sort_order=DESC', None),
+    'events_sort_status': lambda ctx, rng: ('GET', '/api/events?limit=20&sort_by=status&sort_order=DESC', None),
+    'events_created_range': lambda ctx, rng: (
+        'GET', '/api/events?limit=20&search_created_after=2000-01-01&search_created_before=2100-01-01', None),
+    'dashboard': lambda ctx, rng: ('GET', '/api/dashboard', None),
+    'persons': lambda ctx, rng: ('GET', '/api/persons', None),
+    'event_detail': lambda ctx, rng: ('GET', f'/api/events/{rng.choice(ctx.event_ids)}', None),
+}
+
+
+# Multi-step scenarios: called with per-client state, return the next (label, method, path, body)
+def crud_steps(ctx, rng, state):
+    # create -> update -> delete, then start over
+    event_id = state.pop('event_id', None)
+    if event_id is None:
+        return 'crud_create', 'POST', '/api/events', {"event_name": f"bench {rng.random():.6f}",
+                                                      "responsible_person": rng.choice(ctx.persons)}
+    if not state.pop('updated', False):
+        state['event_id'] = event_id
+        state['updated'] = True
+        return 'crud_update', 'PUT', f'/api/events/{event_id}', {"event_desc": "updated by benchmark"}
+    return 'crud_delete', 'DELETE', f'/api/events/{event_id}', None
+
+
+def log_toggle_step(ctx, rng, state):
+    # Each client toggles its own events, so 409s only come from real conflicts
+    owned = state.setdefault('owned', {})
+    if len(owned) < 4:
+        return 'log_setup', 'POST', '/api/events', {"event_name": f"bench log {rng.random():.6f}"}
+    event_id = rng.choice(list(owned))
+    log_type = 0 if owned[event_id] else 1
+    return 'log_toggle', 'POST', f'/api/events/{event_id}/log', {"log_type": log_type}
+
+
+STEP_SCENARIOS = {
+    'crud': crud_steps,
+    'log_toggle': log_toggle_step,
+}
+
+
+# --- Runner ---
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(latencies, statuses, elapsed):
+    latencies.sort()
+    count = len(latencies)
+    return {
+        "requests": count,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "errors": sum(count for status, count in statuses.items() if status >= 500),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def run_scenario(name, make_client, ctx, clients, duration, max_requests, seed):
+    """clients 个线程在 duration 秒内（或达到 max_requests）循环请求，按步骤标签分别统计"""
+    lock = threading.Lock()
+    latencies = {}
+    statuses = {}
+    issued = [0]
+    deadline = time.monotonic() + duration
+
+    def worker(worker_seed):
+        client = make_client()
+        rng = random.Random(worker_seed)
+        state = {}
+        local_latencies = {}
+        local_statuses = {}
+        while time.monotonic() < deadline:
+            with lock:
+                if max_requests and issued[0] >= max_requests:
+                    break
+                issued[0] += 1
+            if name in STEP_SCENARIOS:
+                label, method, path, body = STEP_SCENARIOS[name](ctx, rng, state)
+            else:
+                label = name
+                method, path, body = SCENARIOS[name](ctx, rng)
+            started = time.perf_counter()
+            status, payload = client.request(method, path, body)
+            elapsed = time.perf_counter() - started
+            local_latencies.setdefault(label, []).append(elapsed)
+            local_statuses.setdefault(label, Counter())[status] += 1
+
+            # Carry results over to the next step
+            if label == 'crud_create' and status == 201:
+                state['event_id'] = payload['event_id']
+            elif label == 'log_setup' and status == 201:
+                state['owned'][payload['event_id']] = False
+            elif label == 'log_toggle' and status in (200, 202):
+                event_id = int(path.split('/')[3])
+                state['owned'][event_id] = not state['owned'][event_id]
+        with lock:
+            for label, values in local_latencies.items():
+                latencies.setdefault(label, []).extend(values)
+                statuses.setdefault(label, Counter()).update(local_statuses[label])
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(seed * 1000 + i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    return {label: summarize(values, statuses[label], elapsed) for label, values in latencies.items()}
+
+
+def compare(results, baseline, threshold):
+    """和基线对比 p95 与吞吐量，返回超出阈值的回退项"""
+    regressions = []
+    print(f"\n{'scenario':<24} {'p95 ms':>18} {'rps':>20}")
+    for label, current in results.items():
+        base = baseline.get('results', {}).get(label)
+        if not base:
+            print(f"{label:<24} {'(no baseline)':>18}")
+            continue
+        p95_change = (current['p95_ms'] - base['p95_ms']) / base['p95_ms'] * 100 if base['p95_ms'] else 0.0
+        rps_change = ((current['throughput_rps'] - base['throughput_rps']) / base['throughput_rps'] * 100
+                      if base['throughput_rps'] else 0.0)
+        print(f"{label:<24} {base['p95_ms']:>8.2f} -> {current['p95_ms']:<8.2f} "
+              f"{base['throughput_rps']:>9.1f} -> {current['throughput_rps']:<9.1f} "
+              f"({p95_change:+.0f}% p95, {rps_change:+.0f}% rps)")
+        if p95_change > threshold or rps_change < -threshold:
+            regressions.append(label)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help="benchmark a running server instead of the in-process app")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients per scenario")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument('--requests', type=int, default=0, help="stop a scenario after this many requests")
+    parser.add_argument('--warmup', type=float, default=1.0, help="seconds of unmeasured warm-up per scenario")
+    parser.add_argument('--only', nargs='*', help="scenario name prefixes to run")
+    parser.add_argument('--no-response-cache', action='store_true',
+                        help="in-process only: disable the dashboard/persons/detail response cache")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write results as JSON")
+    parser.add_argument('--save-baseline', help="store results as the baseline file")
+    parser.add_argument('--compare', help="baseline file to compare against")
+    parser.add_argument('--threshold', type=float, default=15.0,
+                        help="percent p95 / throughput change that counts as a regression")
+    args = parser.parse_args()
+
+    if args.base_url:
+        make_client = lambda: HttpClient(args.base_url)  # noqa: E731
+    else:
+        if args.no_response_cache:
+            os.environ['RESPONSE_CACHE_TTL'] = '0'
+        import app as event_app
+        make_client = lambda: InProcessClient(event_app.app)  # noqa: E731
+
+    names = list(SCENARIOS) + list(STEP_SCENARIOS)
+    if args.only:
+        names = [name for name in names if any(name.startswith(prefix) for prefix in args.only)]
+
+    ctx = Context(make_client())
+    results = {}
+    for name in names:
+        if args.warmup > 0:
+            run_scenario(name, make_client, ctx, args.clients, args.warmup, 0, args.seed + 1)
+        scenario_results = run_scenario(name, make_client, ctx, args.clients, args.duration, args.requests, args.seed)
+        for label, summary in scenario_results.items():
+            results[label] = summary
+            print(f"{label:<24} n={summary['requests']:<7} {summary['throughput_rps']:>9.1f} rps  "
+                  f"p50={summary['p50_ms']:.2f}ms p95={summary['p95_ms']:.2f}ms p99={summary['p99_ms']:.2f}ms "
+                  f"errors={summary['errors']}")
+
+    report = {
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "target": args.base_url or "in-process",
+        "clients": args.clients,
+        "duration": args.duration,
+        "results": results,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {path}")
+
+    exit_code = 1 if any(summary['errors'] for summary in results.values()) else 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:.0f}%: {', '.join(regressions)}")
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+基准测试数据生成：按给定规模写入 event_info / event_statistics / event_logs（以及每日汇总表）。
+统计表由生成的日志重放得到，与日志保持一致；少量事件保持运行中状态。名称搜索索引在写入后整体重建。
+
+写入 app 当前配置的存储后端（本地 MySQL / MariaDB，或 DB_BACKEND=sqlite 的嵌入式数据库），缺失的表会自动创建。用法:
+    python bench/seed_data.py --events 10000 --logs 100000 --reset
+    python bench/seed_data.py --events 200000 --logs 10000000 --reset   # 大规模，约需数分钟
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as event_app  # noqa: E402
+import rollups  # noqa: E402
+import name_search  # noqa: E402
+from event_log_queue import fold_log_into_stats  # noqa: E402
+
+WORDS = ["deploy", "backup", "meeting", "review", "incident", "migration", "report", "training",
+         "audit", "release", "support", "design", "research", "cleanup", "monitoring", "planning"]
+MEAN_SESSION_SECONDS = 45 * 60
+MEAN_GAP_SECONDS = 6 * 3600
+RUNNING_RATIO = 0.02
+MARKED_RATIO = 0.05
+DELETED_RATIO = 0.03
+
+
+def generate_event_logs(rng, event_id, created, log_count, now):
+    """生成一个事件的开始/结束日志，返回 [(event_id, log_type, log_time), ...]"""
+    logs = []
+    moment = created + timedelta(seconds=rng.expovariate(1 / MEAN_GAP_SECONDS))
+    keep_running = rng.random() < RUNNING_RATIO
+    pairs = log_count // 2
+    # Squeeze the sessions into the time the event has existed
+    span = max(1.0, (now - moment).total_seconds())
+    scale = min(1.0, span / max(1.0, pairs * (MEAN_SESSION_SECONDS + MEAN_GAP_SECONDS)))
+    for _ in range(pairs):
+        start = moment
+        stop = start + timedelta(seconds=max(1.0, rng.expovariate(1 / MEAN_SESSION_SECONDS)) * scale)
+        if stop >= now:
+            break
+        logs.append((event_id, 1, start))
+        logs.append((event_id, 0, stop))
+        moment = stop + timedelta(seconds=rng.expovariate(1 / MEAN_GAP_SECONDS) * scale)
+    if keep_running and moment < now:
+        logs.append((event_id, 1, moment))
+    return logs
+
+
+def seed(args):
+    rng = random.Random(args.seed)
+    persons = [f"person_{i:03d}" for i in range(args.persons)]
+    now = datetime.now().replace(microsecond=0)
+    oldest = now - timedelta(days=args.days)
+    logs_per_event = args.logs / max(1, args.events)
+
+    backend = event_app.storage_backend
+    backend.ensure_schema()
+    conn = backend.connect()
+    cursor = conn.cursor()
+    try:
+        if args.reset:
+            for table in ('event_logs', 'event_statistics', 'event_info'):
+                cursor.execute(f"DELETE FROM {table}")
+            conn.commit()
+            event_app.event_log_archive.clear()
+        cursor.execute("SELECT COALESCE(MAX(event_id), 0) FROM event_info")
+        next_event_id = cursor.fetchone()[0] + 1
+
+        started = time.monotonic()
+        event_rows, stat_rows, log_rows = [], [], []
+        logs_written = 0
+
+        def flush(force=False):
+            nonlocal event_rows, stat_rows, log_rows, logs_written
+            if not force and len(log_rows) < args.batch and len(event_rows) < args.batch:
+                return
+            if event_rows:
+                cursor.executemany("""
+                    INSERT INTO event_info (event_id, event_name, event_desc, create_time, update_time,
+                                            responsible_person, event_del_status, event_mark_status)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, event_rows)
+            if stat_rows:
+                cursor.executemany("""
+                    INSERT INTO event_statistics (event_id, last_start_time, last_stop_time,
+                                                  total_duration_seconds, event_status)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, stat_rows)
+            for chunk_start in range(0, len(log_rows), args.batch):
+                cursor.executemany("INSERT INTO event_logs (event_id, log_type, log_time) VALUES (%s, %s, %s)",
+                                   log_rows[chunk_start:chunk_start + args.batch])
+            conn.commit()
+            logs_written += len(log_rows)
+            event_rows, stat_rows, log_rows = [], [], []
+            elapsed = time.monotonic() - started
+            print(f"  {logs_written} logs, {logs_written / elapsed if elapsed else 0:.0f} logs/s", end='\r')
+
+        for offset in range(args.events):
+            event_id = next_event_id + offset
+            created = oldest + timedelta(seconds=rng.uniform(0, (now - oldest).total_seconds()))
+            person = rng.choice(persons) if rng.random() > 0.1 else None
+            name = f"{rng.choice(WORDS)} {rng.choice(WORDS)} #{event_id}"
+            log_count = max(0, int(rng.gauss(logs_per_event, logs_per_event / 3)))
+            logs = generate_event_logs(rng, event_id, created, log_count, now)
+
+            state = {'last_start_time': None, 'last_stop_time': None,
+                     'total_duration_seconds': Decimal(0), 'event_status': 0}
+            for _, log_type, log_time in logs:
+                fold_log_into_stats(state, log_type, log_time)
+            deleted = rng.random() < DELETED_RATIO and state['event_status'] == 0
+            updated = logs[-1][2] if logs else created
+            event_rows.append((event_id, name, f"Generated by bench/seed_data.py ({len(logs)} logs)",
+                               created, updated, person, 0 if deleted else 1,
+                               1 if rng.random() < MARKED_RATIO else 0))
+            if logs:
+                stat_rows.append((event_id, state['last_start_time'], state['last_stop_time'],
+                                  state['total_duration_seconds'].quantize(rollups.SECONDS_QUANTUM),
+                                  state['event_status']))
+                log_rows.extend(logs)
+            flush()
+        flush(force=True)
+        print()
+        print(f"Seeded {args.events} events and {logs_written} logs in {time.monotonic() - started:.1f}s")
+    finally:
+        cursor.close()
+        conn.close()
+
+    count = name_search.rebuild(event_app.storage_backend)
+    print(f"Rebuilt event_name_grams for {count} events")
+
+    if args.rollups:
+        count = rollups.backfill(event_app.storage_backend, archive=event_app.event_log_archive,
+                                progress=lambda n: print(f"  {n} logs rolled up", end='\r'))
+        print(f"\nRebuilt event_daily_durations from {count} logs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--logs', type=int, default=100000, help="approximate total number of logs")
+    parser.add_argument('--persons', type=int, default=50)
+    parser.add_argument('--days', type=int, default=365, help="spread create_time over this many days")
+    parser.add_argument('--batch', type=int, default=5000, help="rows per INSERT / commit")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help="delete existing events, statistics and logs first")
+    parser.add_argument('--no-rollups', dest='rollups', action='store_false',
+                        help="skip rebuilding event_daily_durations")
+    args = parser.parse_args()
+    seed(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+并发压力测试：多个线程同时对同一个事件发送开始/停止请求，然后校验 event_statistics 与 event_logs 是否一致。
+
+需要 app.DB_CONFIG 指向一个可写的测试数据库。用法:
+    python bench/stress_log_action.py --threads 32 --iterations 200
+"""
+import os
+import sys
+import random
+import argparse
+import threading
+from collections import Counter
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as event_app  # noqa: E402
+from event_log_queue import fold_log_into_stats  # noqa: E402
+
+
+def hammer(client, event_id, iterations, seed, counts, lock):
+    rng = random.Random(seed)
+    local = Counter()
+    for _ in range(iterations):
+        log_type = rng.choice([0, 1])
+        response = client.post(f'/api/events/{event_id}/log', json={"log_type": log_type})
+        local[(log_type, response.status_code)] += 1
+    with lock:
+        counts.update(local)
+
+
+def verify(event_id):
+    """按 log_id 顺序重放日志，与 event_statistics 对比"""
+    conn = event_app.get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT log_type, log_time FROM event_logs WHERE event_id = %s ORDER BY log_id", (event_id,))
+        logs = cursor.fetchall()
+        cursor.execute("""
+            SELECT last_start_time, last_stop_time, total_duration_seconds, event_status
+            FROM event_statistics WHERE event_id = %s
+        """, (event_id,))
+        actual = cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+    problems = []
+    expected = {'last_start_time': None, 'last_stop_time': None, 'total_duration_seconds': Decimal(0), 'event_status': 0}
+    for index, log in enumerate(logs):
+        if log['log_type'] == 1 and expected['event_status'] == 1:
+            problems.append(f"log #{index}: start logged while already running")
+        fold_log_into_stats(expected, log['log_type'], log['log_time'])
+
+    if actual is None:
+        if logs:
+            problems.append("event_statistics row missing")
+        return logs, problems
+    if actual['event_status'] != expected['event_status']:
+        problems.append(f"event_status {actual['event_status']} != replayed {expected['event_status']}")
+    # SQL keeps 4 decimal places per increment, allow that rounding per stop
+    tolerance = Decimal('0.0001') * (sum(1 for log in logs if log['log_type'] == 0) + 1)
+    drift = abs(Decimal(actual['total_duration_seconds'] or 0) - expected['total_duration_seconds'])
+    if drift > tolerance:
+        problems.append(f"total_duration_seconds {actual['total_duration_seconds']} != replayed "
+                        f"{expected['total_duration_seconds']} (drift {drift})")
+    return logs, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--iterations', type=int, default=200, help="requests per thread")
+    parser.add_argument('--keep', action='store_true', help="do not soft-delete the test event afterwards")
+    args = parser.parse_args()
+
+    client = event_app.app.test_client()
+    created = client.post('/api/events', json={"event_name": "stress-test", "event_desc": "bench/stress_log_action.py"})
+    if created.status_code != 201:
+        print(f"Could not create test event: {created.status_code} {created.get_data(as_text=True)}")
+        return 2
+    event_id = created.get_json()['event_id']
+
+    counts = Counter()
+    lock = threading.Lock()
+    threads = [threading.Thread(target=hammer, args=(client, event_id, args.iterations, seed, counts, lock))
+               for seed in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if event_app.event_log_queue:
+        event_app.event_log_queue.flush(timeout=60)
+
+    logs, problems = verify(event_id)
+    unexpected = {key: count for key, count in counts.items() if key[1] not in (200, 202, 409)}
+    if unexpected:
+        problems.append(f"unexpected responses: {unexpected}")
+    print(f"event_id={event_id} requests={sum(counts.values())} logs={len(logs)}")
+    for (log_type, status), count in sorted(counts.items()):
+        print(f"  {'start' if log_type == 1 else 'stop '} -> {status}: {count}")
+    if not args.keep:
+        client.delete(f'/api/events/{event_id}')
+
+    if problems:
+        print("FAILED")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
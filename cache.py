@@ -0,0 +1,92 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    线程安全的进程内缓存：每个条目有过期时间，条目数超过 maxsize 时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class VersionedResponseCache:
+    """
+    按版本号失效的响应缓存。
+    写操作调用 bump() 增加全局版本号（以及相关事件的版本号），
+    缓存条目和 ETag 都绑定到读取时的版本号，版本变化后自然失效；TTL 和条目数上限只作为兜底。
+    版本号只在本进程内有效，看不到其他进程和命令行的写入，所以只有该版本的条目还未过期时才能凭 ETag 回 304，
+    这样其他进程的写入最多滞后一个 TTL。
+    """
+
+    def __init__(self, ttl, maxsize=512):
+        self._entries = TTLCache(ttl=ttl, maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._global_version = 0
+        self._scoped_versions = {}
+        # Distinguishes ETags issued before and after a restart
+        self._epoch = '%x' % time.time_ns()
+
+    def version(self, scope=None):
+        """scope 为 None 时返回全局版本号，否则返回该 scope（如 event_id）的版本号"""
+        with self._lock:
+            if scope is None:
+                return self._global_version
+            return self._scoped_versions.get(scope, 0)
+
+    def bump(self, scopes=()):
+        with self._lock:
+            self._global_version += 1
+            for scope in scopes:
+                self._scoped_versions[scope] = self._scoped_versions.get(scope, 0) + 1
+
+    def etag(self, key, version):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:12]
+        return f"{self._epoch}-{version}-{digest}"
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def set(self, key, version, value):
+        self._entries.set(key, (version, value))
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,45 @@
+"""
+响应压缩：按 Accept-Encoding 协商 br / gzip，只压缩长度已知、超过阈值的 JSON / 文本响应。
+流式响应（SSE、导出）和文件直传不处理；brotli 是可选依赖，没有安装时只提供 gzip。
+Flask (app.py) 和 Quart (async_app.py) 的 after_request 钩子共用。
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:  # Optional, pip install brotli
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/csv', 'text/html')
+
+
+def compressible(response, min_size):
+    """响应是否值得压缩：2xx、未编码、类型可压缩、长度已知且不小于 min_size"""
+    if min_size <= 0 or not 200 <= response.status_code < 300 or response.status_code == 204:
+        return False
+    if 'Content-Encoding' in response.headers or getattr(response, 'direct_passthrough', False):
+        return False
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return False
+    length = response.content_length # None for streamed bodies
+    return length is not None and length >= min_size
+
+
+def choose_encoding(accept_encodings):
+    """
+    从请求的 Accept-Encoding（werkzeug Accept 对象）选出 q 值最高的编码，q 相同时优先 br；
+    客户端都不接受，或者明确给 identity 更高的 q 值时返回 None
+    """
+    available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    best = max(available, key=accept_encodings.quality) # max() keeps the first of equal weights
+    quality = accept_encodings.quality(best)
+    if quality <= 0 or ('identity' in accept_encodings.values() and accept_encodings['identity'] > quality):
+        return None
+    return best
+
+
+def encode(data, encoding, level):
+    """level 取 1-9，gzip 和 brotli 都在这个范围内由快到小"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0) # mtime=0: identical bodies compress identically
@@ -0,0 +1,254 @@
+import time
+import threading
+from collections import deque
+
+import mysql.connector
+
+
+class PoolExhaustedError(Exception):
+    """连接池在等待时间内没有可用连接"""
+
+    def __init__(self, timeout):
+        super().__init__(f"No database connection available within {timeout:.1f}s")
+        self.timeout = timeout
+
+
+class PooledConnection:
+    """
+    连接池中借出的连接代理。
+    所有属性透传给底层连接，close() 只是把连接归还给连接池，
+    这样现有路由里的 conn.close() 不需要修改。
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise mysql.connector.errors.OperationalError("Connection already returned to the pool")
+        return getattr(conn, name)
+
+    def is_connected(self):
+        # A released proxy behaves like a closed connection
+        return self._conn is not None and self._conn.is_connected()
+
+    def cursor(self, *args, **kwargs):
+        conn = self._conn
+        if conn is None:
+            raise mysql.connector.errors.OperationalError("Connection already returned to the pool")
+        cursor = conn.cursor(*args, **kwargs)
+        return self._pool.cursor_wrapper(cursor) if self._pool.cursor_wrapper else cursor
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def prepared_cursor(self, sql):
+        """
+        返回物理连接上为这条 SQL 缓存的预处理语句游标，连接被销毁时语句随之释放。
+        连接池关闭了预处理语句时返回 None。调用方需要读完结果集。
+        """
+        if not self._pool.prepared_statements:
+            return None
+        conn = self._conn
+        if conn is None:
+            raise mysql.connector.errors.OperationalError("Connection already returned to the pool")
+        statements = conn.__dict__.setdefault('_pool_prepared_cursors', {})
+        cursor = statements.get(sql)
+        if cursor is None:
+            cursor = conn.cursor(prepared=True)
+            if self._pool.cursor_wrapper:
+                cursor = self._pool.cursor_wrapper(cursor)
+            statements[sql] = cursor
+        return cursor
+
+    def discard(self):
+        """销毁连接而不是归还（例如流式查询被中断，剩余结果不值得读完）"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.discard(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    线程安全的数据库连接池。
+    - connect: 无参数的建连函数（例如 storage 后端的 connect）
+    - size: 最大连接数（借出 + 空闲）
+    - timeout: 连接池耗尽时最长等待秒数，超时抛出 PoolExhaustedError
+    - validate_after: 空闲超过这个秒数的连接在借出前先 ping 一次，失败则重建
+    - prepared_statements: 是否允许 PooledConnection.prepared_cursor() 使用服务端预处理语句
+    - cursor_wrapper: 可选，包装借出连接上创建的每个游标（例如计时）
+    - on_checkout: 可选，每次成功借出后以获取耗时（秒）调用
+    """
+
+    def __init__(self, connect, size=10, timeout=5.0, validate_after=5.0, prepared_statements=True,
+                 cursor_wrapper=None, on_checkout=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self.prepared_statements = prepared_statements
+        self.cursor_wrapper = cursor_wrapper
+        self.on_checkout = on_checkout
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = deque()  # (connection, returned_at)
+        self._open = 0        # connections owned by the pool, idle or in use
+        self._in_use = 0
+
+        # Statistics
+        self._created = 0
+        self._destroyed = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._validation_failures = 0
+        self._total_wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    # --- Checkout / Release ---
+    def get_connection(self):
+        """借出一个经过校验的连接（PooledConnection）"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        while True:
+            with self._lock:
+                while not self._idle and self._open >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        self._record_wait(time.monotonic() - start)
+                        raise PoolExhaustedError(self.timeout)
+                    waited = True
+                    self._available.wait(remaining)
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()  # LIFO keeps hot connections hot
+                else:
+                    conn, returned_at = None, None
+                    self._open += 1  # Reserve the slot, connect outside the lock
+                self._in_use += 1
+
+            if conn is None:
+                try:
+                    conn = self._create()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                        self._in_use -= 1
+                        self._available.notify()
+                    raise
+            elif time.monotonic() - returned_at >= self.validate_after and not self._validate(conn):
+                # Server dropped the connection (wait_timeout, restart...): replace it
+                with self._lock:
+                    self._validation_failures += 1
+                    self._in_use -= 1
+                self._discard(conn)
+                continue
+
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self._checkouts += 1
+                if waited:
+                    self._waits += 1
+                self._record_wait(elapsed)
+            if self.on_checkout:
+                self.on_checkout(elapsed)
+            return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """归还连接：回滚未提交的事务，损坏的连接直接销毁"""
+        healthy = True
+        try:
+            if conn.unread_result:
+                conn.consume_results()
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            healthy = False
+
+        with self._lock:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+                self._available.notify()
+                return
+        self._discard(conn)
+
+    def discard(self, conn):
+        """销毁一个借出的连接，空出的名额可以重新建连"""
+        with self._lock:
+            self._in_use -= 1
+        self._discard(conn)
+
+    def close_all(self):
+        """关闭所有空闲连接（借出的连接在归还后照常复用）"""
+        with self._lock:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+    # --- Internals ---
+    def _create(self):
+        conn = self.connect()
+        with self._lock:
+            self._created += 1
+        return conn
+
+    def _validate(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass  # Already broken, nothing else to do
+        with self._lock:
+            self._open -= 1
+            self._destroyed += 1
+            self._available.notify()
+
+    def _record_wait(self, seconds):
+        # Caller holds the lock
+        self._total_wait_seconds += seconds
+        if seconds > self._max_wait_seconds:
+            self._max_wait_seconds = seconds
+
+    # --- Statistics ---
+    def stats(self):
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "open": self._open,
+                "created": self._created,
+                "destroyed": self._destroyed,
+                "checkouts": checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "validation_failures": self._validation_failures,
+                "total_wait_seconds": round(self._total_wait_seconds, 6),
+                "avg_wait_seconds": round(self._total_wait_seconds / checkouts, 6) if checkouts else 0.0,
+                "max_wait_seconds": round(self._max_wait_seconds, 6),
+            }
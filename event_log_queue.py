@@ -0,0 +1,302 @@
+import time
+import threading
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+
+
+def fold_log_into_stats(state, log_type, log_time):
+    """
+    在内存中对一个事件的统计状态应用一条开始/结束日志，规则与 update_event_statistics 相同。
+    state: dict(last_start_time, last_stop_time, total_duration_seconds, event_status)
+    结束一个进行中的计时段时返回 (start, stop)，否则返回 None。
+    """
+    session = None
+    if log_type == 1:
+        state['last_start_time'] = log_time
+        state['event_status'] = 1
+    else:
+        last_start_time = state['last_start_time']
+        if state['event_status'] == 1 and isinstance(last_start_time, datetime):
+            duration_increment = Decimal(max(0, (log_time - last_start_time).total_seconds()))
+            state['total_duration_seconds'] = Decimal(state['total_duration_seconds'] or 0) + duration_increment
+            session = (last_start_time, log_time)
+        state['last_stop_time'] = log_time
+        state['event_status'] = 0
+    return session
+
+
+class LogQueueFullError(Exception):
+    """写入队列已满，且在等待时间内没有腾出空间"""
+
+
+class EventLogQueue:
+    """
+    事件日志的 write-behind 队列。
+    请求线程只根据内存中的状态视图校验并入队，后台线程按数量或时间阈值成组提交到数据库。
+
+    - load_state(event_id): 从数据库读取事件状态，不存在时返回 None
+    - write_group(items): 在一个事务里写入 [(event_id, log_type, log_time), ...]，返回被丢弃的条数
+    - is_transient(err): 写入失败是否是暂时的（例如连不上数据库），这样的失败一直重试；
+      其他失败重试 max_retries 次后这一批被移出队列，放进 set_aside（保留最近的 SET_ASIDE_KEEP 批），
+      然后调用 discard_group(items)
+    状态视图只对本进程内的写入可靠，多进程部署时以数据库为准（write_group 会再次校验）。
+    """
+    SET_ASIDE_KEEP = 100
+
+    def __init__(self, load_state, write_group, max_size=10000, flush_size=500,
+                 flush_interval=0.05, put_timeout=1.0, max_view_size=10000,
+                 max_retries=5, is_transient=None, discard_group=None):
+        self.load_state = load_state
+        self.write_group = write_group
+        self.max_retries = max_retries
+        self.is_transient = is_transient
+        self.discard_group = discard_group
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_view_size = max_view_size
+
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._not_empty = threading.Condition(self._lock)
+        self._drained = threading.Condition(self._lock)
+        self._queue = deque()
+        self._view = {}     # event_id -> state dict
+        self._pending = {}  # event_id -> queued/in-flight entries not yet committed
+        self._in_flight = 0
+        self._retries = 0   # Consecutive non-transient failures of the batch at the head of the queue
+        self.set_aside = deque(maxlen=self.SET_ASIDE_KEEP)  # {items, error, attempts} of given up batches
+        self._thread = None
+        self._stopping = False
+
+        # Metrics
+        self._enqueued = 0
+        self._flushed = 0
+        self._dropped = 0
+        self._rejected = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._set_aside_logs = 0
+        self._max_depth = 0
+        self._last_flush_size = 0
+        self._last_flush_seconds = 0.0
+        self._total_flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+
+    # --- Lifecycle ---
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='event-log-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """停止后台线程，先把队列里剩余的日志全部写入"""
+        with self._lock:
+            self._stopping = True
+            self._not_empty.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    # --- Request side ---
+    def submit(self, event_id, log_type, log_time):
+        """
+        校验并入队一条日志。
+        返回 (status_code, payload)：成功时为 (202, 状态快照)，失败时为 (4xx, 错误信息)。
+        队列满且等待超时时抛出 LogQueueFullError。
+        """
+        state = None
+        deadline = time.monotonic() + self.put_timeout
+        while True:
+            if state is None:
+                with self._lock:
+                    known = event_id in self._view
+                if not known:
+                    state = self.load_state(event_id) # DB round trip outside the lock
+                    if state is None:
+                        return 404, "Event not found"
+
+            with self._lock:
+                while len(self._queue) >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected += 1
+                        raise LogQueueFullError("Log queue is full")
+                    self._not_full.wait(remaining)
+
+                # Another request may have loaded it meanwhile; the cached view wins
+                cached = self._view.get(event_id)
+                if cached is None:
+                    if state is None:
+                        continue # Trimmed or invalidated since the check above, load it again
+                    self._view[event_id] = state
+                else:
+                    state = cached
+                if state['event_del_status'] == 0:
+                    return 400, "Cannot log action for a deleted event"
+                if log_type == 1 and state['event_status'] == 1:
+                    return 409, "Event is already running"
+
+                fold_log_into_stats(state, log_type, log_time)
+                self._queue.append((event_id, log_type, log_time))
+                self._pending[event_id] = self._pending.get(event_id, 0) + 1
+                self._enqueued += 1
+                self._max_depth = max(self._max_depth, len(self._queue))
+                if len(self._queue) >= self.flush_size:
+                    self._not_empty.notify()
+                self._trim_view()
+                return 202, dict(state)
+
+    def overlay(self, row, convert=None):
+        """用尚未落库的状态覆盖查询结果中的统计字段，convert 用于把覆盖的值转成与 row 相同的表示"""
+        with self._lock:
+            if not self._pending.get(row['event_id']):
+                return row
+            state = self._view.get(row['event_id'])
+            if state:
+                for key in ('event_status', 'last_start_time', 'last_stop_time', 'total_duration_seconds'):
+                    if key in row:
+                        row[key] = convert(state[key]) if convert else state[key]
+        return row
+
+    def invalidate(self, event_ids=None, timeout=5.0):
+        """其他路径直接改了数据库：先把队列写空，再丢弃对应的状态视图"""
+        self.flush(timeout)
+        with self._lock:
+            if event_ids is None:
+                self._view.clear()
+            else:
+                for event_id in event_ids:
+                    self._view.pop(event_id, None)
+
+    def flush(self, timeout=5.0):
+        """等待队列中已有的日志全部提交，返回是否在超时前完成"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._not_empty.notify()
+            while self._queue or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._drained.wait(remaining)
+            return True
+
+    def commit_delay(self):
+        """现在入队的日志预计多少秒后提交：攒批间隔加上前面每一批（含本批）按最近一次提交耗时估算"""
+        with self._lock:
+            batches = len(self._queue) // self.flush_size + 1 + (1 if self._in_flight else 0)
+            return self.flush_interval + batches * self._last_flush_seconds
+
+    # --- Writer side ---
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._queue and not self._stopping:
+                    self._not_empty.wait(self.flush_interval)
+                if len(self._queue) < self.flush_size and not self._stopping:
+                    # Give the group a chance to fill up, bounded by the flush interval
+                    self._not_empty.wait(self.flush_interval)
+                if not self._queue:
+                    if self._stopping:
+                        return
+                    continue
+                count = min(self.flush_size, len(self._queue))
+                items = [self._queue.popleft() for _ in range(count)]
+                self._in_flight = count
+                self._not_full.notify_all()
+
+            started = time.monotonic()
+            try:
+                dropped = self.write_group(items)
+            except Exception as e:
+                if self._give_up(items, e):
+                    print(f"Error flushing {len(items)} queued event logs, set aside after "
+                          f"{self.max_retries + 1} attempts: {e}")
+                    if self.discard_group:
+                        self.discard_group(items)
+                    continue
+                print(f"Error flushing {len(items)} queued event logs, will retry: {e}")
+                time.sleep(min(1.0, self.flush_interval * 10))
+                continue
+
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._retries = 0
+                # The database disagreed with the view, reload those events next time
+                self._release(items, forget=bool(dropped))
+                self._dropped += dropped or 0
+                self._in_flight = 0
+                self._flushed += len(items) - (dropped or 0)
+                self._flushes += 1
+                self._last_flush_size = len(items)
+                self._last_flush_seconds = elapsed
+                self._total_flush_seconds += elapsed
+                self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+                if not self._queue:
+                    self._drained.notify_all()
+
+    def _give_up(self, items, err):
+        """写入失败：放回队首等待重试返回 False；非暂时性的失败超过 max_retries 次时移出队列返回 True"""
+        with self._lock:
+            self._failed_flushes += 1
+            self._in_flight = 0
+            if not (self.is_transient and self.is_transient(err)):
+                self._retries += 1
+            if self._retries <= self.max_retries:
+                self._queue.extendleft(reversed(items)) # Keep the original order
+                return False
+            self._retries = 0
+            self.set_aside.append({"items": items, "error": str(err), "attempts": self.max_retries + 1})
+            self._set_aside_logs += len(items)
+            self._release(items, forget=True) # The view already applied these logs
+            if not self._queue:
+                self._drained.notify_all()
+            return True
+
+    def _release(self, items, forget):
+        # Caller holds the lock; forget=True drops the view of events with nothing else pending
+        for event_id, _, _ in items:
+            left = self._pending.get(event_id, 0) - 1
+            if left > 0:
+                self._pending[event_id] = left
+            else:
+                self._pending.pop(event_id, None)
+        if forget:
+            for event_id in {item[0] for item in items}:
+                if not self._pending.get(event_id):
+                    self._view.pop(event_id, None)
+
+    def _trim_view(self):
+        # Caller holds the lock; only entries without pending writes can be forgotten
+        if len(self._view) <= self.max_view_size:
+            return
+        for event_id in [event_id for event_id in self._view if not self._pending.get(event_id)]:
+            del self._view[event_id]
+            if len(self._view) <= self.max_view_size // 2:
+                break
+
+    # --- Metrics ---
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": len(self._queue),
+                "in_flight": self._in_flight,
+                "max_depth": self._max_depth,
+                "capacity": self.max_size,
+                "enqueued": self._enqueued,
+                "flushed": self._flushed,
+                "dropped": self._dropped,
+                "rejected": self._rejected,
+                "flushes": self._flushes,
+                "failed_flushes": self._failed_flushes,
+                "set_aside": self._set_aside_logs,
+                "last_flush_size": self._last_flush_size,
+                "last_flush_seconds": round(self._last_flush_seconds, 6),
+                "avg_flush_seconds": round(self._total_flush_seconds / self._flushes, 6) if self._flushes else 0.0,
+                "max_flush_seconds": round(self._max_flush_seconds, 6),
+                "tracked_events": len(self._view),
+            }
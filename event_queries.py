@@ -0,0 +1,209 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional, falls back to Flask's stdlib json provider
+    orjson = None
+
+# --- 事件查询 ---
+# 列顺序与 EVENT_COLUMNS 一一对应，转换器按下标取值
+EVENT_SELECT_SQL = """
+    SELECT
+        e.event_id, e.event_name, e.event_desc, e.create_time, e.update_time,
+        e.responsible_person, e.event_del_status, e.event_mark_status,
+        COALESCE(s.event_status, 0) as event_status,
+        COALESCE(s.total_duration_seconds, 0) as total_duration_seconds,
+        s.last_start_time, s.last_stop_time
+"""
+EVENT_FROM_SQL = """
+    FROM event_info e
+    LEFT JOIN event_statistics s ON e.event_id = s.event_id
+"""
+EVENT_COLUMNS = [
+    ('event_id', 'raw'), ('event_name', 'raw'), ('event_desc', 'raw'),
+    ('create_time', 'datetime'), ('update_time', 'datetime'),
+    ('responsible_person', 'raw'), ('event_del_status', 'raw'), ('event_mark_status', 'raw'),
+    ('event_status', 'raw'), ('total_duration_seconds', 'decimal'),
+    ('last_start_time', 'datetime'), ('last_stop_time', 'datetime'),
+]
+
+# Hot fixed-shape queries, executed as server-side prepared statements.
+# The prepared cursor reuses its statement only for the identical string object, keep these as constants.
+EVENT_BY_ID_SQL = EVENT_SELECT_SQL + EVENT_FROM_SQL + "WHERE e.event_id = %s"
+DASHBOARD_WHERE_SQL = """
+    WHERE e.event_mark_status = 1 AND e.event_del_status = 1
+    ORDER BY e.create_time ASC
+"""
+DASHBOARD_EVENTS_SQL = EVENT_SELECT_SQL + EVENT_FROM_SQL + DASHBOARD_WHERE_SQL
+EVENT_STATS_BY_ID_SQL = """
+    SELECT event_id, last_start_time, last_stop_time, total_duration_seconds, event_status
+    FROM event_statistics WHERE event_id = %s
+"""
+STATS_COLUMNS = [
+    ('event_id', 'raw'), ('last_start_time', 'datetime'), ('last_stop_time', 'datetime'),
+    ('total_duration_seconds', 'decimal'), ('event_status', 'raw'),
+]
+
+
+# --- 行转换 ---
+_KIND_FUNCTIONS = {
+    'raw': None,
+    'datetime': datetime.isoformat,
+    'decimal': float,
+}
+
+class RowConverter:
+    """
+    按列类型预先绑定的行转换函数：tuple 行 -> 可直接 JSON 序列化的 dict。
+    列类型在创建时确定，转换时不再对每个值做 isinstance 判断。
+    columns: [(列名, 类型)]，类型为 'raw' / 'datetime' / 'decimal'，None 表示丢弃该列。
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        fields = []
+        for index, (name, kind) in enumerate(self.columns):
+            if not isinstance(name, str):
+                raise TypeError(f"Column name must be a str, got {name!r}")
+            if kind is None:
+                continue
+            if kind not in _KIND_FUNCTIONS:
+                raise ValueError(f"Unknown column kind {kind!r} for {name!r}")
+            fields.append((name, index, _KIND_FUNCTIONS[kind]))
+        fields = tuple(fields)
+        # (name, index, fn) bound once per converter, one dict comprehension per row
+        self.convert = lambda row: {name: row[index] if fn is None or row[index] is None else fn(row[index])
+                                    for name, index, fn in fields}
+
+    def index(self, name):
+        return [column for column, _ in self.columns].index(name)
+
+    def __call__(self, row):
+        return self.convert(row)
+
+    def many(self, rows):
+        return list(map(self.convert, rows))
+
+
+EVENT_ROW = RowConverter(EVENT_COLUMNS)
+# Event list query appends the sort key, which is only used for cursors
+EVENT_LIST_ROW = RowConverter(EVENT_COLUMNS + [('sort_key', None)])
+STATS_ROW = RowConverter(STATS_COLUMNS)
+
+
+# --- 字段投影 (?fields=event_id,event_status,total_duration_seconds) ---
+# SELECT 表达式，与 EVENT_SELECT_SQL 中的写法相同
+EVENT_COLUMN_SQL = {
+    'event_id': 'e.event_id', 'event_name': 'e.event_name', 'event_desc': 'e.event_desc',
+    'create_time': 'e.create_time', 'update_time': 'e.update_time',
+    'responsible_person': 'e.responsible_person', 'event_del_status': 'e.event_del_status',
+    'event_mark_status': 'e.event_mark_status',
+    'event_status': 'COALESCE(s.event_status, 0) as event_status',
+    'total_duration_seconds': 'COALESCE(s.total_duration_seconds, 0) as total_duration_seconds',
+    'last_start_time': 's.last_start_time', 'last_stop_time': 's.last_stop_time',
+}
+
+class EventProjection:
+    """
+    事件查询的字段子集：SELECT 列表和对应的行转换器，列顺序与 EVENT_COLUMNS 相同。
+    event_id 总是包含（前端按它更新行，游标分页也要用它）。
+    """
+
+    def __init__(self, names=None):
+        columns = [(name, kind) for name, kind in EVENT_COLUMNS if names is None or name in names or name == 'event_id']
+        self.names = tuple(name for name, _ in columns)
+        if names is None:
+            # Full projection: the exact shared SQL strings, prepared statements and query shapes stay the same
+            self.select_sql = EVENT_SELECT_SQL
+            self.dashboard_sql = DASHBOARD_EVENTS_SQL
+        else:
+            self.select_sql = "\n    SELECT\n        " + ", ".join(EVENT_COLUMN_SQL[name] for name in self.names) + "\n"
+            self.dashboard_sql = self.select_sql + EVENT_FROM_SQL + DASHBOARD_WHERE_SQL
+        self.row = EVENT_ROW if names is None else RowConverter(columns)
+        self.list_row = EVENT_LIST_ROW if names is None else RowConverter(columns + [('sort_key', None)])
+
+
+ALL_FIELDS = EventProjection()
+_projections = {} # frozenset of field names -> EventProjection, the SQL string objects stay stable per field set
+
+def parse_fields(value):
+    """解析 fields 参数（逗号分隔的字段名），为空时返回全部字段；有未知字段时抛出 ValueError"""
+    names = frozenset(name.strip() for name in (value or '').split(',') if name.strip())
+    if not names:
+        return ALL_FIELDS
+    unknown = names - EVENT_COLUMN_SQL.keys()
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}. "
+                         f"Available: {', '.join(name for name, _ in EVENT_COLUMNS)}")
+    projection = _projections.get(names)
+    if projection is None:
+        projection = _projections[names] = EventProjection(names)
+    return projection
+
+
+def json_value(value):
+    """单个值的通用转换，用于类型不固定的少量值（如 write-behind 覆盖的统计字段）"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+# --- 查询执行 ---
+def fetch_all(conn, sql, params=()):
+    """执行查询并返回全部 tuple 行；连接池开启预处理语句时复用连接上的服务端预处理语句"""
+    cursor = conn.prepared_cursor(sql)
+    if cursor is None:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+def fetch_one(conn, sql, params=()):
+    rows = fetch_all(conn, sql, params)
+    return rows[0] if rows else None
+
+def fetch_event(conn, event_id):
+    """读取单个事件（含统计），返回已转换的 dict，不存在时返回 None"""
+    row = fetch_one(conn, EVENT_BY_ID_SQL, (event_id,))
+    return EVENT_ROW(row) if row else None
+
+def fetch_event_stats(conn, event_id):
+    row = fetch_one(conn, EVENT_STATS_BY_ID_SQL, (event_id,))
+    return STATS_ROW(row) if row else None
+
+def fetch_dashboard_events(conn, projection=ALL_FIELDS):
+    return projection.row.many(fetch_all(conn, projection.dashboard_sql))
+
+
+# --- JSON 编码 ---
+if orjson is not None:
+    class OrjsonProvider(DefaultJSONProvider):
+        """
+        用 orjson 生成响应体，行为与 Flask 默认实现保持一致：
+        datetime / date / Decimal 等仍交给 DefaultJSONProvider.default 处理，sort_keys 设置同样生效。
+        """
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+        def dumps(self, obj, **kwargs):
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            return self._encode(obj).decode('utf-8')
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(self._encode(obj), mimetype=self.mimetype)
+
+        def _encode(self, obj):
+            option = self.option | orjson.OPT_SORT_KEYS if self.sort_keys else self.option
+            return orjson.dumps(obj, default=self.default, option=option)
+else:
+    OrjsonProvider = None
@@ -0,0 +1,112 @@
+import json
+import asyncio
+import threading
+from collections import deque
+
+
+class EventBroker:
+    """
+    事件变更广播（Server-Sent Events）。
+    写操作提交后 publish() 一条增量消息，消息按递增 id 保存在环形缓冲区里；
+    订阅者按 id 读取，断线重连时带上 Last-Event-ID 即可补发错过的消息。
+    如果错过的消息已经被挤出缓冲区，订阅者会收到一条 reset 消息，需要全量刷新。
+    subscribe() 每个订阅者占用一个线程等待；subscribe_async() 供 async_app 使用，只占用一个协程。
+    """
+
+    def __init__(self, buffer_size=1000, heartbeat=15.0):
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._buffer = deque(maxlen=buffer_size)  # (id, kind, data)
+        self._last_id = 0
+        self._subscribers = 0
+        self._async_waiters = set()  # (loop, asyncio.Event) of async subscribers
+
+    def publish(self, kind, data):
+        with self._lock:
+            self._last_id += 1
+            self._buffer.append((self._last_id, kind, data))
+            self._changed.notify_all()
+            waiters = list(self._async_waiters)
+            message_id = self._last_id
+        # publish() runs in worker threads, wake async subscribers on their own loop
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError: # Loop already closed, the subscriber is going away
+                pass
+        return message_id
+
+    def _start(self, last_event_id):
+        with self._lock:
+            self._subscribers += 1
+            return self._last_id if last_event_id is None else last_event_id
+
+    def _pending(self, cursor):
+        """cursor 之后的消息（调用方持有锁）"""
+        oldest = self._buffer[0][0] if self._buffer else self._last_id + 1
+        if cursor > self._last_id or (cursor < self._last_id and cursor + 1 < oldest):
+            # Id from before a server restart, or missed messages fell out of the buffer
+            return [(self._last_id, 'reset', {})]
+        return [message for message in self._buffer if message[0] > cursor]
+
+    @staticmethod
+    def _format(pending):
+        chunks = []
+        for message_id, kind, data in pending:
+            payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+            chunks.append(f"id: {message_id}\nevent: {kind}\ndata: {payload}\n\n")
+        return "".join(chunks)
+
+    def subscribe(self, last_event_id=None):
+        """生成 SSE 文本块；没有新消息时每隔 heartbeat 秒发送一次注释行保持连接"""
+        cursor = self._start(last_event_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                with self._lock:
+                    if self._last_id == cursor:
+                        self._changed.wait(self.heartbeat)
+                    pending = self._pending(cursor)
+
+                if not pending:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield self._format(pending)
+                cursor = pending[-1][0]
+        finally:
+            with self._lock:
+                self._subscribers -= 1
+
+    async def subscribe_async(self, last_event_id=None):
+        """subscribe() 的异步版本，在事件循环里等待新消息"""
+        cursor = self._start(last_event_id)
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._async_waiters.add(waiter)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                waiter[1].clear() # Cleared before looking, a publish in between sets it again
+                with self._lock:
+                    pending = self._pending(cursor)
+                if not pending:
+                    try:
+                        await asyncio.wait_for(waiter[1].wait(), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        yield ": heartbeat\n\n"
+                    continue
+                yield self._format(pending)
+                cursor = pending[-1][0]
+        finally:
+            with self._lock:
+                self._async_waiters.discard(waiter)
+                self._subscribers -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "last_event_id": self._last_id,
+                "buffered": len(self._buffer),
+                "subscribers": self._subscribers,
+            }
@@ -0,0 +1,71 @@
+import io
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    raise TypeError(f"Unserializable value: {value!r}")
+
+
+def _csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def stream_rows(conn, cursor, fmt='csv', fetch_size=1000):
+    """
+    从已执行查询的非缓冲游标按 fetch_size 分批读取，生成 CSV 或 NDJSON 文本块。
+    内存占用只和 fetch_size 有关，与结果总行数无关。
+    返回 (文本块生成器, release)。release 归还连接，要注册到 response.call_on_close：
+    响应体没有被读取（例如客户端在第一个块之前断开）时生成器的 finally 不会执行。
+    正常读完时归还连接；没有读完时直接销毁连接，避免为了归还而读完剩余结果。
+    """
+    state = {'completed': False, 'released': False}
+
+    def chunks():
+        try:
+            columns = [column[0] for column in cursor.description]
+
+            if fmt == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                yield '\ufeff' + buffer.getvalue() # BOM so spreadsheet tools detect UTF-8
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                if fmt == 'csv':
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows([_csv_value(value) for value in row] for row in rows)
+                    yield buffer.getvalue()
+                else:
+                    yield ''.join(json.dumps(dict(zip(columns, row)), default=_json_default, ensure_ascii=False) + '\n'
+                                  for row in rows)
+            state['completed'] = True
+        except Exception as e:
+            # Headers are already sent: log and abort the transfer so the client sees a truncated download
+            print(f"Error while streaming export: {e}")
+            raise
+
+    def release():
+        if state['released']:
+            return
+        state['released'] = True
+        if state['completed']:
+            cursor.close()
+            conn.close()
+        else:
+            conn.discard()
+
+    return chunks(), release
@@ -0,0 +1,454 @@
+import os
+import json
+import heapq
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # Optional, only needed once logs are archived
+    np = None
+
+# event_logs 按月分段：MySQL 为 RANGE COLUMNS(log_time) 分区 p<YYYYMM> + pmax，SQLite 按月份时间范围逻辑分段。
+# 保留期之前的整月日志由归档任务写成列式文件（每列一个 .npy，行按 event_id, log_time, log_id 排序），
+# 然后从热表删除；读取时内存映射，按 event_id 二分查找，只有命中的页会被读入。
+#
+# 目录结构: <LOG_ARCHIVE_DIR>/manifest.json
+#          <LOG_ARCHIVE_DIR>/<YYYY-MM>.<版本>/{log_id,event_id,log_type,log_time}.npy
+# manifest 记录每个月当前的目录和 archived_before：早于它的日志属于已归档的月份，写接口不再接受。
+# 重写一个月时写入新版本目录，再原子替换 manifest，正在读取旧目录的进程不受影响。
+
+COLUMNS = (('log_id', 'int64'), ('event_id', 'int64'), ('log_type', 'int8'), ('log_time', 'datetime64[us]'))
+MANIFEST = 'manifest.json'
+FETCH_SIZE = 10000
+DELETE_CHUNK = 5000
+PARTITION_AHEAD_MONTHS = 3
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class ArchiveUnavailable(Exception):
+    """归档文件存在，但没有安装 numpy"""
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def month_key(value):
+    return f"{value:%Y-%m}"
+
+def _require_numpy():
+    if np is None:
+        raise ArchiveUnavailable("numpy is required to read or write the log archive")
+
+
+class LogArchive:
+    """归档日志的读取与写入，manifest 变化时（其他进程归档后）自动重新加载"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._manifest_stamp = None
+        self._manifest = {'archived_before': None, 'months': {}}
+        self._columns = {} # Month directory -> memory-mapped columns
+
+    # --- manifest ---
+    def _load(self):
+        path = os.path.join(self.directory, MANIFEST)
+        try:
+            stat = os.stat(path)
+            stamp = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._manifest_stamp:
+            return self._manifest
+        with self._lock:
+            if stamp is None:
+                manifest = {'archived_before': None, 'months': {}}
+            else:
+                with open(path, encoding='utf-8') as manifest_file:
+                    manifest = json.load(manifest_file)
+            self._manifest, self._manifest_stamp = manifest, stamp
+            live = {entry['path'] for entry in manifest['months'].values()}
+            self._columns = {path: columns for path, columns in self._columns.items() if path in live}
+            return manifest
+
+    def _save(self, manifest):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(path + '.tmp', path)
+        self._load()
+
+    def archived_before(self):
+        """早于这个时间的日志已归档（或正在归档），没有归档时返回 None"""
+        value = self._load()['archived_before']
+        return datetime.fromisoformat(value) if value else None
+
+    def months(self):
+        """{月份: {'path', 'rows', 'archived_at'}}"""
+        return dict(self._load()['months'])
+
+    def set_archived_before(self, moment):
+        manifest = dict(self._load())
+        current = manifest['archived_before']
+        if not current or datetime.fromisoformat(current) < moment:
+            manifest['archived_before'] = moment.isoformat(' ')
+            self._save(manifest)
+
+    def clear(self):
+        """删除全部归档（只用于测试数据重置）"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._load()
+
+    # --- 读取 ---
+    def _month_columns(self, entry):
+        columns = self._columns.get(entry['path'])
+        if columns is None:
+            folder = os.path.join(self.directory, entry['path'])
+            columns = {name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode='r') for name, _ in COLUMNS}
+            self._columns[entry['path']] = columns
+        return columns
+
+    def month_arrays(self, month):
+        """一个月的全部列（内存映射），没有归档时返回 None"""
+        entry = self._load()['months'].get(month)
+        if entry is None:
+            return None
+        _require_numpy()
+        return self._month_columns(entry)
+
+    def event_logs(self, event_id, time_from=None, time_to=None):
+        """一个事件在 [time_from, time_to) 内的归档日志 [(log_id, log_type, log_time)]，按时间排序"""
+        months = self._load()['months']
+        if not months:
+            return []
+        _require_numpy()
+        rows = []
+        for month in sorted(months):
+            start = datetime.strptime(month, '%Y-%m')
+            if (time_from and add_months(start, 1) <= time_from) or (time_to and start >= time_to):
+                continue
+            columns = self._month_columns(months[month])
+            event_ids = columns['event_id']
+            low = int(np.searchsorted(event_ids, event_id, 'left'))
+            high = int(np.searchsorted(event_ids, event_id, 'right'))
+            if low == high:
+                continue
+            times = columns['log_time'][low:high]
+            # Rows of one event are sorted by time, so the window is another pair of binary searches
+            if time_from:
+                low += int(np.searchsorted(times, np.datetime64(time_from, 'us'), 'left'))
+            if time_to:
+                high = low + int(np.searchsorted(columns['log_time'][low:high], np.datetime64(time_to, 'us'), 'left'))
+            rows.extend(zip(columns['log_id'][low:high].tolist(), columns['log_type'][low:high].tolist(),
+                            columns['log_time'][low:high].tolist()))
+        return rows
+
+    def event_range(self, low, high):
+        """event_id 在 [low, high) 内的归档日志，每个月一组列（已排序的切片，不复制）"""
+        months = self._load()['months']
+        if not months:
+            return []
+        _require_numpy()
+        parts = []
+        for month in sorted(months):
+            columns = self._month_columns(months[month])
+            start, stop = np.searchsorted(columns['event_id'], [low, high], 'left')
+            if start < stop:
+                parts.append({name: column[start:stop] for name, column in columns.items()})
+        return parts
+
+    def time_range(self, start, end):
+        """log_time 在 [start, end) 内的归档日志，每个月一组列（复制出的子集，月份在范围外的不读取）"""
+        months = self._load()['months']
+        if not months:
+            return []
+        _require_numpy()
+        parts = []
+        for month in sorted(months):
+            month_begin = datetime.strptime(month, '%Y-%m')
+            if add_months(month_begin, 1) <= start or month_begin >= end:
+                continue
+            columns = self._month_columns(months[month])
+            times = columns['log_time']
+            mask = (times >= np.datetime64(start, 'us')) & (times < np.datetime64(end, 'us'))
+            if mask.any():
+                parts.append({name: column[mask] for name, column in columns.items()})
+        return parts
+
+    def event_id_range(self):
+        """归档里的 (最小, 最大) event_id，没有归档时返回 None"""
+        months = self._load()['months']
+        if not months:
+            return None
+        _require_numpy()
+        bounds = [(int(columns['event_id'][0]), int(columns['event_id'][-1]))
+                  for columns in (self._month_columns(months[month]) for month in months) if len(columns['event_id'])]
+        if not bounds:
+            return None
+        return min(low for low, _ in bounds), max(high for _, high in bounds)
+
+    def iter_logs(self, batch_size=FETCH_SIZE):
+        """按 (event_id, log_time, log_id) 顺序流式返回全部归档日志 (event_id, log_type, log_time, log_id)"""
+        months = self._load()['months']
+        if not months:
+            return iter(())
+        _require_numpy()
+
+        def month_rows(entry):
+            columns = self._month_columns(entry)
+            for start in range(0, len(columns['log_id']), batch_size):
+                chunk = slice(start, start + batch_size)
+                yield from zip(columns['event_id'][chunk].tolist(), columns['log_type'][chunk].tolist(),
+                               columns['log_time'][chunk].tolist(), columns['log_id'][chunk].tolist())
+
+        return heapq.merge(*(month_rows(months[month]) for month in sorted(months)),
+                           key=lambda row: (row[0], row[2], row[3]))
+
+    # --- 写入 ---
+    def write_month(self, month, arrays):
+        """写入（替换）一个月的列文件：先写新版本目录，再更新 manifest，最后删除旧目录"""
+        _require_numpy()
+        manifest = self._load()
+        previous = manifest['months'].get(month)
+        version = int(previous['path'].rsplit('.', 1)[1]) + 1 if previous else 1
+        path = f"{month}.{version}"
+        folder = os.path.join(self.directory, path)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+        for name, dtype in COLUMNS:
+            with open(os.path.join(folder, f"{name}.npy"), 'wb') as column_file:
+                np.save(column_file, np.ascontiguousarray(arrays[name], dtype=dtype))
+                column_file.flush()
+                os.fsync(column_file.fileno())
+        months = dict(manifest['months'])
+        months[month] = {'path': path, 'rows': int(len(arrays['log_id'])),
+                         'archived_at': datetime.now().replace(microsecond=0).isoformat(' ')}
+        self._save(dict(manifest, months=months))
+        if previous:
+            shutil.rmtree(os.path.join(self.directory, previous['path']), ignore_errors=True)
+
+
+def merge_arrays(parts):
+    """合并多组列（已归档 + 新读取），按 log_id 去重后按 (event_id, log_time, log_id) 排序"""
+    merged = {name: np.concatenate([np.asarray(part[name], dtype=dtype) for part in parts])
+              for name, dtype in COLUMNS}
+    _, first = np.unique(merged['log_id'], return_index=True)
+    merged = {name: column[first] for name, column in merged.items()}
+    order = np.lexsort((merged['log_id'], merged['log_time'], merged['event_id']))
+    return {name: column[order] for name, column in merged.items()}
+
+
+def merge_event_logs(hot_rows, archived_rows):
+    """合并热表和归档里同一个事件的日志 [(log_id, log_type, log_time)]，按 log_id 去重并按时间排序"""
+    rows = {row[0]: row for row in archived_rows}
+    rows.update((row[0], row) for row in hot_rows)
+    return sorted(rows.values(), key=lambda row: (row[2], row[0]))
+
+
+def merge_log_streams(hot_rows, archive):
+    """
+    合并热表（按 event_id, log_time, log_id 排序的 (event_id, log_type, log_time, log_id)）与归档的日志流，
+    同一条日志在归档中途失败时可能两边都有，按 log_id 去掉相邻的重复。
+    """
+    previous = None
+    for row in heapq.merge(hot_rows, archive.iter_logs(), key=lambda row: (row[0], row[2], row[3])):
+        if row[3] != previous:
+            previous = row[3]
+            yield row
+
+
+# --- MySQL 分区维护 ---
+def partition_name(month):
+    return f"p{month:%Y%m}"
+
+def _partition_clause(month):
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN ('{add_months(month, 1):%Y-%m-%d}')"
+
+def mysql_partitions(cursor):
+    cursor.execute("""
+        SELECT partition_name FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = 'event_logs' AND partition_name IS NOT NULL
+        ORDER BY partition_ordinal_position
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+def partition_by_month(cursor):
+    """
+    把 event_logs 改为按月 RANGE 分区，返回新建的分区名；已经分区时返回 []。
+    大表上是一次全表重建，期间写入会被阻塞，所以不作为自动迁移，由 partition_logs 在维护窗口里手动执行。
+    分区键必须包含在每个唯一键里，所以主键改为 (log_id, log_time)。
+    """
+    if mysql_partitions(cursor):
+        return []
+    cursor.execute("SELECT MIN(log_time) FROM event_logs")
+    oldest = cursor.fetchone()[0]
+    first = month_start(oldest or datetime.now())
+    last = add_months(month_start(datetime.now()), PARTITION_AHEAD_MONTHS)
+    months = []
+    month = first
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    cursor.execute("ALTER TABLE event_logs DROP PRIMARY KEY, ADD PRIMARY KEY (log_id, log_time)")
+    clauses = ", ".join([_partition_clause(month) for month in months] + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"])
+    cursor.execute(f"ALTER TABLE event_logs PARTITION BY RANGE COLUMNS (log_time) ({clauses})")
+    return [partition_name(month) for month in months] + ['pmax']
+
+def ensure_future_partitions(cursor, months_ahead=PARTITION_AHEAD_MONTHS):
+    """从 pmax 拆出未来几个月的分区（pmax 通常为空，拆分很快），返回新建的分区名"""
+    names = mysql_partitions(cursor)
+    if 'pmax' not in names:
+        return []
+    named = sorted(name for name in names if name != 'pmax')
+    month = add_months(datetime.strptime(named[-1], 'p%Y%m'), 1) if named else month_start(datetime.now())
+    target = add_months(month_start(datetime.now()), months_ahead)
+    months = []
+    while month <= target:
+        months.append(month)
+        month = add_months(month, 1)
+    if months:
+        clauses = ", ".join([_partition_clause(month) for month in months]
+                            + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"])
+        cursor.execute(f"ALTER TABLE event_logs REORGANIZE PARTITION pmax INTO ({clauses})")
+    return [partition_name(month) for month in months]
+
+def partition_logs(backend):
+    """
+    flask --app app partition-logs：给 event_logs 建立按月分区（只支持 MySQL），
+    已经分区时只补上未来几个月的分区。返回 (是否重建了表, 新建的分区名)。
+    """
+    conn = backend.connect()
+    cursor = conn.cursor()
+    try:
+        created = partition_by_month(cursor)
+        if created:
+            return True, created
+        return False, ensure_future_partitions(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# --- 归档任务 ---
+def to_datetime64(values):
+    """datetime 序列 → datetime64[us] 数组"""
+    # Integer microseconds through fromiter: several times faster than np.array(values, dtype='datetime64[us]')
+    micros = np.fromiter(((value - _EPOCH) // _MICROSECOND for value in values), dtype=np.int64, count=len(values))
+    return micros.view('datetime64[us]')
+
+
+def fetch_columns(cursor, fetch_size=FETCH_SIZE):
+    """把执行过 SELECT log_id, event_id, log_type, log_time 的游标分批读成列，没有行时返回 None"""
+    parts = []
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        log_ids, event_ids, log_types, log_times = zip(*rows)
+        parts.append({'log_id': log_ids, 'event_id': event_ids, 'log_type': log_types,
+                      'log_time': to_datetime64(log_times)})
+    if not parts:
+        return None
+    return {name: np.concatenate([np.asarray(part[name], dtype=dtype) for part in parts]) for name, dtype in COLUMNS}
+
+
+def _read_month(conn, start, end):
+    """读取热表里一个月的日志，返回 (列, 最大 log_id)"""
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute("""
+            SELECT log_id, event_id, log_type, log_time FROM event_logs
+            WHERE log_time >= %s AND log_time < %s
+        """, (start, end))
+        arrays = fetch_columns(cursor)
+    finally:
+        cursor.close()
+    if arrays is None:
+        return None, None
+    return arrays, int(arrays['log_id'].max())
+
+
+def _drop_month(conn, backend_name, start, end, log_ids, max_log_id):
+    """从热表删除已归档的一个月：分区能整个删除时 DROP PARTITION，否则按 log_id 分段 DELETE"""
+    cursor = conn.cursor()
+    try:
+        if backend_name == 'mysql':
+            name = partition_name(start)
+            if name in mysql_partitions(cursor):
+                cursor.execute(f"SELECT COUNT(*), COALESCE(MAX(log_id), 0) FROM event_logs PARTITION ({name})")
+                count, highest = cursor.fetchone()
+                if count == len(log_ids) and highest <= max_log_id:
+                    cursor.execute(f"ALTER TABLE event_logs DROP PARTITION {name}")
+                    return 'dropped partition'
+        ordered = np.sort(log_ids)
+        for chunk_start in range(0, len(ordered), DELETE_CHUNK):
+            chunk = ordered[chunk_start:chunk_start + DELETE_CHUNK]
+            cursor.execute("""
+                DELETE FROM event_logs
+                WHERE log_id >= %s AND log_id <= %s AND log_time >= %s AND log_time < %s
+            """, (int(chunk[0]), int(chunk[-1]), start, end))
+            conn.commit() # Short transactions, writers are not blocked for the whole month
+        return 'deleted'
+    finally:
+        cursor.close()
+
+
+def archive_logs(backend, archive, cutoff, dry_run=False, progress=None):
+    """
+    把 cutoff（某月第一天）之前的热日志按月归档，返回 [(月份, 归档行数, 热表处理方式)]。
+    1. 先把 archived_before 推进到 cutoff，写接口从此拒绝这些月份的日志
+    2. 逐月读取，与已有的归档合并后写入新版本的列文件并更新 manifest
+    3. 从热表删除这个月（MySQL 分区直接 DROP PARTITION）
+    中途失败可以直接重跑：已归档但还没删除的行在读取时按 log_id 去重，重跑时合并后再删除。
+    """
+    _require_numpy()
+    conn = backend.connect()
+    cursor = conn.cursor()
+    results = []
+    try:
+        # ORDER BY + LIMIT instead of MIN(): reads one idx_event_logs_time entry and keeps the DATETIME type on SQLite
+        cursor.execute("SELECT log_time FROM event_logs WHERE log_time < %s ORDER BY log_time LIMIT 1", (cutoff,))
+        oldest = cursor.fetchone()
+        oldest = oldest[0] if oldest else None
+        if backend.name == 'mysql' and not dry_run:
+            created = ensure_future_partitions(cursor)
+            if created and progress:
+                progress(f"created partitions {', '.join(created)}")
+        if oldest is None:
+            return results
+        if not dry_run:
+            archive.set_archived_before(cutoff)
+
+        month = month_start(oldest)
+        while month < cutoff:
+            end = add_months(month, 1)
+            key = month_key(month)
+            arrays, max_log_id = _read_month(conn, month, end)
+            if arrays is None:
+                month = end
+                continue
+            if dry_run:
+                results.append((key, len(arrays['log_id']), 'dry run'))
+            else:
+                existing = archive.month_arrays(key)
+                merged = merge_arrays([existing, arrays] if existing is not None else [arrays])
+                archive.write_month(key, merged)
+                action = _drop_month(conn, backend.name, month, end, arrays['log_id'], max_log_id)
+                results.append((key, len(merged['log_id']), action))
+            if progress:
+                progress(f"{key}: {results[-1][1]} logs, {results[-1][2]}")
+            month = end
+        return results
+    finally:
+        cursor.close()
+        conn.close()
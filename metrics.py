@@ -0,0 +1,279 @@
+"""
+进程内的 Prometheus 指标（文本格式 0.0.4），不依赖 prometheus_client。
+- Counter / Histogram 带标签，observe() 只做一次二分查找和几次加法，常开的开销可以忽略
+- InstrumentedCursor 包装数据库游标，按查询形态记录 execute 和读取结果的耗时
+- Registry.render() 生成 /metrics 的响应文本；gauge_callback 在抓取时读取连接池等组件的当前状态
+多进程部署（gunicorn 多 worker）时每个进程各自计数，由 Prometheus 按实例汇总。
+"""
+import re
+import time
+import bisect
+import hashlib
+import threading
+
+# Seconds, request and query latencies are mostly well under a second
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_SHAPES_MAX = 200 # Distinct query labels, later shapes are counted as 'other'
+QUERY_TEXT_MAX = 300
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {} # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = 'le="%s"' % _format_value(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._metrics = []
+        self._gauges = [] # (name, documentation, labelnames, callback returning [(labels, value)])
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(f"{self.prefix}_{name}", documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(f"{self.prefix}_{name}", documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge_callback(self, name, documentation, callback, labelnames=()):
+        """抓取时调用 callback()，返回 [(标签值元组, 数值)]"""
+        self._gauges.append((f"{self.prefix}_{name}", documentation, tuple(labelnames), callback))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, documentation, labelnames, callback in self._gauges:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+            try:
+                samples = callback()
+            except Exception as err: # A broken collector must not break the whole scrape
+                print(f"Warning: metrics collector {name} failed: {err}")
+                continue
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# --- 查询形态 ---
+_PLACEHOLDER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_VALUES_ROWS = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+_UNION_PROBES = re.compile(r'(\bUNION ALL\b.*?\bAS p)\d+', re.IGNORECASE)
+
+
+class QueryShapes:
+    """
+    把 SQL 归一成查询形态标签："<动词> <表> <短哈希>"，IN 列表和多行 VALUES 的长度不影响形态。
+    结果按原始 SQL 缓存；形态数超过 QUERY_SHAPES_MAX 后新的形态记为 'other'，防止标签基数失控。
+    """
+
+    def __init__(self, limit=QUERY_SHAPES_MAX):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._by_sql = {}
+        self._texts = {} # label -> normalized SQL, exported as an info gauge
+
+    def label(self, sql):
+        label = self._by_sql.get(sql)
+        if label is not None:
+            return label
+        text = ' '.join(sql.split())
+        text = _PLACEHOLDER_LIST.sub('(?)', text)
+        text = _VALUES_ROWS.sub('(?), ...', text)
+        text = _UNION_PROBES.sub(r'\1N', text)
+        words = text.split()
+        verb = words[0].upper() if words else '?'
+        table = '?'
+        keyword = {'SELECT': 'FROM', 'DELETE': 'FROM', 'INSERT': 'INTO', 'UPDATE': 'UPDATE'}.get(verb)
+        if keyword:
+            upper = [word.upper() for word in words]
+            if keyword in upper and upper.index(keyword) + 1 < len(words):
+                table = words[upper.index(keyword) + 1].strip('(),`')
+        label = f"{verb} {table} {hashlib.sha1(text.encode('utf-8')).hexdigest()[:8]}"
+        with self._lock:
+            if label not in self._texts and len(self._texts) >= self.limit:
+                label = 'other'
+            else:
+                self._texts.setdefault(label, text[:QUERY_TEXT_MAX])
+            if len(self._by_sql) < self.limit * 20: # Distinct SQL strings, bounded as well
+                self._by_sql[sql] = label
+        return label
+
+    def texts(self):
+        with self._lock:
+            return dict(self._texts)
+
+
+# --- 游标包装 ---
+class InstrumentedCursor:
+    """
+    记录 execute / executemany 与读取结果的耗时（按查询形态），以及数据库错误。
+    其余属性和方法透传给原游标。
+    """
+    __slots__ = ('_cursor', '_instruments', '_label')
+
+    def __init__(self, cursor, instruments):
+        self._cursor = cursor
+        self._instruments = instruments
+        self._label = None
+
+    def _timed(self, method, sql, params):
+        instruments = self._instruments
+        label = self._label = instruments.shapes.label(sql)
+        started = time.perf_counter()
+        try:
+            return method(sql, params)
+        except Exception as err:
+            if instruments.enabled:
+                instruments.errors.inc(type(err).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if instruments.enabled:
+                instruments.query_seconds.observe(elapsed, label)
+            for hook in instruments.statement_hooks:
+                hook(label, sql, params, elapsed)
+
+    def execute(self, sql, params=()):
+        return self._timed(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, seq_params):
+        return self._timed(self._cursor.executemany, sql, seq_params)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            instruments = self._instruments
+            elapsed = time.perf_counter() - started
+            if instruments.enabled:
+                instruments.fetch_seconds.inc(self._label or 'unknown', amount=elapsed)
+            for hook in instruments.fetch_hooks:
+                hook(self._label, elapsed)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size=1):
+        return self._fetch(self._cursor.fetchmany, size)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class DatabaseInstruments:
+    """
+    数据库相关指标：查询耗时、读取耗时、连接获取耗时、错误数。
+    enabled=False 时不记录耗时和错误数，游标包装只为 add_listener 注册的监听者（性能分析、慢查询日志）计时。
+    """
+
+    def __init__(self, registry, errors, enabled=True):
+        self.shapes = QueryShapes()
+        self.errors = errors
+        self.enabled = enabled
+        self.query_seconds = registry.histogram(
+            'db_query_duration_seconds', "Time spent in cursor execute() by query shape", ['query'])
+        self.fetch_seconds = registry.counter(
+            'db_fetch_seconds_total', "Time spent reading result rows by query shape", ['query'])
+        self.acquire_seconds = registry.histogram(
+            'db_pool_acquire_seconds', "Time to check a connection out of the pool, including waits and reconnects")
+        registry.gauge_callback('db_query_info', "Normalized SQL of each query shape label",
+                                lambda: [((label, text), 1) for label, text in sorted(self.shapes.texts().items())],
+                                ['query', 'sql'])
+        self.checkout_hooks = []
+        self.statement_hooks = []
+        self.fetch_hooks = []
+
+    def add_listener(self, listener):
+        """
+        listener 可以实现 checkout(seconds) / statement(label, sql, params, seconds) / fetched(label, seconds)
+        中的任意几个，在请求线程里同步调用，必须很快且不抛异常（例如 profiling.Profiler、profiling.SlowQueryLog）
+        """
+        for name, hooks in (('checkout', self.checkout_hooks), ('statement', self.statement_hooks),
+                            ('fetched', self.fetch_hooks)):
+            method = getattr(listener, name, None)
+            if method:
+                hooks.append(method)
+
+    def wrap_cursor(self, cursor):
+        return InstrumentedCursor(cursor, self)
+
+    def observe_checkout(self, seconds):
+        if self.enabled:
+            self.acquire_seconds.observe(seconds)
+        for hook in self.checkout_hooks:
+            hook(seconds)
@@ -0,0 +1,343 @@
+"""
+版本化的数据库结构迁移（仓库维护，MySQL 与 SQLite 共用）。
+
+每个迁移由若干步骤组成，步骤在执行前检查对象是否已存在，所以对手工建好的库重复执行也是安全的：
+- ('table', 表名, {'mysql': DDL, 'sqlite': DDL})
+- ('index', 表名, 索引名, 列[, 后端])   给出后端元组时只在这些后端上创建（MySQL 的基础索引写在建表语句里）
+- ('trigger', 触发器名, {'sqlite': DDL})     只在给出 DDL 的后端上创建
+- ('call', 说明, 函数[, 后端])               函数接收迁移连接上的 cursor，用于回填数据或后端专有的结构调整
+已执行的版本记录在 schema_migrations 表里。新增迁移只能追加到 MIGRATIONS 末尾，不要修改已发布的迁移。
+"""
+from datetime import datetime
+
+MIGRATIONS_TABLE_DDL = {
+    'mysql': """
+        CREATE TABLE schema_migrations (
+            version INT NOT NULL PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    """,
+    'sqlite': """
+        CREATE TABLE schema_migrations (
+            version INTEGER NOT NULL PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    """,
+}
+
+MIGRATIONS = [
+    (1, "Base tables", [
+        ('table', 'event_info', {
+            'mysql': """
+                CREATE TABLE event_info (
+                    event_id INT AUTO_INCREMENT PRIMARY KEY,
+                    event_name VARCHAR(255) NOT NULL,
+                    event_desc TEXT,
+                    create_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    update_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    responsible_person VARCHAR(100),
+                    event_del_status TINYINT NOT NULL DEFAULT 1,
+                    event_mark_status TINYINT NOT NULL DEFAULT 0
+                )
+            """,
+            'sqlite': """
+                CREATE TABLE event_info (
+                    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_name TEXT NOT NULL,
+                    event_desc TEXT,
+                    create_time DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+                    update_time DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+                    responsible_person TEXT,
+                    event_del_status INTEGER NOT NULL DEFAULT 1,
+                    event_mark_status INTEGER NOT NULL DEFAULT 0
+                )
+            """,
+        }),
+        # Stands in for MySQL's ON UPDATE CURRENT_TIMESTAMP
+        ('trigger', 'trg_event_info_update_time', {
+            'sqlite': """
+                CREATE TRIGGER trg_event_info_update_time AFTER UPDATE ON event_info
+                FOR EACH ROW WHEN NEW.update_time = OLD.update_time
+                BEGIN
+                    UPDATE event_info SET update_time = datetime('now', 'localtime') WHERE event_id = NEW.event_id;
+                END
+            """,
+        }),
+        ('table', 'event_statistics', {
+            'mysql': """
+                CREATE TABLE event_statistics (
+                    stat_id INT AUTO_INCREMENT PRIMARY KEY,
+                    event_id INT NOT NULL UNIQUE,
+                    last_start_time DATETIME(6),
+                    last_stop_time DATETIME(6),
+                    total_duration_seconds DECIMAL(20, 4) NOT NULL DEFAULT 0,
+                    event_status TINYINT NOT NULL DEFAULT 0
+                )
+            """,
+            'sqlite': """
+                CREATE TABLE event_statistics (
+                    stat_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_id INTEGER NOT NULL UNIQUE,
+                    last_start_time DATETIME,
+                    last_stop_time DATETIME,
+                    total_duration_seconds DECIMAL NOT NULL DEFAULT 0,
+                    event_status INTEGER NOT NULL DEFAULT 0
+                )
+            """,
+        }),
+        ('table', 'event_logs', {
+            'mysql': """
+                CREATE TABLE event_logs (
+                    log_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    event_id INT NOT NULL,
+                    log_type TINYINT NOT NULL,
+                    log_time DATETIME(6) NOT NULL,
+                    KEY idx_event_time (event_id, log_time)
+                )
+            """,
+            'sqlite': """
+                CREATE TABLE event_logs (
+                    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_id INTEGER NOT NULL,
+                    log_type INTEGER NOT NULL,
+                    log_time DATETIME NOT NULL
+                )
+            """,
+        }),
+        ('index', 'event_logs', 'idx_event_logs_event_time', 'event_id, log_time', ('sqlite',)),
+        # 每个事件每天的累计时长（只包含已结束的计时段），跨午夜的计时段按天拆分
+        ('table', 'event_daily_durations', {
+            'mysql': """
+                CREATE TABLE event_daily_durations (
+                    event_id INT NOT NULL,
+                    day DATE NOT NULL,
+                    duration_seconds DECIMAL(20, 4) NOT NULL DEFAULT 0,
+                    PRIMARY KEY (event_id, day),
+                    KEY idx_day_event (day, event_id, duration_seconds)
+                )
+            """,
+            'sqlite': """
+                CREATE TABLE event_daily_durations (
+                    event_id INTEGER NOT NULL,
+                    day DATE NOT NULL,
+                    duration_seconds DECIMAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (event_id, day)
+                ) WITHOUT ROWID
+            """,
+        }),
+        ('index', 'event_daily_durations', 'idx_daily_day_event', 'day, event_id, duration_seconds', ('sqlite',)),
+    ]),
+    # Access paths of get_events / get_dashboard_data. event_id closes every index so the
+    # (sort column, event_id) order of offset and keyset pagination is read straight from the index.
+    (2, "Indexes for event list filters, sorts and the dashboard", [
+        ('index', 'event_info', 'idx_event_del_create', 'event_del_status, create_time, event_id'),
+        ('index', 'event_info', 'idx_event_del_update', 'event_del_status, update_time, event_id'),
+        ('index', 'event_info', 'idx_event_del_name', 'event_del_status, event_name, event_id'),
+        ('index', 'event_info', 'idx_event_del_person', 'event_del_status, responsible_person, event_id'),
+        ('index', 'event_info', 'idx_event_del_person_create',
+         'event_del_status, responsible_person, create_time, event_id'),
+        ('index', 'event_info', 'idx_event_mark_del_create',
+         'event_mark_status, event_del_status, create_time, event_id'),
+        # /api/persons: DISTINCT straight from the index
+        ('index', 'event_info', 'idx_event_person', 'responsible_person'),
+        # show_deleted=true lists have no event_del_status predicate
+        ('index', 'event_info', 'idx_event_create', 'create_time, event_id'),
+        # Covering index for the LEFT JOIN: the list never touches the statistics rows themselves
+        ('index', 'event_statistics', 'idx_stats_event_cover',
+         'event_id, event_status, total_duration_seconds, last_start_time, last_stop_time'),
+        ('index', 'event_statistics', 'idx_stats_status_event', 'event_status, event_id'),
+        # Log export by time range, in log_time order
+        ('index', 'event_logs', 'idx_event_logs_time', 'log_time'),
+    ]),
+    (3, "N-gram index for event name search", [
+        ('table', 'event_name_grams', {
+            'mysql': """
+                CREATE TABLE event_name_grams (
+                    gram VARCHAR(2) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+                    event_id INT NOT NULL,
+                    pos SMALLINT NOT NULL,
+                    PRIMARY KEY (gram, event_id),
+                    KEY idx_name_grams_prefix (gram, pos),
+                    KEY idx_name_grams_event (event_id)
+                )
+            """,
+            'sqlite': """
+                CREATE TABLE event_name_grams (
+                    gram TEXT NOT NULL,
+                    event_id INTEGER NOT NULL,
+                    pos INTEGER NOT NULL,
+                    PRIMARY KEY (gram, event_id)
+                ) WITHOUT ROWID
+            """,
+        }),
+        ('index', 'event_name_grams', 'idx_name_grams_prefix', 'gram, pos', ('sqlite',)),
+        ('index', 'event_name_grams', 'idx_name_grams_event', 'event_id', ('sqlite',)),
+        ('call', "index existing event names", lambda cursor: _name_search().rebuild_with_cursor(cursor)),
+    ]),
+    # Running sessions for the duration report (event_status = 1 AND last_start_time < ...)
+    (4, "Index for running sessions", [
+        ('index', 'event_statistics', 'idx_stats_status_start', 'event_status, last_start_time, event_id'),
+    ]),
+    # 每个负责人的事件数 / 进行中数 / 累计时长，随写入增量维护（见 person_summary.py）
+    # Partitioning event_logs rebuilds the whole table, so it is not a migration: flask --app app partition-logs
+    (5, "Per-person summary table", [
+        ('table', 'person_summary', {
+            'mysql': """
+                CREATE TABLE person_summary (
+                    responsible_person VARCHAR(100) NOT NULL PRIMARY KEY,
+                    event_count INT NOT NULL DEFAULT 0,
+                    deleted_count INT NOT NULL DEFAULT 0,
+                    running_count INT NOT NULL DEFAULT 0,
+                    total_duration_seconds DECIMAL(20, 4) NOT NULL DEFAULT 0
+                )
+            """,
+            'sqlite': """
+                CREATE TABLE person_summary (
+                    responsible_person TEXT NOT NULL PRIMARY KEY,
+                    event_count INTEGER NOT NULL DEFAULT 0,
+                    deleted_count INTEGER NOT NULL DEFAULT 0,
+                    running_count INTEGER NOT NULL DEFAULT 0,
+                    total_duration_seconds DECIMAL NOT NULL DEFAULT 0
+                ) WITHOUT ROWID
+            """,
+        }),
+        ('call', "summarize existing events", lambda cursor: _person_summary().rebuild_with_cursor(cursor)),
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _name_search():
+    import name_search # Imported lazily: name_search imports storage, which imports this module
+    return name_search
+
+
+def _person_summary():
+    import person_summary # Imported lazily, as name_search
+    return person_summary
+
+
+# --- Existence checks ---
+def _existing_objects(cursor, dialect):
+    """返回 (表名集合, {(表名, 索引名)}, 触发器名集合)"""
+    if dialect == 'sqlite':
+        cursor.execute("SELECT type, name, tbl_name FROM sqlite_master")
+        rows = cursor.fetchall()
+        tables = {name for kind, name, _ in rows if kind == 'table'}
+        indexes = {(table, name) for kind, name, table in rows if kind == 'index'}
+        triggers = {name for kind, name, _ in rows if kind == 'trigger'}
+        return tables, indexes, triggers
+    cursor.execute("SHOW TABLES")
+    tables = {row[0] for row in cursor.fetchall()}
+    indexes = set()
+    if tables:
+        cursor.execute("""
+            SELECT DISTINCT table_name, index_name FROM information_schema.statistics
+            WHERE table_schema = DATABASE()
+        """)
+        indexes = {(table, name) for table, name in cursor.fetchall()}
+    return tables, indexes, set()
+
+
+def _apply_step(cursor, dialect, step, existing):
+    tables, indexes, triggers = existing
+    kind = step[0]
+    if kind == 'table':
+        _, name, ddl = step
+        if name in tables:
+            return None
+        cursor.execute(ddl[dialect])
+        tables.add(name)
+        return f"table {name}"
+    if kind == 'index':
+        _, table, name, columns, *dialects = step
+        if (dialects and dialect not in dialects[0]) or (table, name) in indexes:
+            return None
+        cursor.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+        indexes.add((table, name))
+        return f"index {table}.{name}"
+    if kind == 'trigger':
+        _, name, ddl = step
+        if dialect not in ddl or name in triggers:
+            return None
+        cursor.execute(ddl[dialect])
+        triggers.add(name)
+        return f"trigger {name}"
+    if kind == 'call':
+        _, description, function, *dialects = step
+        if dialects and dialect not in dialects[0]:
+            return None
+        function(cursor)
+        return description
+    raise ValueError(f"Unknown migration step {kind!r}")
+
+
+def analyze(backend):
+    """
+    刷新 SQLite 的查询规划统计（sqlite_stat1）。没有统计时 SQLite 按固定假设选索引，
+    例如按时间范围导出日志时会从 event_info 驱动而不是走 log_time 索引。
+    analysis_limit 限制每个索引的采样行数，大库上也只需要很短时间。MySQL 由 InnoDB 自动维护统计，不需要处理。
+    """
+    if backend.name != 'sqlite':
+        return
+    conn = backend.connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("PRAGMA analysis_limit = 1000")
+        cursor.execute("ANALYZE")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# --- Runner ---
+def applied_versions(backend):
+    conn = backend.connect()
+    cursor = conn.cursor()
+    try:
+        tables = _existing_objects(cursor, backend.name)[0]
+        if 'schema_migrations' not in tables:
+            return {}
+        cursor.execute("SELECT version, applied_at FROM schema_migrations ORDER BY version")
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def migrate(backend, target=None, progress=None):
+    """
+    执行所有未执行的迁移（或直到 target 版本），返回 [(版本, 描述, [创建的对象])]。
+    MySQL 的 DDL 会隐式提交，所以每个迁移单独记录版本，中途失败时已完成的迁移不会重复执行。
+    """
+    dialect = backend.name
+    conn = backend.connect()
+    cursor = conn.cursor()
+    applied = []
+    try:
+        existing = _existing_objects(cursor, dialect)
+        if 'schema_migrations' not in existing[0]:
+            cursor.execute(MIGRATIONS_TABLE_DDL[dialect])
+            existing[0].add('schema_migrations')
+        cursor.execute("SELECT version FROM schema_migrations")
+        done = {row[0] for row in cursor.fetchall()}
+
+        for version, description, steps in MIGRATIONS:
+            if version in done or (target is not None and version > target):
+                continue
+            if progress:
+                progress(version, description)
+            created = [name for name in (_apply_step(cursor, dialect, step, existing) for step in steps) if name]
+            cursor.execute("INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s)",
+                           (version, description, datetime.now().replace(microsecond=0)))
+            conn.commit()
+            applied.append((version, description, created))
+    finally:
+        cursor.close()
+        conn.close()
+    if any(created for _, _, created in applied):
+        analyze(backend)
+    return applied
@@ -0,0 +1,189 @@
+import time
+import unicodedata
+
+from cache import TTLCache
+from storage import DB_ERRORS, is_missing_table
+
+# 事件名称的 n-gram 索引 event_name_grams（定义见 migrations.py）：
+# 每个事件名称规范化后的单字、双字片段各一行，记录首次出现的位置。
+# 中文名称没有分词边界，全文索引不适用，用 n-gram 代替:
+# - 子串搜索：查询词的所有双字片段（单字查询用单字片段）都命中的事件为候选，再用 LIKE 校验
+# - 前缀补全：查询词开头的片段出现在位置 0
+# 写接口在各自的事务里调用 index_event() 保持同步，全量重建用 flask --app app rebuild-search-index。
+
+NGRAM_SIZES = (1, 2)
+MAX_QUERY_GRAMS = 16 # Longer terms only look up their first grams, the LIKE check still sees the whole term
+MAX_JOIN_GRAMS = 3 # The rarest grams narrow candidates enough, each extra join costs more than the LIKE check saves
+INDEX_MAX_RATIO = 0.05 # A rarest gram in more than this share of events makes a LIKE scan the cheaper plan
+GRAM_STATS_TTL = 300 # Seconds, gram frequencies only steer the plan so they may lag behind
+INSERT_CHUNK = 1000
+MISSING_TABLE_RETRY_SECONDS = 60
+
+# Rank for ?sort_by=relevance: earlier match first, then shorter names (exact match < prefix < substring)
+RELEVANCE_SQL = ("(CASE INSTR(LOWER(e.event_name), %s) WHEN 0 THEN 255 ELSE INSTR(LOWER(e.event_name), %s) END)"
+                 " * 1000 + CHAR_LENGTH(e.event_name)")
+
+_table_missing_until = 0.0
+_gram_stats = TTLCache(ttl=GRAM_STATS_TTL, maxsize=4096)
+_EVENTS_TOTAL = ('events',)
+
+
+def normalize(text):
+    """NFKD 去掉音调符号并统一大小写 / 全半角，中文不受影响"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def name_grams(name):
+    """返回 {片段: 首次出现位置}，包含空白的片段不索引"""
+    text = normalize(name)
+    grams = {}
+    for size in NGRAM_SIZES:
+        for pos in range(len(text) - size + 1):
+            gram = text[pos:pos + size]
+            if any(ch.isspace() for ch in gram):
+                continue
+            grams.setdefault(gram, pos)
+    return grams
+
+
+def _query_grams(term):
+    text = normalize(term).strip()
+    grams = []
+    for pos in range(len(text) - 1):
+        gram = text[pos:pos + 2]
+        if not any(ch.isspace() for ch in gram) and gram not in grams:
+            grams.append(gram)
+    if not grams: # Single character, or characters separated by spaces
+        grams = [ch for ch in dict.fromkeys(text) if not ch.isspace()]
+    return grams[:MAX_QUERY_GRAMS]
+
+
+def index_ready():
+    return time.monotonic() >= _table_missing_until
+
+
+def gram_frequencies(conn, grams):
+    """返回 ({片段: 包含它的事件数}, 事件总数)，结果缓存 GRAM_STATS_TTL 秒；查询失败时返回 (None, None)"""
+    missing = [gram for gram in grams if _gram_stats.get(gram) is None]
+    total = _gram_stats.get(_EVENTS_TOTAL)
+    if missing or total is None:
+        cursor = conn.cursor()
+        try:
+            if missing:
+                placeholders = ", ".join(["%s"] * len(missing))
+                cursor.execute(f"SELECT gram, COUNT(*) FROM event_name_grams WHERE gram IN ({placeholders}) GROUP BY gram",
+                               tuple(missing))
+                counts = dict(cursor.fetchall())
+                for gram in missing:
+                    _gram_stats.set(gram, counts.get(gram, 0))
+            if total is None:
+                # Highest id instead of COUNT(*): one index lookup, and close enough to steer the plan
+                cursor.execute("SELECT COALESCE(MAX(event_id), 0) FROM event_info")
+                total = cursor.fetchone()[0]
+                _gram_stats.set(_EVENTS_TOTAL, total)
+        except DB_ERRORS as err:
+            print(f"Warning: could not read event_name_grams statistics: {err}")
+            return None, None
+        finally:
+            cursor.close()
+    return {gram: _gram_stats.get(gram, 0) for gram in grams}, total
+
+
+def search_condition(term, conn=None):
+    """
+    子串搜索的候选条件 (事件表别名 e)，返回 (sql, params)；不适合走索引时返回 (None, [])。
+    给出 conn 时按片段频率挑最稀有的 MAX_JOIN_GRAMS 个片段，最稀有的片段也很常见时返回 None，由 LIKE 扫描。
+    写成无 GROUP BY 的自连接 IN 子查询，MySQL 可以转成 semi-join，从最稀有片段的索引驱动而不是扫描 event_info。
+    调用方仍然要加上 LIKE 条件校验片段的先后顺序。
+    """
+    grams = _query_grams(term)
+    if not grams:
+        return None, []
+    if conn is not None:
+        frequencies, total = gram_frequencies(conn, grams)
+        if frequencies is None:
+            return None, []
+        grams.sort(key=frequencies.get)
+        if frequencies[grams[0]] > INDEX_MAX_RATIO * total:
+            return None, []
+    grams = grams[:MAX_JOIN_GRAMS]
+    joins = "".join(
+        f" JOIN event_name_grams g{i} ON g{i}.gram = %s AND g{i}.event_id = g0.event_id"
+        for i in range(1, len(grams)))
+    return f"e.event_id IN (SELECT g0.event_id FROM event_name_grams g0{joins} WHERE g0.gram = %s)", grams[1:] + grams[:1]
+
+
+def prefix_condition(term):
+    """前缀补全的候选条件：查询词的第一个片段出现在名称开头"""
+    text = normalize(term).strip()
+    if not text:
+        return None, []
+    gram = text[:2] if len(text) > 1 and not text[1].isspace() else text[:1]
+    return "e.event_id IN (SELECT g.event_id FROM event_name_grams g WHERE g.gram = %s AND g.pos = 0)", [gram]
+
+
+def relevance_params(term):
+    needle = term.strip().lower()
+    return [needle, needle]
+
+
+def _insert_grams(cursor, rows):
+    for chunk_start in range(0, len(rows), INSERT_CHUNK):
+        cursor.executemany("INSERT INTO event_name_grams (gram, event_id, pos) VALUES (%s, %s, %s)",
+                           rows[chunk_start:chunk_start + INSERT_CHUNK])
+
+
+def index_event(cursor, event_id, name, replace=True):
+    """
+    在调用方的事务里（重新）索引一个事件名称。
+    表不存在时只打印警告（不影响事件写入），每隔 MISSING_TABLE_RETRY_SECONDS 秒再尝试。
+    """
+    global _table_missing_until
+    if not index_ready():
+        return
+    try:
+        if replace:
+            cursor.execute("DELETE FROM event_name_grams WHERE event_id = %s", (event_id,))
+        _insert_grams(cursor, [(gram, event_id, pos) for gram, pos in name_grams(name).items()])
+    except DB_ERRORS as err:
+        if not is_missing_table(err):
+            raise
+        _table_missing_until = time.monotonic() + MISSING_TABLE_RETRY_SECONDS
+        print("Warning: event_name_grams does not exist, run `flask --app app migrate` to create it")
+
+
+def rebuild_with_cursor(cursor, progress=None):
+    """在调用方的事务里清空并重建整个索引，返回索引的事件数"""
+    global _table_missing_until
+    cursor.execute("SELECT event_id, event_name FROM event_info")
+    events = cursor.fetchall()
+    cursor.execute("DELETE FROM event_name_grams")
+    rows = []
+    for done, (event_id, name) in enumerate(events, 1):
+        rows.extend((gram, event_id, pos) for gram, pos in name_grams(name).items())
+        if len(rows) >= INSERT_CHUNK * 10:
+            _insert_grams(cursor, rows)
+            rows = []
+        if progress and done % 10000 == 0:
+            progress(done)
+    _insert_grams(cursor, rows)
+    _table_missing_until = 0.0
+    return len(events)
+
+
+def rebuild(backend, progress=None):
+    """全量重建名称索引（事件名称被绕过接口直接修改后使用）"""
+    backend.ensure_schema()
+    conn = backend.connect()
+    cursor = conn.cursor()
+    try:
+        count = rebuild_with_cursor(cursor, progress)
+        conn.commit()
+        return count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,272 @@
+"""
+负责人汇总表 person_summary：每个负责人的事件数、已删除的事件数、进行中的事件数和累计时长。
+事件的创建、改派、删除和开始/停止在各自的事务里增量更新它，/api/persons 直接读取，不再对 event_info 做 DISTINCT / GROUP BY。
+- 只统计有负责人的事件；事件数、进行中数和累计时长只算未删除的事件
+- 累计时长只包含已结束的计时段，与 event_statistics.total_duration_seconds 相同
+- 开始/停止在同一个事务里更新负责人的汇总行，行锁持有到提交，所以同一负责人的计时写入是串行的
+  （不同负责人之间不受影响）
+- 表的定义见 migrations.py；check / rebuild 从 event_info + event_statistics 重新聚合后核对或重写
+  (flask --app app rebuild-person-summary [--apply])
+"""
+import time
+from decimal import Decimal
+
+from storage import DB_ERRORS, is_missing_table
+
+UPSERT_CHUNK = 1000
+MISSING_TABLE_RETRY_SECONDS = 60
+DURATION_TOLERANCE = 0.01 # Seconds, SQLite accumulates durations as floats
+FIELDS = ('event_count', 'deleted_count', 'running_count', 'total_duration_seconds')
+ZERO = (0, 0, 0, Decimal(0))
+
+_table_missing_until = 0.0
+
+# Start/stop of a single event, the caller already read the person with the event row
+LOG_DELTA_SQL = """
+    UPDATE person_summary
+    SET running_count = running_count + %s, total_duration_seconds = total_duration_seconds + %s
+    WHERE responsible_person = %s
+"""
+SUMMARY_SQL = """
+    SELECT responsible_person, event_count, deleted_count, running_count, total_duration_seconds
+    FROM person_summary
+    WHERE event_count > 0 OR deleted_count > 0
+    ORDER BY responsible_person ASC
+"""
+AGGREGATE_SQL = """
+    SELECT e.responsible_person,
+           SUM(CASE WHEN e.event_del_status = 0 THEN 0 ELSE 1 END),
+           SUM(CASE WHEN e.event_del_status = 0 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN e.event_del_status <> 0 AND s.event_status = 1 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN e.event_del_status <> 0 THEN COALESCE(s.total_duration_seconds, 0) ELSE 0 END)
+    FROM event_info e
+    LEFT JOIN event_statistics s ON e.event_id = s.event_id
+    WHERE e.responsible_person IS NOT NULL AND e.responsible_person != ''
+    GROUP BY e.responsible_person
+"""
+SNAPSHOT_COLUMNS = ('event_id', 'responsible_person', 'event_del_status', 'event_status', 'total_duration_seconds')
+
+
+# --- 增量 ---
+def contribution(person, del_status, event_status, total):
+    """一个事件对其负责人汇总行的贡献 (事件数, 已删除数, 进行中数, 时长)，没有负责人时返回 None"""
+    if not person:
+        return None
+    if del_status == 0:
+        return (0, 1, 0, Decimal(0))
+    return (1, 0, 1 if event_status == 1 else 0, Decimal(total or 0))
+
+
+def add(deltas, person, counts, sign=1):
+    """把 counts 累加到 deltas[person]（sign=-1 时减去）"""
+    if not person or counts is None:
+        return
+    current = deltas.get(person, ZERO)
+    deltas[person] = tuple(value + sign * change for value, change in zip(current, counts))
+
+
+def diff(deltas, before, after):
+    """把一个事件从 before 变成 after 的增量累加到 deltas 并返回，两者都是 (负责人, 删除状态, 计时状态, 累计时长)"""
+    add(deltas, before[0], contribution(*before), -1)
+    add(deltas, after[0], contribution(*after))
+    return deltas
+
+
+def snapshot(cursor, event_ids):
+    """读取并锁定事件的 (负责人, 删除状态, 计时状态, 累计时长)，返回 {event_id: tuple}"""
+    event_ids = sorted(event_ids)
+    if not event_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(event_ids))
+    cursor.execute(f"""
+        SELECT e.event_id, e.responsible_person, e.event_del_status,
+               COALESCE(s.event_status, 0) AS event_status,
+               COALESCE(s.total_duration_seconds, 0) AS total_duration_seconds
+        FROM event_info e
+        LEFT JOIN event_statistics s ON e.event_id = s.event_id
+        WHERE e.event_id IN ({placeholders})
+        FOR UPDATE
+    """, tuple(event_ids))
+    result = {}
+    for row in cursor.fetchall():
+        values = [row[name] for name in SNAPSHOT_COLUMNS] if isinstance(row, dict) else row
+        result[values[0]] = tuple(values[1:])
+    return result
+
+
+def upsert_statements(deltas):
+    """
+    {负责人: 增量} -> 累加到汇总表的 [(sql, params)]，全为 0 的增量跳过。
+    按负责人排序：并发的改派以相同的顺序锁定汇总行，不会互相死锁。
+    """
+    items = sorted((person, counts) for person, counts in deltas.items() if any(counts))
+    for chunk_start in range(0, len(items), UPSERT_CHUNK):
+        chunk = items[chunk_start:chunk_start + UPSERT_CHUNK]
+        values_sql = ", ".join(["(%s, %s, %s, %s, %s)"] * len(chunk))
+        flat_params = []
+        for person, counts in chunk:
+            flat_params.extend([person, *counts])
+        yield f"""
+            INSERT INTO person_summary
+                (responsible_person, event_count, deleted_count, running_count, total_duration_seconds)
+            VALUES {values_sql}
+            ON DUPLICATE KEY UPDATE
+                event_count = event_count + VALUES(event_count),
+                deleted_count = deleted_count + VALUES(deleted_count),
+                running_count = running_count + VALUES(running_count),
+                total_duration_seconds = total_duration_seconds + VALUES(total_duration_seconds)
+        """, tuple(flat_params)
+
+
+def _table_missing(err):
+    global _table_missing_until
+    if not is_missing_table(err):
+        return False
+    # A failed statement does not abort the InnoDB transaction, the caller's write still commits
+    _table_missing_until = time.monotonic() + MISSING_TABLE_RETRY_SECONDS
+    print("Warning: person_summary does not exist, run `flask --app app migrate` to create it")
+    return True
+
+
+def apply(cursor, deltas):
+    """在调用方的事务里累加 {负责人: (事件数, 已删除数, 进行中数, 时长)}；表不存在时只打印警告"""
+    if not deltas or time.monotonic() < _table_missing_until:
+        return
+    try:
+        for sql, params in upsert_statements(deltas):
+            cursor.execute(sql, params)
+    except DB_ERRORS as err:
+        if not _table_missing(err):
+            raise
+
+
+def log_delta(cursor, person, running, seconds):
+    """未删除事件开始 (running=1) / 结束 (running=-1, seconds=本次时长) 的增量，没有负责人时跳过"""
+    if not person or time.monotonic() < _table_missing_until:
+        return
+    try:
+        cursor.execute(LOG_DELTA_SQL, (running, Decimal(seconds), person))
+    except DB_ERRORS as err:
+        if not _table_missing(err):
+            raise
+
+
+async def log_delta_async(cursor, person, running, seconds, errors, is_missing):
+    """log_delta 的异步版本（async_app 的游标），errors / is_missing 同 rollups.add_sessions_async"""
+    global _table_missing_until
+    if not person or time.monotonic() < _table_missing_until:
+        return
+    try:
+        await cursor.execute(LOG_DELTA_SQL, (running, Decimal(seconds), person))
+    except errors as err:
+        if not is_missing(err):
+            raise
+        _table_missing_until = time.monotonic() + MISSING_TABLE_RETRY_SECONDS
+        print("Warning: person_summary does not exist, run `flask --app app migrate` to create it")
+
+
+def state_deltas(deltas, states):
+    """
+    app._lock_stat_states 的状态折叠了新日志之后的增量：进行中数和累计时长按前后差值计算，
+    一批日志里同一事件多次开始/停止也只产生一次增量。删除的事件不计入，没有负责人的事件由 add 跳过。
+    """
+    for state in states:
+        if state['event_del_status'] != 0:
+            add(deltas, state['responsible_person'], (
+                0, 0, (state['event_status'] == 1) - (state['initial_status'] == 1),
+                Decimal(state['total_duration_seconds'] or 0) - Decimal(state['initial_total'] or 0)))
+    return deltas
+
+
+# --- 读取 ---
+def fetch(cursor):
+    """
+    [(负责人, 事件数, 已删除数, 进行中数, 累计时长)]，按负责人排序，读取量与负责人数成正比。
+    汇总表还没有创建时（未执行迁移）退回到对 event_info 的聚合。
+    """
+    try:
+        cursor.execute(SUMMARY_SQL)
+        return cursor.fetchall()
+    except DB_ERRORS as err:
+        if not is_missing_table(err):
+            raise
+    return [(person, *counts) for person, counts in sorted(compute(cursor).items())]
+
+
+def as_dict(row):
+    """fetch 的一行转成 /api/persons?with_stats=true 返回的字典"""
+    person, events, deleted, running, total = row
+    return {
+        "responsible_person": person,
+        "event_count": int(events),
+        "deleted_count": int(deleted),
+        "running_count": int(running),
+        "total_duration_seconds": float(total or 0),
+    }
+
+
+# --- 核对 / 重建 ---
+def compute(cursor):
+    """从 event_info + event_statistics 聚合出每个负责人应有的汇总 {负责人: (四个字段)}"""
+    cursor.execute(AGGREGATE_SQL)
+    return {person: (int(events or 0), int(deleted or 0), int(running or 0), Decimal(str(total or 0)))
+            for person, events, deleted, running, total in cursor.fetchall()}
+
+
+def _current(cursor):
+    cursor.execute("SELECT responsible_person, event_count, deleted_count, running_count, total_duration_seconds "
+                   "FROM person_summary")
+    return {person: (events, deleted, running, Decimal(str(total or 0)))
+            for person, events, deleted, running, total in cursor.fetchall()}
+
+
+def differences(expected, current, tolerance=DURATION_TOLERANCE):
+    """[(负责人, {字段: (当前值, 应有值)})]，汇总表里多出来的全零行不算差异"""
+    result = []
+    for person in sorted(expected.keys() | current.keys()):
+        want = expected.get(person, ZERO)
+        have = current.get(person, ZERO)
+        fields = {}
+        for name, have_value, want_value in zip(FIELDS, have, want):
+            if name == 'total_duration_seconds':
+                if abs(float(have_value) - float(want_value)) > tolerance:
+                    fields[name] = (float(have_value), float(want_value))
+            elif have_value != want_value:
+                fields[name] = (have_value, want_value)
+        if fields:
+            result.append((person, fields))
+    return result
+
+
+def rebuild_with_cursor(cursor):
+    """在调用方的事务里清空并重新写入汇总表，返回负责人数（迁移和 rebuild 共用）"""
+    expected = compute(cursor)
+    cursor.execute("DELETE FROM person_summary")
+    for sql, params in upsert_statements(expected):
+        cursor.execute(sql, params)
+    return len(expected)
+
+
+def check(backend, apply_fixes=False, tolerance=DURATION_TOLERANCE):
+    """
+    核对汇总表，返回 (负责人数, 差异列表)。apply_fixes=True 时有差异就在同一个事务里整表重写。
+    重写期间并发的写入可能被覆盖，建议在写入低峰期执行。
+    """
+    global _table_missing_until
+    backend.ensure_schema()
+    _table_missing_until = 0.0
+    conn = backend.connect()
+    cursor = conn.cursor()
+    try:
+        expected = compute(cursor)
+        found = differences(expected, _current(cursor), tolerance)
+        if apply_fixes and found:
+            rebuild_with_cursor(cursor)
+        conn.commit()
+        return len(expected), found
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
@@ -0,0 +1,331 @@
+"""
+按需的请求剖析和慢查询日志，挂在 metrics.DatabaseInstruments 的钩子上，不需要改动各个路由。
+- 请求剖析：带管理员头 (X-Profile: <PROFILE_TOKEN>) 的请求，或按抽样率选中的请求。
+  记录分段耗时：获取连接、每条 SQL（查询形态、参数形态、执行和读取耗时）、序列化、JSON 编码，
+  汇总写进 Server-Timing 响应头，明细写入 <目录>/<id>.json，并保存 cProfile 数据 <id>.prof（可用 snakeviz / pstats 查看）
+- 慢查询日志：任何请求里执行时间超过阈值的语句，连同 EXPLAIN 结果追加到 JSON lines 文件；
+  EXPLAIN 在后台线程用独立连接执行，同一查询形态的执行计划缓存一段时间
+"""
+import os
+import hmac
+import json
+import time
+import queue
+import random
+import cProfile
+import threading
+import contextvars
+import functools
+from contextlib import nullcontext
+from datetime import datetime
+
+PROFILE_KEEP = 500 # Profile files kept in the directory, oldest are removed first
+SQL_TEXT_MAX = 2000
+_NO_SPAN = nullcontext()
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+def params_shape(params):
+    """参数的类型形态，不含取值：(str, int*120, int)，executemany 的参数是 3000x(int, int)"""
+    if params is None:
+        return "()"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in params.items()) + "}"
+    if isinstance(params, list) and params and isinstance(params[0], (tuple, list, dict)):
+        return f"{len(params)}x{params_shape(params[0])}"
+    runs = [] # [type name, count], consecutive parameters of one type collapse
+    for value in params:
+        name = type(value).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return "(" + ", ".join(name if count == 1 else f"{name}*{count}" for name, count in runs) + ")"
+
+
+class RequestProfile:
+    """一个请求的分段耗时（秒，start 是相对请求开始的偏移）"""
+
+    def __init__(self, profile_id, method, path, reason):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.endpoint = None
+        self.status = None
+        self.started = time.perf_counter()
+        self.spans = []
+        self.statements = []
+        self.profiler = None
+        self.dump = None # cProfile.Profile once stopped
+
+    def add(self, name, seconds, **details):
+        self.spans.append({'name': name, 'start': time.perf_counter() - seconds - self.started,
+                           'seconds': seconds, **details})
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def add_statement(self, label, sql, params, seconds):
+        statement = {'name': 'sql', 'start': time.perf_counter() - seconds - self.started, 'seconds': seconds,
+                     'fetch_seconds': 0.0, 'query': label, 'params': params_shape(params),
+                     'sql': ' '.join(sql.split())[:SQL_TEXT_MAX]}
+        self.spans.append(statement)
+        self.statements.append(statement)
+
+    def add_fetch(self, label, seconds):
+        # Rows are read after execute(), charge them to the latest statement of that shape
+        for statement in reversed(self.statements):
+            if statement['query'] == label:
+                statement['fetch_seconds'] += seconds
+                return
+
+    def totals(self):
+        totals = {}
+        for span in self.spans:
+            seconds = span['seconds'] + span.get('fetch_seconds', 0.0)
+            totals[span['name']] = totals.get(span['name'], 0.0) + seconds
+        return totals
+
+    def server_timing(self, total):
+        parts = []
+        for name, seconds in self.totals().items():
+            desc = f';desc="{len(self.statements)} statements"' if name == 'sql' else ''
+            parts.append(f"{name};dur={seconds * 1000:.2f}{desc}")
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+    def to_dict(self, total):
+        return {'id': self.id, 'method': self.method, 'path': self.path, 'endpoint': self.endpoint,
+                'status': self.status, 'reason': self.reason, 'total_seconds': total,
+                'totals': self.totals(), 'spans': self.spans}
+
+
+class _Span:
+    __slots__ = ('profile', 'name', 'started')
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def current():
+    return _current.get()
+
+
+def span(name):
+    """with profiling.span('serialize'): ...，当前请求没有在剖析时几乎没有开销"""
+    profile = _current.get()
+    return profile.span(name) if profile is not None else _NO_SPAN
+
+
+def instrument_json(provider):
+    """把 app.json.response()（jsonify 的实现）计入 json 分段"""
+    response = provider.response
+
+    @functools.wraps(response)
+    def timed_response(*args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return response(*args, **kwargs)
+        with profile.span('json'):
+            return response(*args, **kwargs)
+
+    provider.response = timed_response
+
+
+class Profiler:
+    """
+    决定哪些请求需要剖析，并作为 DatabaseInstruments 的监听者记录连接和 SQL 分段。
+    - token: X-Profile 头需要匹配的管理员令牌，为空时不接受请求头
+    - sample_rate: 0..1，随机抽样的请求比例
+    - directory: 剖析结果目录；cprofile=False 时只记录分段
+    """
+
+    def __init__(self, directory, token='', sample_rate=0.0, cprofile=True, keep=PROFILE_KEEP):
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.cprofile = cprofile
+        self.keep = keep
+        self._cprofile_lock = threading.Lock() # One cProfile at a time, concurrent profiles keep spans only
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    @property
+    def enabled(self):
+        return bool(self.token) or self.sample_rate > 0
+
+    def wanted(self, header_value):
+        """返回剖析原因 ('header' / 'sampled')，不需要剖析时返回 None"""
+        if self.token and header_value and hmac.compare_digest(header_value, self.token):
+            return 'header'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    def begin(self, method, path, reason):
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{sequence}"
+        profile = RequestProfile(profile_id, method, path, reason)
+        if self.cprofile and self._cprofile_lock.acquire(blocking=False):
+            profile.profiler = cProfile.Profile()
+            try:
+                profile.profiler.enable()
+            except ValueError: # Another profiler is already active in this process
+                profile.profiler = None
+                self._cprofile_lock.release()
+        _current.set(profile)
+        return profile
+
+    def finish(self, profile, endpoint, status):
+        """结束剖析，写出结果文件，返回 Server-Timing 头的取值"""
+        total = time.perf_counter() - profile.started
+        self._stop_cprofile(profile)
+        _current.set(None)
+        profile.endpoint = endpoint
+        profile.status = status
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{profile.id}.json"), 'w', encoding='utf-8') as f:
+                json.dump(profile.to_dict(total), f, ensure_ascii=False, indent=1)
+            if profile.dump is not None:
+                profile.dump.dump_stats(os.path.join(self.directory, f"{profile.id}.prof"))
+            if profile.reason == 'sampled':
+                self._prune()
+        except OSError as err:
+            print(f"Warning: could not write profile {profile.id}: {err}")
+        return profile.server_timing(total)
+
+    def discard(self):
+        """请求没有走到 finish（流式响应、未捕获的异常）时清理当前剖析"""
+        profile = _current.get()
+        if profile is not None:
+            self._stop_cprofile(profile)
+            _current.set(None)
+
+    def _stop_cprofile(self, profile):
+        if profile.profiler is not None:
+            profile.profiler.disable()
+            profile.dump, profile.profiler = profile.profiler, None
+            self._cprofile_lock.release()
+
+    def _prune(self):
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+        except OSError:
+            return
+        for name in names[:max(0, len(names) - self.keep)]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, name[:-5] + suffix))
+                except OSError:
+                    pass
+
+    # --- DatabaseInstruments 监听者 ---
+    def checkout(self, seconds):
+        profile = _current.get()
+        if profile is not None:
+            profile.add('connect', seconds)
+
+    def statement(self, label, sql, params, seconds):
+        profile = _current.get()
+        if profile is not None:
+            profile.add_statement(label, sql, params, seconds)
+
+    def fetched(self, label, seconds):
+        profile = _current.get()
+        if profile is not None:
+            profile.add_fetch(label, seconds)
+
+
+class SlowQueryLog:
+    """
+    执行时间超过 threshold 秒的语句写入 path（每行一个 JSON）。
+    explain(sql, params) 返回 (执行计划文本行, 问题列表)，只对 SELECT 调用，在后台线程执行；
+    队列满时丢弃记录，不阻塞请求。context() 可选，返回写进记录的请求信息。
+    """
+
+    def __init__(self, path, threshold, explain, context=None, explain_ttl=600, max_pending=100):
+        self.path = path
+        self.threshold = threshold
+        self.explain = explain
+        self.context = context
+        self.explain_ttl = explain_ttl
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._plans = {} # query label -> (expires_at, plan, problems)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def statement(self, label, sql, params, seconds):
+        if seconds < self.threshold:
+            return
+        entry = {'time': datetime.now().isoformat(timespec='milliseconds'), 'query': label,
+                 'seconds': round(seconds, 6), 'params': params_shape(params),
+                 'sql': ' '.join(sql.split())[:SQL_TEXT_MAX]}
+        if self.context:
+            entry.update(self.context())
+        try:
+            self._queue.put_nowait((entry, sql, params))
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='slow-query-log', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            entry, sql, params = self._queue.get()
+            try:
+                self._write(self._with_plan(entry, sql, params))
+            except Exception as err: # Keep the worker alive
+                print(f"Warning: could not write slow query log: {err}")
+            finally:
+                self._queue.task_done()
+
+    def _with_plan(self, entry, sql, params):
+        if not entry['sql'].upper().startswith(('SELECT', 'WITH')) or not isinstance(params, (tuple, list, dict)):
+            return entry
+        cached = self._plans.get(entry['query'])
+        if cached and cached[0] > time.monotonic():
+            plan, problems = cached[1], cached[2]
+        else:
+            try:
+                plan, problems = self.explain(sql, params)
+            except Exception as err:
+                plan, problems = [f"EXPLAIN failed: {err}"], []
+            self._plans[entry['query']] = (time.monotonic() + self.explain_ttl, plan, problems)
+        entry['plan'] = plan
+        entry['problems'] = [f"{kind}: {detail}" for kind, detail in problems]
+        return entry
+
+    def _write(self, entry):
+        print(f"Slow query ({entry['seconds']:.3f}s) {entry['query']}: {'; '.join(entry.get('problems', [])) or 'no plan problems'}")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+    def flush(self, timeout=5.0):
+        """等待排队的记录写完（测试和退出时用）"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
@@ -0,0 +1,195 @@
+"""
+索引检查：用 Flask test client 请求各个只读接口的典型参数组合，记录路由实际执行的 SELECT，
+再逐条执行 EXPLAIN（SQLite 为 EXPLAIN QUERY PLAN），标出全表扫描、文件排序和临时表。
+
+用法: flask --app app check-indexes [--strict] [--verbose]
+"""
+import re
+
+import migrations
+
+# (名称, 请求路径, 允许出现的问题类型, 说明)
+# status / duration sort on the LEFT JOINed statistics table, so ordering by them always needs a sort step
+SORTS = ('name', 'person', 'create_time', 'update_time', 'status', 'duration')
+JOIN_SORTS = {'status', 'duration'}
+JOIN_SORT_NOTE = "sort column lives in event_statistics (LEFT JOIN)"
+SEARCH_NOTE = "candidates come from the n-gram index and are sorted afterwards"
+
+
+def _query_shapes():
+    shapes = []
+    for sort_by in SORTS:
+        for order in ('ASC', 'DESC'):
+            expected = {'filesort', 'temporary'} if sort_by in JOIN_SORTS else set()
+            note = JOIN_SORT_NOTE if expected else None
+            path = f'/api/events?sort_by={sort_by}&sort_order={order}&limit=10'
+            shapes.append((f"events sort {sort_by} {order}", path, expected, note))
+            shapes.append((f"events cursor {sort_by} {order}", path + '&paginate=cursor&follow=1', expected, note))
+    shapes += [
+        ("events page 5", '/api/events?page=5', set(), None),
+        ("events show_deleted", '/api/events?show_deleted=true', set(), None),
+        ("events person", '/api/events?search_person=__check__', set(), None),
+        ("events unassigned", '/api/events?search_person=__unassigned__', {'filesort'},
+         "NULL OR '' reads two index ranges that have to be merged"),
+        ("events created range", '/api/events?search_created_after=2000-01-01&search_created_before=2000-01-31',
+         set(), None),
+        ("events updated range", '/api/events?search_updated_after=2000-01-01&search_updated_before=2000-01-31'
+         '&sort_by=update_time', set(), None),
+        ("events person + created", '/api/events?search_person=__check__&search_created_after=2000-01-01',
+         set(), None),
+        ("events name search", '/api/events?search_name=deploy%20re', {'filesort'}, SEARCH_NOTE),
+        ("events name search, 1 char", '/api/events?search_name=%E9%83%A8', {'filesort'}, SEARCH_NOTE),
+        ("events name search by create_time", '/api/events?search_name=deploy&sort_by=create_time', {'filesort'},
+         SEARCH_NOTE),
+        ("name suggest", '/api/events/suggest?q=dep', {'filesort'}, "shortest names first, over prefix candidates"),
+        ("dashboard", '/api/dashboard', set(), None),
+        ("persons", '/api/persons?with_stats=true', {'full_scan'},
+         "reads the whole person_summary table, one row per person"),
+        ("event detail", '/api/events/1', set(), None),
+        ("event logs", '/api/events/1/logs?from=2000-01-01&to=2000-01-31', set(), None),
+        ("report by event", '/api/reports/durations?group_by=event', {'temporary', 'filesort'}, "GROUP BY aggregate"),
+        ("report by day", '/api/reports/durations?group_by=day', {'temporary', 'filesort'}, "GROUP BY aggregate"),
+        ("report by person", '/api/reports/durations?group_by=person', {'temporary', 'filesort'},
+         "GROUP BY aggregate"),
+        ("analytics concurrency", '/api/analytics/concurrency?from=2000-01-01&to=2000-01-02&step=3600', set(), None),
+        ("analytics sessions", '/api/analytics/sessions?from=2000-01-01&to=2000-01-31&group_by=person', set(), None),
+        ("export events", '/api/export/events?from=2000-01-01&to=2000-01-31', set(), None),
+        ("export logs", '/api/export/logs?from=2000-01-01&to=2000-01-31', set(), None),
+    ]
+    return shapes
+
+
+# --- Recording connection ---
+class _RecordingCursor:
+    def __init__(self, cursor, statements):
+        self._cursor = cursor
+        self._statements = statements
+
+    def execute(self, sql, params=()):
+        if sql.lstrip()[:6].upper() == 'SELECT':
+            self._statements.append((sql, tuple(params or ())))
+        return self._cursor.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class _RecordingConnection:
+    def __init__(self, conn, statements):
+        self._conn = conn
+        self._statements = statements
+
+    def cursor(self, *args, **kwargs):
+        return _RecordingCursor(self._conn.cursor(*args, **kwargs), self._statements)
+
+    def prepared_cursor(self, sql):
+        return None # Plain cursors so every statement goes through the recorder
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def record_queries(app, pool, path, follow_cursor=False, reset=None):
+    """请求 path 并返回路由执行的 [(sql, params)]；follow_cursor 时继续请求 next_cursor 指向的下一页"""
+    statements = []
+    original = pool.get_connection
+    pool.get_connection = lambda: _RecordingConnection(original(), statements)
+    try:
+        client = app.test_client()
+        if reset:
+            reset()
+        response = client.get(path)
+        response.get_data() # Drain streamed responses so their queries run
+        body = response.get_json(silent=True)
+        if follow_cursor and isinstance(body, dict):
+            token = (body.get('pagination') or {}).get('next_cursor')
+            if token:
+                base = path.split('?', 1)[0]
+                client.get(f"{base}?limit=10&cursor={token}").get_data()
+    finally:
+        del pool.get_connection # Back to the bound method
+    return statements
+
+
+# --- EXPLAIN ---
+_SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)(?! USING (COVERING )?INDEX)')
+
+def explain(backend, sql, params):
+    """返回 (执行计划文本行, [(问题类型, 说明)])"""
+    conn = backend.connect()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            if backend.name == 'sqlite':
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                rows = cursor.fetchall()
+                lines = [row['detail'] for row in rows]
+                problems = []
+                for detail in lines:
+                    match = _SQLITE_FULL_SCAN.match(detail)
+                    if match:
+                        problems.append(('full_scan', f"full scan of {match.group(1)}"))
+                    if 'USE TEMP B-TREE' in detail:
+                        kind = 'filesort' if 'ORDER BY' in detail else 'temporary'
+                        problems.append((kind, detail))
+                return lines, problems
+
+            cursor.execute("EXPLAIN " + sql, params)
+            rows = cursor.fetchall()
+            lines, problems = [], []
+            for row in rows:
+                extra = row.get('Extra') or ''
+                lines.append(f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']} {extra}")
+                if row['type'] == 'ALL':
+                    problems.append(('full_scan', f"full scan of {row['table']} (~{row['rows']} rows)"))
+                if 'Using filesort' in extra:
+                    problems.append(('filesort', f"filesort on {row['table']}"))
+                if 'Using temporary' in extra:
+                    problems.append(('temporary', f"temporary table on {row['table']}"))
+            return lines, problems
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+
+def _normalize(sql):
+    return ' '.join(sql.split())
+
+
+def check(app, backend, pool, reset=None, verbose=False, out=print):
+    """
+    检查所有查询形态，返回 [{'shape', 'sql', 'problems', 'expected', 'note'}]。
+    reset 在每次请求前调用（清空响应缓存和计数缓存，保证路由真正访问数据库）。
+    同一条 SQL 只 EXPLAIN 一次。
+    """
+    migrations.analyze(backend) # EXPLAIN should reflect the planner's view of the current data
+    results = []
+    seen = set()
+    for name, path, tolerated, note in _query_shapes():
+        follow = '&follow=1' in path
+        statements = record_queries(app, pool, path.replace('&follow=1', ''), follow_cursor=follow, reset=reset)
+        if not statements:
+            out(f"?    {name}: no queries recorded ({path})")
+            continue
+        for number, (sql, params) in enumerate(statements, 1):
+            key = _normalize(sql)
+            if key in seen:
+                continue
+            seen.add(key)
+            lines, problems = explain(backend, sql, params)
+            unexpected = [problem for problem in problems if problem[0] not in tolerated]
+            status = 'FLAG' if unexpected else ('ok*' if problems else 'ok')
+            label = f"{name} #{number}" if len(statements) > 1 else name
+            out(f"{status:<5}{label}: {'; '.join(text for _, text in problems) or 'indexed'}"
+                + (f"  [{note}]" if problems and not unexpected and note else ''))
+            if verbose or unexpected:
+                out(f"       {key[:300]}")
+                for line in lines:
+                    out(f"         {line}")
+            results.append({'shape': name, 'sql': key, 'problems': problems,
+                            'expected': not unexpected, 'note': note})
+    return results
@@ -0,0 +1,188 @@
+"""
+读写分离：只读路由（事件列表、Dashboard、事件详情、负责人列表）从副本读取，写入和事务仍然走主库连接池。
+- 副本按顺序轮询；建连失败或查询时连接出错的副本冷却 retry_after 秒，期间的读取改走其他副本或主库
+- 复制延迟每 lag_check_interval 秒在借出的连接上查询一次，超过 max_lag 的副本不参与读取
+- 读自己的写：客户端带着最近一次写入的时间 last_write 时，之后 window 秒内的读取全部走主库。
+  Seconds_Behind_Source 只有秒级精度，在 I/O 线程落后时也会报 0，不能用来判断副本是否已经包含某次写入，
+  所以 window 应该大于正常的复制延迟
+last_write 是墙钟时间，多台应用服务器之间需要同步时钟。
+"""
+import math
+import threading
+import time
+
+from db_pool import PoolExhaustedError
+from storage import DB_ERRORS, is_connection_error
+
+LAST_WRITE_COOKIE = 'last_write' # 写请求成功后设置，值为写入时间 (Unix 秒)
+
+
+class Replica:
+    """一个副本：连接池、可用状态和最近一次测得的复制延迟"""
+
+    def __init__(self, name, backend, pool):
+        self.name = name
+        self.backend = backend
+        self.pool = pool
+        self.down_until = 0.0       # time.monotonic() until which reads skip this replica
+        self.last_error = None
+        self.failures = 0
+        self.lag = None             # Seconds, None while unknown
+        self._lag_due = 0.0         # time.monotonic() of the next measurement
+        self._probe_lock = threading.Lock()
+
+
+class _ReplicaCursor:
+    """副本连接上的游标：连接层面的错误把副本标记为不可用，后续读取回退到主库"""
+    __slots__ = ('_cursor', '_router', '_replica')
+
+    def __init__(self, cursor, router, replica):
+        self._cursor = cursor
+        self._router = router
+        self._replica = replica
+
+    def execute(self, sql, params=()):
+        try:
+            return self._cursor.execute(sql, params)
+        except DB_ERRORS as err:
+            if is_connection_error(err):
+                self._router.mark_down(self._replica, err)
+            raise
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class ReplicaRouter:
+    """
+    为只读请求选择连接。replicas 为 [Replica]，为空时 enabled 为 False，调用方直接使用主库。
+    - window: 写入之后多少秒内该客户端只读主库（读自己的写）
+    - max_lag: 复制延迟上限（秒）
+    - retry_after: 副本出错后的冷却秒数
+    - lag_check_interval: 两次测量复制延迟的最小间隔（秒）
+    """
+
+    def __init__(self, replicas, window=5.0, max_lag=30.0, retry_after=30.0, lag_check_interval=1.0):
+        self.replicas = list(replicas)
+        self.window = window
+        self.max_lag = max_lag
+        self.retry_after = retry_after
+        self.lag_check_interval = lag_check_interval
+        self.last_write = 0.0 # Wall clock time of this process's latest commit, see is_current
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.replicas)
+
+    def cursor_wrapper(self, replica, inner=None):
+        """副本连接池的 cursor_wrapper：先套上 inner（例如指标计时），再套上连接出错的检测"""
+        def wrap(cursor):
+            return _ReplicaCursor(inner(cursor) if inner else cursor, self, replica)
+        return wrap
+
+    # --- Routing ---
+    def acquire(self, last_write=None):
+        """
+        借出一个副本连接，返回 (连接, 副本, 原因)。应该读主库时连接和副本为 None，原因是：
+        - 'read_your_writes': 客户端在 last_write 之后的窗口期内
+        - 'fallback': 所有副本都不可用（出错冷却中、连接池耗尽、延迟超过上限）
+        """
+        if self.pinned(last_write):
+            return None, None, 'read_your_writes'
+        for replica in self._rotation():
+            if time.monotonic() < replica.down_until:
+                continue
+            try:
+                conn = replica.pool.get_connection()
+            except PoolExhaustedError:
+                continue # Busy, not broken
+            except DB_ERRORS as err:
+                self.mark_down(replica, err)
+                continue
+            try:
+                self._refresh_lag(replica, conn)
+            except DB_ERRORS as err:
+                conn.discard()
+                self.mark_down(replica, err)
+                continue
+            if replica.lag is not None and replica.lag > self.max_lag:
+                conn.close()
+                continue
+            return conn, replica, 'replica'
+        return None, None, 'fallback'
+
+    def pinned(self, last_write):
+        """last_write 之后的窗口期内（读主库）"""
+        return last_write is not None and time.time() - last_write < self.window
+
+    def note_write(self):
+        """本进程提交了一次写入（更新响应缓存版本号的同时调用）"""
+        self.last_write = time.time()
+
+    def is_current(self, replica):
+        """
+        从 replica 读到的结果能否放进响应缓存：本进程最近一次写入之后的窗口期内，副本可能还没有这次写入，不缓存。
+        主库 (None) 总是 True。
+        """
+        return replica is None or not self.pinned(self.last_write)
+
+    def mark_down(self, replica, err):
+        with self._lock:
+            if time.monotonic() < replica.down_until:
+                return # Concurrent requests hit the same failure
+            replica.failures += 1
+            replica.last_error = str(err)
+            replica.down_until = time.monotonic() + self.retry_after
+        print(f"Warning: replica {replica.name} failed, reading from the primary for {self.retry_after:.0f}s: {err}")
+
+    def _rotation(self):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        return self.replicas[start:] + self.replicas[:start]
+
+    def _refresh_lag(self, replica, conn):
+        if time.monotonic() < replica._lag_due or not replica._probe_lock.acquire(blocking=False):
+            return # Measured recently or another request is measuring it right now
+        try:
+            try:
+                lag = replica.backend.replica_lag(conn)
+            except DB_ERRORS as err:
+                if is_connection_error(err):
+                    raise
+                lag = None # No privilege to read the replication status: lag stays unknown
+            replica.lag = lag
+            replica._lag_due = time.monotonic() + self.lag_check_interval
+        finally:
+            replica._probe_lock.release()
+
+    # --- Statistics ---
+    def stats(self):
+        now = time.monotonic()
+        return [{
+            "name": replica.name,
+            "available": now >= replica.down_until,
+            "lag_seconds": replica.lag if replica.lag is None or math.isfinite(replica.lag) else None,
+            "replication_stopped": replica.lag == math.inf,
+            "failures": replica.failures,
+            "last_error": replica.last_error,
+            "pool": replica.pool.stats(),
+        } for replica in self.replicas]
+
+
+def create_router(backends, pool_factory, inner_wrapper=None, **options):
+    """
+    [(名称, 后端)] -> ReplicaRouter。pool_factory(connect, cursor_wrapper) 创建每个副本的连接池，
+    inner_wrapper 是主库连接池使用的游标包装（例如指标计时），副本连接池同样使用。
+    """
+    router = ReplicaRouter([], **options)
+    for name, backend in backends:
+        replica = Replica(name, backend, None)
+        replica.pool = pool_factory(backend.connect, router.cursor_wrapper(replica, inner_wrapper))
+        router.replicas.append(replica)
+    return router
@@ -0,0 +1,163 @@
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from event_log_queue import fold_log_into_stats
+from log_archive import merge_log_streams
+from storage import DB_ERRORS, is_missing_table
+
+# 汇总表 event_daily_durations 的定义见 migrations.py：每个事件每天的累计时长（只包含已结束的计时段）
+
+SECONDS_QUANTUM = Decimal('0.0001') # Matches DECIMAL(20, 4)
+UPSERT_CHUNK = 1000
+MISSING_TABLE_RETRY_SECONDS = 60
+
+_table_missing_until = 0.0
+
+
+def split_session(start, stop):
+    """把 [start, stop) 按自然日拆分，返回 [(date, Decimal 秒数), ...]"""
+    parts = []
+    if not isinstance(start, datetime) or not isinstance(stop, datetime) or stop <= start:
+        return parts
+    cursor = start
+    while cursor < stop:
+        next_midnight = datetime.combine(cursor.date() + timedelta(days=1), datetime.min.time())
+        segment_end = min(stop, next_midnight)
+        seconds = Decimal(str((segment_end - cursor).total_seconds())).quantize(SECONDS_QUANTUM)
+        if seconds:
+            parts.append((cursor.date(), seconds))
+        cursor = segment_end
+    return parts
+
+
+def aggregate_sessions(sessions, totals=None):
+    """[(event_id, start, stop), ...] -> {(event_id, day): seconds}"""
+    totals = {} if totals is None else totals
+    for event_id, start, stop in sessions:
+        for day, seconds in split_session(start, stop):
+            key = (event_id, day)
+            totals[key] = totals.get(key, Decimal(0)) + seconds
+    return totals
+
+
+def upsert_statements(totals):
+    """{(event_id, day): seconds} -> 累加到汇总表的 [(sql, params)]，每条语句最多 UPSERT_CHUNK 行"""
+    items = list(totals.items())
+    for chunk_start in range(0, len(items), UPSERT_CHUNK):
+        chunk = items[chunk_start:chunk_start + UPSERT_CHUNK]
+        values_sql = ", ".join(["(%s, %s, %s)"] * len(chunk))
+        flat_params = []
+        for (event_id, day), seconds in chunk:
+            flat_params.extend([event_id, day, seconds])
+        yield f"""
+            INSERT INTO event_daily_durations (event_id, day, duration_seconds)
+            VALUES {values_sql}
+            ON DUPLICATE KEY UPDATE duration_seconds = duration_seconds + VALUES(duration_seconds)
+        """, tuple(flat_params)
+
+
+def _upsert_totals(cursor, totals):
+    for sql, params in upsert_statements(totals):
+        cursor.execute(sql, params)
+
+
+def add_sessions(cursor, sessions):
+    """
+    在调用方的事务里把结束的计时段累加到日汇总表。
+    表不存在时只打印警告（不影响日志写入），每隔 MISSING_TABLE_RETRY_SECONDS 秒再尝试。
+    """
+    global _table_missing_until
+    if not sessions or time.monotonic() < _table_missing_until:
+        return
+    totals = aggregate_sessions(sessions)
+    if not totals:
+        return
+    try:
+        _upsert_totals(cursor, totals)
+    except DB_ERRORS as err:
+        if not is_missing_table(err):
+            raise
+        # A failed statement does not abort the InnoDB transaction, the log itself still commits
+        _table_missing_until = time.monotonic() + MISSING_TABLE_RETRY_SECONDS
+        print("Warning: event_daily_durations does not exist, run `flask --app app backfill-rollups` to create it")
+
+
+async def add_sessions_async(cursor, sessions, errors, is_missing_table):
+    """
+    add_sessions 的异步版本（async_app 的 aiomysql 游标）。
+    errors 是驱动的异常类型，is_missing_table(err) 判断是否是表不存在。
+    """
+    global _table_missing_until
+    if not sessions or time.monotonic() < _table_missing_until:
+        return
+    try:
+        for sql, params in upsert_statements(aggregate_sessions(sessions)):
+            await cursor.execute(sql, params)
+    except errors as err:
+        if not is_missing_table(err):
+            raise
+        _table_missing_until = time.monotonic() + MISSING_TABLE_RETRY_SECONDS
+        print("Warning: event_daily_durations does not exist, run `flask --app app backfill-rollups` to create it")
+
+
+def _fetch_rows(cursor, batch_size):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def backfill(backend, batch_size=10000, progress=None, archive=None):
+    """
+    从 event_logs 全量重建日汇总表（建议在写入低峰期执行）。
+    日志按 (event_id, log_time, log_id) 顺序用非缓冲游标流式读取，每个事件只在内存里保留当前状态。
+    给出 archive (log_archive.LogArchive) 时按同样的顺序合并已归档的日志。
+    返回读取的日志条数。
+    """
+    global _table_missing_until
+    # One connection streams the logs while the other writes
+    backend.ensure_schema()
+    _table_missing_until = 0.0
+    read_conn = backend.connect()
+    write_conn = backend.connect()
+    reader = read_conn.cursor(buffered=False)
+    writer = write_conn.cursor()
+    try:
+        writer.execute("DELETE FROM event_daily_durations")
+        reader.execute("SELECT event_id, log_type, log_time, log_id FROM event_logs ORDER BY event_id, log_time, log_id")
+        rows = _fetch_rows(reader, batch_size)
+        if archive is not None:
+            rows = merge_log_streams(rows, archive)
+
+        totals = {}
+        logs_read = 0
+        current_event = None
+        state = None
+        for event_id, log_type, log_time, _ in rows:
+            if event_id != current_event:
+                current_event = event_id
+                state = {'last_start_time': None, 'last_stop_time': None,
+                         'total_duration_seconds': Decimal(0), 'event_status': 0}
+            session = fold_log_into_stats(state, log_type, log_time)
+            if session:
+                aggregate_sessions([(event_id, *session)], totals)
+            logs_read += 1
+            if logs_read % batch_size == 0:
+                if len(totals) >= batch_size:
+                    _upsert_totals(writer, totals) # Additive, so a day split across flushes still adds up
+                    totals = {}
+                if progress:
+                    progress(logs_read)
+        _upsert_totals(writer, totals)
+        write_conn.commit()
+        return logs_read
+    except Exception:
+        write_conn.rollback()
+        raise
+    finally:
+        reader.close()
+        writer.close()
+        read_conn.close()
+        write_conn.close()
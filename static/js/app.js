@@ -26,6 +26,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // Filter & Pagination Elements
     const filterForm = document.getElementById('filterForm');
     const filterNameInput = document.getElementById('filterName');
+    const filterNameSuggestions = document.getElementById('filterNameSuggestions');
     const filterPersonInput = document.getElementById('filterPerson');
     const filterCreatedDateInput = document.getElementById('filterCreatedDate');
     // const filterUpdatedDateInput = document.getElementById('filterUpdatedDate'); // If added back
@@ -34,6 +35,13 @@ document.addEventListener('DOMContentLoaded', () => {
     const clearFiltersBtn = document.getElementById('clearFiltersBtn');
     const paginationControls = document.getElementById('paginationControls');
 
+    // Bulk Action Elements
+    const bulkActions = document.getElementById('bulkActions');
+    const bulkSelectedCount = document.getElementById('bulkSelectedCount');
+    const bulkPersonInput = document.getElementById('bulkPerson');
+    const bulkClearSelectionBtn = document.getElementById('bulkClearSelection');
+    const selectAllEventsCheckbox = document.getElementById('selectAllEvents');
+
     // Datalist Elements
     const addResponsiblePersonsList = document.getElementById('addResponsiblePersonsList');
     const editResponsiblePersonsList = document.getElementById('editResponsiblePersonsList');
@@ -45,8 +53,19 @@ document.addEventListener('DOMContentLoaded', () => {
     let allEventsCurrentPage = 1;
     let allEventsItemsPerPage = 10;
     let currentFilters = {}; // Store active filters
-    let liveTimerInterval = null; // Interval ID for live timers
     let flatpickrInstances = {}; // To store date picker instances
+    let eventsById = new Map(); // Last known data of the rendered rows/cards, patched by live updates
+    let eventStream = null; // EventSource for /api/stream
+    let refreshTimer = null; // Debounce timer for full refreshes triggered by the stream
+    let suggestTimer = null; // Debounce timer for name autocomplete
+    let timerFrame = null; // requestAnimationFrame ID of the live timer loop
+    let lastTimerSecond = 0; // Wall-clock second last shown by the live timers
+    let windowRenderPending = false; // A scroll/resize re-render is queued for the next frame
+    let selectedEventIds = new Set(); // Rows selected for bulk actions (current page only)
+
+    // Lists longer than this only keep the rows/cards near the viewport in the DOM
+    const VIRTUAL_LIST_THRESHOLD = 60;
+    const VIRTUAL_OVERSCAN_ROWS = 8; // Extra rows rendered above and below the viewport
 
     // --- Utility Functions ---
     function showLoading() {
@@ -115,6 +134,13 @@ document.addEventListener('DOMContentLoaded', () => {
         return parts.join(' '); // Join with space
     }
 
+    // Use Intl.DateTimeFormat for better locale support and options; built once, every row formats two dates
+    const dateTimeFormat = new Intl.DateTimeFormat(navigator.language || 'zh-CN', {
+        year: 'numeric', month: '2-digit', day: '2-digit',
+        hour: '2-digit', minute: '2-digit', second: '2-digit',
+        hour12: false // Use 24-hour format
+    });
+
     function formatDateTime(dateString) {
         if (!dateString) return 'N/A';
         try {
@@ -123,13 +149,7 @@ document.addEventListener('DOMContentLoaded', () => {
             if (isNaN(date.getTime())) { // Check for invalid date object
                 return 'Invalid Date';
             }
-            // Use Intl.DateTimeFormat for better locale support and options
-            const options = {
-                year: 'numeric', month: '2-digit', day: '2-digit',
-                hour: '2-digit', minute: '2-digit', second: '2-digit',
-                hour12: false // Use 24-hour format
-            };
-            return new Intl.DateTimeFormat(navigator.language || 'zh-CN', options).format(date);
+            return dateTimeFormat.format(date);
         } catch (e) {
             console.error("Error formatting date:", dateString, e);
             return 'Invalid Date';
@@ -193,6 +213,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
         tr.innerHTML = `
             <td class="text-center">
+                <input type="checkbox" class="form-check-input select-event me-1" data-event-id="${event.event_id}"
+                       title="选择" ${selectedEventIds.has(event.event_id) ? 'checked' : ''}>
                 <span class="status-indicator ${event.event_status === 1 ? 'running' : 'stopped'}"
                       title="${event.event_status === 1 ? '进行中' : '已停止'}"></span>
                 <i class="fas fa-star star-icon ${event.event_mark_status === 1 ? 'marked' : 'unmarked'}"
@@ -228,28 +250,20 @@ document.addEventListener('DOMContentLoaded', () => {
         tr.querySelector('.edit-btn').addEventListener('click', handleEdit); // Edit button needs modal target etc.
         tr.querySelector('.delete-btn').addEventListener('click', handleDelete);
         tr.querySelector('.star-icon').addEventListener('click', handleToggleMark);
+        tr.querySelector('.select-event').addEventListener('change', handleSelectEvent);
 
         return tr;
     }
 
     function renderDashboardCard(event) {
-        console.log("--- [调试] 进入 renderDashboardCard, 事件:", event.event_name); // <--- 添加
         const col = document.createElement('div');
         col.classList.add('col');
         col.setAttribute('data-event-id', event.event_id);
-        // ... (设置 data-status, data-last-start-time 等属性) ...
-        // --- VERIFY THIS BLOCK ---
-        // 确保为正在运行的事件添加了所有必要的 data-* 属性
+        // Add data attributes needed for live timer
         if (event.event_status === 1 && event.last_start_time) {
             col.setAttribute('data-status', 'running');
-            // 确保 event.last_start_time 是有效的 ISO 格式时间字符串
             col.setAttribute('data-last-start-time', event.last_start_time);
-            // 确保 event.total_duration_seconds 是一个数字
             col.setAttribute('data-initial-duration', event.total_duration_seconds);
-            console.log(`--- [调试 Card Timer Attr] Event ${event.event_id} - Setting running attributes:`, {
-                start: event.last_start_time,
-                initial: event.total_duration_seconds
-            });
         } else {
             col.setAttribute('data-status', 'stopped');
         }
@@ -293,17 +307,10 @@ document.addEventListener('DOMContentLoaded', () => {
             </div>
         </div>
     `;
-        console.log("--- [调试] renderDashboardCard 生成的 HTML (部分):", col.innerHTML.substring(0, 100) + "..."); // <--- 添加
-        // ... (添加事件监听器) ...
-        // 确保事件监听器正确添加
-        try {
-            col.querySelector('.start-stop-btn').addEventListener('click', handleStartStop);
-            col.querySelector('.star-icon').addEventListener('click', handleToggleMark);
-        } catch (listenerError) {
-            console.error("--- [调试] 添加事件监听器出错:", listenerError, "事件:", event.event_name);
-        }
+        col.querySelector('.start-stop-btn').addEventListener('click', handleStartStop);
+        col.querySelector('.star-icon').addEventListener('click', handleToggleMark);
 
-        return col; // 确保返回了创建的元素
+        return col;
     }
 
     function renderPaginationControls(currentPage, totalPages, itemsPerPage) {
@@ -394,15 +401,180 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // --- Keyed List Rendering ---
+    // Rows/cards are keyed by event_id and reused as long as their data is unchanged, so a refresh or a
+    // live update only touches the rows that changed. Lists longer than VIRTUAL_LIST_THRESHOLD are
+    // windowed: only the rows near the viewport are in the DOM, two spacers stand in for the rest.
+    function createListView(container, render, spacerTag, estimatedRowHeight) {
+        const createSpacer = () => {
+            const spacer = document.createElement(spacerTag);
+            spacer.className = 'virtual-spacer';
+            if (spacerTag === 'tr') spacer.innerHTML = '<td colspan="7"></td>';
+            return spacer;
+        };
+        return {
+            container, render,
+            items: [], // Event data in display order
+            nodes: new Map(), // event_id -> {el, signature} of the rendered rows
+            topSpacer: createSpacer(),
+            bottomSpacer: createSpacer(),
+            rowHeight: estimatedRowHeight, // Measured after the first render
+            perRow: 1 // Cards per grid row
+        };
+    }
+
+    const eventListView = createListView(eventList, renderEventRow, 'tr', 64);
+    const dashboardListView = createListView(dashboardEventList, renderDashboardCard, 'div', 230);
+
+    function setListItems(list, items) {
+        list.items = items;
+        renderList(list);
+    }
+
+    function visibleRange(list) {
+        const count = list.items.length;
+        if (count <= VIRTUAL_LIST_THRESHOLD) return [0, count];
+        const totalRows = Math.ceil(count / list.perRow);
+        const top = list.container.getBoundingClientRect().top; // Negative once the list start is scrolled past
+        const firstRow = Math.min(totalRows, Math.max(0, Math.floor(-top / list.rowHeight) - VIRTUAL_OVERSCAN_ROWS));
+        const lastRow = Math.max(firstRow, Math.min(totalRows, Math.ceil((window.innerHeight - top) / list.rowHeight) + VIRTUAL_OVERSCAN_ROWS));
+        return [firstRow * list.perRow, Math.min(count, lastRow * list.perRow)];
+    }
+
+    function renderList(list) {
+        const [start, end] = visibleRange(list);
+        const wanted = [];
+        const keep = new Set();
+        for (let i = start; i < end; i++) {
+            const event = list.items[i];
+            const signature = JSON.stringify(event);
+            let node = list.nodes.get(event.event_id);
+            if (!node || node.signature !== signature) {
+                if (node) dropElement(node.el);
+                node = {el: list.render(event), signature};
+                list.nodes.set(event.event_id, node);
+                trackTimer(node.el);
+            }
+            keep.add(event.event_id);
+            wanted.push(node.el);
+        }
+        list.nodes.forEach((node, eventId) => {
+            if (!keep.has(eventId)) {
+                dropElement(node.el);
+                list.nodes.delete(eventId);
+            }
+        });
+
+        const rendered = wanted.slice();
+        if (start > 0) {
+            list.topSpacer.style.height = `${(start / list.perRow) * list.rowHeight}px`;
+            wanted.unshift(list.topSpacer);
+        }
+        if (end < list.items.length) {
+            list.bottomSpacer.style.height = `${Math.ceil((list.items.length - end) / list.perRow) * list.rowHeight}px`;
+            wanted.push(list.bottomSpacer);
+        }
+
+        // Move/insert in order; untouched rows stay where they are
+        let cursor = list.container.firstChild;
+        wanted.forEach(el => {
+            if (el === cursor) {
+                cursor = cursor.nextSibling;
+            } else {
+                list.container.insertBefore(el, cursor);
+            }
+        });
+        while (cursor) { // Leftovers: unused spacers and stray nodes
+            const next = cursor.nextSibling;
+            cursor.remove();
+            cursor = next;
+        }
+
+        if (list.items.length > VIRTUAL_LIST_THRESHOLD) measureList(list, rendered);
+    }
+
+    function dropElement(el) {
+        untrackTimer(el);
+        el.remove();
+    }
+
+    function measureList(list, rendered) {
+        // Row height and cards per row from the rendered slice, used to size the spacers
+        if (rendered.length === 0 || rendered[0].offsetParent === null) return; // Hidden view, nothing to measure
+        const firstTop = rendered[0].offsetTop;
+        let perRow = 1;
+        while (perRow < rendered.length && rendered[perRow].offsetTop === firstTop) perRow++;
+        const rows = Math.ceil(rendered.length / perRow);
+        const rowHeight = rows > 1
+            ? (rendered[(rows - 1) * perRow].offsetTop - firstTop) / (rows - 1)
+            : rendered[0].offsetHeight;
+        if (rowHeight > 0 && (perRow !== list.perRow || Math.abs(rowHeight - list.rowHeight) > 1)) {
+            list.perRow = perRow;
+            list.rowHeight = rowHeight;
+            scheduleWindowRender(); // Re-window with the real sizes
+        }
+    }
+
+    function scheduleWindowRender() {
+        if (windowRenderPending) return;
+        windowRenderPending = true;
+        requestAnimationFrame(() => {
+            windowRenderPending = false;
+            const list = currentView === 'allEvents' ? eventListView : dashboardListView;
+            if (list.items.length > VIRTUAL_LIST_THRESHOLD) renderList(list);
+        });
+    }
+
+    window.addEventListener('scroll', scheduleWindowRender, {passive: true});
+    window.addEventListener('resize', scheduleWindowRender);
+
     // --- Live Timer Functions ---
+    // A single requestAnimationFrame loop drives all running rows/cards. An IntersectionObserver keeps the
+    // set of running elements that are on screen; the loop rewrites only those, once per wall-clock second.
+    const visibleTimers = new Set();
+    const timerObserver = window.IntersectionObserver ? new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                visibleTimers.add(entry.target);
+                updateRunningTimers([entry.target]); // Don't show a stale value until the next tick
+            } else {
+                visibleTimers.delete(entry.target);
+            }
+        });
+        startLiveTimers();
+    }) : null;
+
+    function trackTimer(el) {
+        if (el.dataset.status !== 'running') return;
+        if (timerObserver) {
+            timerObserver.observe(el);
+        } else {
+            visibleTimers.add(el);
+            updateRunningTimers([el]);
+            startLiveTimers();
+        }
+    }
+
+    function untrackTimer(el) {
+        if (timerObserver) timerObserver.unobserve(el);
+        visibleTimers.delete(el);
+    }
+
     function startLiveTimers() {
-        clearInterval(liveTimerInterval); // Clear previous interval
-        // Find elements that need live updates (both table rows and dashboard cards)
-        const runningElements = document.querySelectorAll('[data-status="running"][data-last-start-time]');
-        if (runningElements.length > 0) {
-            liveTimerInterval = setInterval(() => updateRunningTimers(runningElements), 1000);
-            updateRunningTimers(runningElements); // Update immediately
+        if (timerFrame === null && visibleTimers.size > 0) {
+            timerFrame = requestAnimationFrame(tickLiveTimers);
+        }
+    }
+
+    function tickLiveTimers() {
+        timerFrame = null;
+        if (visibleTimers.size === 0) return; // Restarted by the observer when a running element shows up
+        const second = Math.floor(Date.now() / 1000);
+        if (second !== lastTimerSecond) {
+            lastTimerSecond = second;
+            updateRunningTimers(visibleTimers);
         }
+        timerFrame = requestAnimationFrame(tickLiveTimers);
     }
 
     function updateRunningTimers(elements) {
@@ -418,43 +590,100 @@ document.addEventListener('DOMContentLoaded', () => {
                     const initialDuration = parseFloat(initialDurationAttr);
                     if (!isNaN(startTime) && !isNaN(initialDuration)) {
                         const elapsedSeconds = Math.max(0, (now - startTime) / 1000);
-                        const currentTotalSeconds = initialDuration + elapsedSeconds;
-                        durationDisplay.textContent = formatDuration(currentTotalSeconds);
+                        const text = formatDuration(initialDuration + elapsedSeconds);
+                        if (durationDisplay.textContent !== text) durationDisplay.textContent = text;
                     } else {
                         console.warn("Invalid time/duration data for timer:", el.dataset.eventId);
-                        // Optionally stop timer for this element or display 'Error'
                     }
                 } catch (e) {
                     console.error("Error calculating live time:", e);
-                    // Optionally stop timer for this element
                 }
             }
         });
     }
 
+    // --- Live Updates (patch rows/cards instead of refetching) ---
+    function patchListItem(list, eventId, event, keep) {
+        const index = list.items.findIndex(item => item.event_id === eventId);
+        if (index === -1) return false;
+        if (keep) {
+            list.items[index] = event;
+        } else {
+            list.items.splice(index, 1);
+        }
+        renderList(list);
+        return true;
+    }
+
+    function patchEvent(eventId, changes) {
+        const known = eventsById.get(eventId);
+        const event = known ? {...known, ...changes} : {...changes, event_id: eventId};
+        if (known) eventsById.set(eventId, event);
+
+        const keepRow = !(event.event_del_status === 0 && !currentFilters.show_deleted);
+        if (patchListItem(eventListView, eventId, event, keepRow) && !keepRow) {
+            eventsById.delete(eventId);
+            if (selectedEventIds.delete(eventId)) updateBulkActions();
+        }
+
+        const belongsOnDashboard = event.event_mark_status === 1 && event.event_del_status !== 0;
+        if (!patchListItem(dashboardListView, eventId, event, belongsOnDashboard)
+            && currentView === 'dashboard' && belongsOnDashboard && changes.event_mark_status === 1) {
+            // A newly marked event: the dashboard order depends on the server, reload it
+            scheduleRefresh();
+        }
+
+        checkEmptyMessages(currentView, (currentView === 'allEvents' ? eventListView : dashboardListView).items.length);
+    }
+
+    function scheduleRefresh() {
+        clearTimeout(refreshTimer);
+        refreshTimer = setTimeout(() => refreshCurrentView(), 300);
+    }
+
+    function connectEventStream() {
+        if (!window.EventSource) {
+            console.warn("EventSource not supported, live updates disabled.");
+            return;
+        }
+        // The browser reconnects on its own and sends Last-Event-ID to replay missed changes
+        eventStream = new EventSource(API_BASE_URL + '/api/stream');
+        const onDelta = (e) => {
+            try {
+                const data = JSON.parse(e.data);
+                patchEvent(data.event_id, data);
+            } catch (err) {
+                console.error("Invalid stream message:", e.data, err);
+            }
+        };
+        eventStream.addEventListener('status', onDelta);
+        eventStream.addEventListener('updated', onDelta);
+        eventStream.addEventListener('deleted', onDelta);
+        eventStream.addEventListener('created', () => {
+            if (currentView === 'allEvents') scheduleRefresh();
+        });
+        eventStream.addEventListener('reset', scheduleRefresh);
+        eventStream.onerror = () => console.warn("Event stream interrupted, reconnecting...");
+    }
+
     // --- Event Handlers ---
     async function refreshCurrentView() {
         console.log(`Refreshing view: ${currentView} (Page: ${allEventsCurrentPage}, Limit: ${allEventsItemsPerPage})`, "Filters:", currentFilters);
         showLoading();
         errorMessage.style.display = 'none'; // Hide previous errors
-        // Consider moving startLiveTimers() call to *after* data is loaded and rendered
-        // clearInterval(liveTimerInterval); // Clear existing timers immediately
 
         try {
             if (currentView === 'allEvents') {
                 await loadEventsData();
             } else if (currentView === 'dashboard') {
                 await loadDashboardData();
-                // !!! 不再需要在这里清空 !!!
             }
-            // Start timers AFTER new data is potentially rendered in either view
-            startLiveTimers();
         } catch (error) {
             console.error("Error refreshing view:", error);
             // Error message is shown by fetchApi
             // Ensure lists are cleared if error occurred during fetch/render
-            if (currentView === 'allEvents') eventList.innerHTML = '';
-            if (currentView === 'dashboard') dashboardEventList.innerHTML = ''; // Keep clear on error
+            if (currentView === 'allEvents') setListItems(eventListView, []);
+            if (currentView === 'dashboard') setListItems(dashboardListView, []);
         } finally {
             hideLoading();
             // Empty message check is now handled within load functions
@@ -462,7 +691,7 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     async function loadEventsData() {
-        eventList.innerHTML = ''; // Clear previous results
+        // The previous rows stay on screen until the new page arrives, unchanged rows are reused
 
         // Construct query parameters
         const params = new URLSearchParams({
@@ -474,11 +703,11 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             const data = await fetchApi(`/api/events?${params.toString()}`);
             if (data && data.events) {
-                const fragment = document.createDocumentFragment();
-                data.events.forEach(event => {
-                    fragment.appendChild(renderEventRow(event));
-                });
-                eventList.appendChild(fragment);
+                data.events.forEach(event => eventsById.set(event.event_id, event));
+                const pageIds = new Set(data.events.map(event => event.event_id));
+                selectedEventIds = new Set([...selectedEventIds].filter(eventId => pageIds.has(eventId)));
+                setListItems(eventListView, data.events);
+                updateBulkActions();
 
                 // Render pagination using the returned pagination info
                 renderPaginationControls(data.pagination.current_page, data.pagination.total_pages, data.pagination.items_per_page);
@@ -486,13 +715,14 @@ document.addEventListener('DOMContentLoaded', () => {
             } else {
                 // Handle cases where API returns success but no 'events' array
                 console.warn("Received data but no events array:", data);
+                setListItems(eventListView, []);
                 checkEmptyMessages('allEvents', 0);
                 paginationControls.innerHTML = ''; // Clear pagination if no events
             }
         } catch (error) {
             // Error display handled by fetchApi
             // Ensure list is cleared on error
-            eventList.innerHTML = '';
+            setListItems(eventListView, []);
             paginationControls.innerHTML = '';
             checkEmptyMessages('allEvents', 0); // Show empty message on error too
         }
@@ -500,41 +730,15 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     async function loadDashboardData() {
-        dashboardEventList.innerHTML = ''; // 清空之前的卡片
-        console.log("--- [调试] 开始加载仪表盘数据 ---"); // <--- 添加
         try {
             const dashboardEvents = await fetchApi('/api/dashboard');
-            console.log("--- [调试] /api/dashboard 返回的数据:", dashboardEvents); // <--- 添加 - 检查收到的数据
-
-            if (dashboardEvents && dashboardEvents.length > 0) {
-                console.log(`--- [调试] 准备渲染 ${dashboardEvents.length} 个仪表盘卡片 ---`); // <--- 添加
-                const fragment = document.createDocumentFragment();
-                dashboardEvents.forEach(event => {
-                    console.log("--- [调试] 正在为事件渲染卡片:", event.event_name, event); // <--- 添加 - 检查单个事件
-                    try { // 加个 try...catch 以防 render 函数内部出错
-                        const cardElement = renderDashboardCard(event);
-                        if (cardElement) { // 确保 render 函数返回了元素
-                            fragment.appendChild(cardElement);
-                        } else {
-                            console.error("--- [调试] renderDashboardCard 返回了 null 或 undefined，事件:", event);
-                        }
-                    } catch (renderError) {
-                        console.error("--- [调试] renderDashboardCard 内部出错:", renderError, "事件:", event);
-                    }
-                });
-                dashboardEventList.appendChild(fragment);
-                console.log(`--- [调试] 添加卡片为： ${fragment} ---`);
-                console.log("--- [调试] 已将卡片添加到 dashboardEventList ---"); // <--- 添加 - 确认追加操作执行
-            } else {
-                console.log("--- [调试] API 未返回有效的仪表盘事件数据 ---"); // <--- 添加
-            }
-            checkEmptyMessages('dashboard', dashboardEvents ? dashboardEvents.length : 0);
-            startLiveTimers(); // 确保计时器在渲染后启动
+            const events = Array.isArray(dashboardEvents) ? dashboardEvents : [];
+            events.forEach(event => eventsById.set(event.event_id, event));
+            setListItems(dashboardListView, events); // Only changed cards are re-rendered
+            checkEmptyMessages('dashboard', events.length);
         } catch (error) {
-            console.error("--- [调试] loadDashboardData 函数出错:", error); // <--- 添加 - 捕获此函数内的错误
-            // checkEmptyMessages('dashboard', 0);
+            console.error("Failed to load dashboard:", error);
         }
-        console.log("--- [调试] loadDashboardData 执行完毕 ---"); // <--- 添加
     }
 
     // --- Responsible Person Handling ---
@@ -610,7 +814,9 @@ document.addEventListener('DOMContentLoaded', () => {
             addEventForm.reset(); // Reset form fields
             nameInput.classList.remove('is-invalid'); // Clear validation state
             addEventModal.hide(); // Hide modal on success
-            await refreshCurrentView(); // Refresh the current view
+            if (currentView === 'allEvents') {
+                await refreshCurrentView(); // New events are never marked, the dashboard is unaffected
+            }
             await loadResponsiblePersons(); // Refresh person list in case a new one was added
         } catch (error) {
             console.error("Failed to add event:", error);
@@ -662,7 +868,11 @@ document.addEventListener('DOMContentLoaded', () => {
             editEventForm.reset(); // Reset form
             nameInput.classList.remove('is-invalid'); // Clear validation
             editEventModal.hide(); // Hide modal on success
-            await refreshCurrentView(); // Refresh view
+            if (updatedEvent && updatedEvent.event_id) {
+                patchEvent(updatedEvent.event_id, updatedEvent); // Re-render only the edited row/card
+            } else {
+                await refreshCurrentView();
+            }
             await loadResponsiblePersons(); // Refresh person list
         } catch (error) {
             console.error(`Failed to update event ${id}:`, error);
@@ -713,8 +923,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify({log_type: logType})
             });
             console.log(`Event ${eventId} ${action} result:`, result);
-            // Success: Refresh the view to show updated status and time
-            await refreshCurrentView(); // This will re-enable the button and reset opacity via re-render
+            // Success: Patch only this row/card (re-render resets the button and opacity)
+            if (result && result.statistics) {
+                patchEvent(parseInt(eventId), result.statistics);
+            } else {
+                await refreshCurrentView();
+            }
         } catch (error) {
             console.error(`Failed to ${action} event ${eventId}:`, error);
             // Error: Revert button state and opacity
@@ -792,8 +1006,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 // API call (no separate loading indicator, opacity is feedback)
                 await fetchApi(`/api/events/${eventId}`, {method: 'DELETE'});
                 console.log(`Event ${eventId} marked as deleted.`);
-                // Success: Refresh the view
-                await refreshCurrentView();
+                // Success: Drop the row/card
+                patchEvent(parseInt(eventId), {event_del_status: 0, event_status: 0});
             } catch (error) {
                 console.error(`Failed to delete event ${eventId}:`, error);
                 // Error: Revert visual feedback and button state
@@ -820,8 +1034,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify({event_mark_status: newMarkedStatus}),
             });
             console.log(`Event ${eventId} mark status toggled:`, updatedEvent);
-            // Success: Refresh the view
-            await refreshCurrentView();
+            // Success: Patch the row, or add/remove the dashboard card
+            patchEvent(parseInt(eventId), updatedEvent && updatedEvent.event_id ? updatedEvent : {event_mark_status: newMarkedStatus});
         } catch (error) {
             console.error(`Failed to toggle mark status for event ${eventId}:`, error);
             // Error: Revert icon state
@@ -830,6 +1044,91 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // --- Bulk Actions (multi-select) ---
+    function handleSelectEvent(event) {
+        const eventId = parseInt(event.currentTarget.dataset.eventId);
+        if (event.currentTarget.checked) {
+            selectedEventIds.add(eventId);
+        } else {
+            selectedEventIds.delete(eventId);
+        }
+        updateBulkActions();
+    }
+
+    function setSelection(eventIds) {
+        selectedEventIds = new Set(eventIds);
+        // Rendered rows keep their element, sync the checkboxes; windowed-out rows pick it up on render
+        eventList.querySelectorAll('.select-event').forEach(checkbox => {
+            checkbox.checked = selectedEventIds.has(parseInt(checkbox.dataset.eventId));
+        });
+        updateBulkActions();
+    }
+
+    function updateBulkActions() {
+        const count = selectedEventIds.size;
+        bulkActions.style.display = count > 0 ? 'block' : 'none';
+        bulkSelectedCount.textContent = count;
+        selectAllEventsCheckbox.checked = count > 0 && count === eventListView.items.length;
+        selectAllEventsCheckbox.indeterminate = count > 0 && count < eventListView.items.length;
+    }
+
+    async function handleBulkAction(event) {
+        const button = event.currentTarget;
+        const operation = button.dataset.bulkOperation;
+        const eventIds = [...selectedEventIds];
+        if (eventIds.length === 0) return;
+        const payload = {operation, event_ids: eventIds};
+        if (operation === 'reassign') {
+            payload.responsible_person = bulkPersonInput.value.trim() || null;
+        }
+        if (operation === 'delete' && !confirm(`确定要删除选中的 ${eventIds.length} 个事件吗？\n（进行中的事件会先停止计时，事件标记为已删除，不会永久移除数据）`)) {
+            return;
+        }
+
+        bulkActions.querySelectorAll('button').forEach(btn => btn.disabled = true);
+        try {
+            const response = await fetchApi('/api/events/bulk', {method: 'POST', body: JSON.stringify(payload)});
+            console.log(`Bulk ${operation} result:`, response);
+            // Patch the changed rows/cards locally (the stream delivers the same changes to other clients)
+            const failed = [];
+            response.results.forEach(result => {
+                if (result.status !== 200) {
+                    failed.push(`${eventsById.get(result.event_id)?.event_name || 'ID ' + result.event_id}: ${result.error}`);
+                } else if (result.result === 'updated') {
+                    const statistics = response.statistics[result.event_id];
+                    if (operation === 'delete') {
+                        patchEvent(result.event_id, {...statistics, event_del_status: 0, event_status: 0});
+                    } else if (operation === 'reassign') {
+                        patchEvent(result.event_id, {responsible_person: payload.responsible_person});
+                    } else if (operation === 'mark' || operation === 'unmark') {
+                        patchEvent(result.event_id, {event_mark_status: operation === 'mark' ? 1 : 0});
+                    } else if (statistics) {
+                        patchEvent(result.event_id, statistics);
+                    }
+                }
+            });
+            if (failed.length > 0) {
+                showError(`${failed.length} 个事件未能处理：${failed.slice(0, 3).join('；')}${failed.length > 3 ? ' …' : ''}`);
+            }
+            setSelection([]);
+            if (operation === 'reassign') {
+                bulkPersonInput.value = '';
+                await loadResponsiblePersons(); // A new person may have been introduced
+            }
+        } catch (error) {
+            console.error(`Bulk ${operation} failed:`, error);
+            // Error message shown by fetchApi, selection is kept for a retry
+        } finally {
+            bulkActions.querySelectorAll('button').forEach(btn => btn.disabled = false);
+        }
+    }
+
+    bulkActions.querySelectorAll('[data-bulk-operation]').forEach(btn => btn.addEventListener('click', handleBulkAction));
+    bulkClearSelectionBtn.addEventListener('click', () => setSelection([]));
+    selectAllEventsCheckbox.addEventListener('change', () => {
+        setSelection(selectAllEventsCheckbox.checked ? eventListView.items.map(item => item.event_id) : []);
+    });
+
     // --- Filter and Pagination Logic ---
     function applyFilters() {
         const name = filterNameInput.value.trim();
@@ -888,6 +1187,31 @@ document.addEventListener('DOMContentLoaded', () => {
 
     clearFiltersBtn.addEventListener('click', clearFilters);
 
+    // Name autocomplete: prefix suggestions from /api/events/suggest, debounced per keystroke
+    filterNameInput.addEventListener('input', () => {
+        clearTimeout(suggestTimer);
+        const term = filterNameInput.value.trim();
+        if (!term) {
+            filterNameSuggestions.innerHTML = '';
+            return;
+        }
+        suggestTimer = setTimeout(async () => {
+            try {
+                const response = await fetch(`${API_BASE_URL}/api/events/suggest?${new URLSearchParams({ q: term, limit: 10 })}`);
+                if (!response.ok || filterNameInput.value.trim() !== term) return; // Stale answer
+                const suggestions = await response.json();
+                filterNameSuggestions.innerHTML = '';
+                new Set(suggestions.map(item => item.event_name)).forEach(name => {
+                    const option = document.createElement('option');
+                    option.value = name;
+                    filterNameSuggestions.appendChild(option);
+                });
+            } catch (error) {
+                console.warn("Name suggestions unavailable:", error); // Autocomplete is optional, no error banner
+            }
+        }, 150);
+    });
+
     itemsPerPageSelect.addEventListener('change', () => {
         allEventsItemsPerPage = parseInt(itemsPerPageSelect.value) || 10;
         allEventsCurrentPage = 1; // Go to page 1 when changing items per page
@@ -1012,6 +1336,9 @@ document.addEventListener('DOMContentLoaded', () => {
         // 5. Load data for the initial view
         await refreshCurrentView(); // This handles loading indicator hide
 
+        // 6. Subscribe to live changes from other operators
+        connectEventStream();
+
         console.log("Application initialized.");
     }
 
@@ -0,0 +1,225 @@
+"""
+从 event_logs（及已归档的月份）重新计算 event_statistics，核对差异或批量重写。
+event_statistics 只由 update_event_statistics 增量维护，事务失败、手工改库等都会让它和日志不一致。
+
+按 event_id 区间分片，由进程池并行处理：每个分片按 (event_id, log_time, log_id) 顺序读入列数组，
+用 NumPy 向量化地配对开始/结束日志（规则与 fold_log_into_stats 相同），再和当前的统计行比较。
+
+用法: flask --app app rebuild-stats [--apply] [--workers N] [--shard-size N]
+重写时建议在写入低峰期执行：分片读取日志之后写入的新日志不会被计入。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:  # Optional, the command reports it is unavailable
+    np = None
+
+import storage
+from log_archive import LogArchive, fetch_columns, merge_arrays
+
+SHARD_SIZE = 50000 # Event ids per shard
+FETCH_SIZE = 50000
+UPSERT_CHUNK = 1000
+DURATION_TOLERANCE = 0.01 # Seconds, SQLite accumulates durations as floats
+DURATION_UNITS = 10000 # DECIMAL(20, 4): totals are summed in 0.0001 s units, each session rounded like the column
+FIELDS = ('event_status', 'last_start_time', 'last_stop_time', 'total_duration_seconds')
+
+
+def fold_arrays(event_ids, log_types, log_times):
+    """
+    按 (event_id, log_time, log_id) 排好序的日志列 → 每个事件的最终统计列。
+    一条结束日志的前一条日志（同一事件）是开始时构成一个计时段，这与逐条执行 fold_log_into_stats 等价：
+    只有最近一条日志是开始时状态才是 1，而 last_start_time 正是那条开始日志的时间。
+    """
+    count = len(event_ids)
+    first = np.ones(count, dtype=bool)
+    first[1:] = event_ids[1:] != event_ids[:-1]
+    group_starts = np.flatnonzero(first)
+    group_ends = np.append(group_starts[1:] - 1, count - 1)
+
+    micros = log_times.astype('int64')
+    closes = np.zeros(count, dtype=bool)
+    closes[1:] = (log_types[1:] == 0) & (log_types[:-1] == 1) & ~first[1:]
+    increments = np.zeros(count, dtype=np.int64)
+    increments[1:] = np.where(closes[1:], np.maximum(0, micros[1:] - micros[:-1]), 0)
+    units = (increments + 50) // 100 # Round half up to 0.0001 s, like TIMESTAMPDIFF(...) / 1000000
+    totals = np.add.reduceat(units, group_starts)
+
+    # Latest start / stop of each event: running maximum of their positions, read at the event's last row
+    positions = np.arange(count)
+    last_start = np.maximum.accumulate(np.where(log_types == 1, positions, -1))[group_ends]
+    last_stop = np.maximum.accumulate(np.where(log_types == 0, positions, -1))[group_ends]
+    not_a_time = np.datetime64('NaT', 'us')
+    return {
+        'event_id': event_ids[group_starts],
+        'event_status': log_types[group_ends].astype(np.int64),
+        'last_start_time': np.where(last_start >= group_starts, log_times[last_start], not_a_time),
+        'last_stop_time': np.where(last_stop >= group_starts, log_times[last_stop], not_a_time),
+        'total_units': totals,
+    }
+
+
+def _differences(expected, current, tolerance):
+    """比较一个事件的期望统计和当前统计行（None 表示没有统计行），返回不一致的字段名"""
+    if current is None:
+        return list(FIELDS)
+    fields = []
+    if int(current['event_status'] or 0) != expected['event_status']:
+        fields.append('event_status')
+    for name in ('last_start_time', 'last_stop_time'):
+        if current[name] != expected[name]:
+            fields.append(name)
+    if abs(float(current['total_duration_seconds'] or 0) - float(expected['total_duration_seconds'])) > tolerance:
+        fields.append('total_duration_seconds')
+    return fields
+
+
+def _write_statistics(cursor, rows):
+    for chunk_start in range(0, len(rows), UPSERT_CHUNK):
+        chunk = rows[chunk_start:chunk_start + UPSERT_CHUNK]
+        values_sql = ", ".join(["(%s, %s, %s, %s, %s)"] * len(chunk))
+        flat_params = []
+        for row in chunk:
+            flat_params.extend([row['event_id'], row['last_start_time'], row['last_stop_time'],
+                                row['total_duration_seconds'], row['event_status']])
+        cursor.execute(f"""
+            INSERT INTO event_statistics (event_id, last_start_time, last_stop_time, total_duration_seconds, event_status)
+            VALUES {values_sql}
+            ON DUPLICATE KEY UPDATE
+                last_start_time = VALUES(last_start_time), last_stop_time = VALUES(last_stop_time),
+                total_duration_seconds = VALUES(total_duration_seconds), event_status = VALUES(event_status)
+        """, tuple(flat_params))
+
+
+def rebuild_shard(backend_args, archive_dir, low, high, apply=False, tolerance=DURATION_TOLERANCE, samples=20):
+    """
+    处理 event_id 在 [low, high) 内的分片（在工作进程里执行），返回
+    {'logs', 'events', 'differences', 'fields': {字段: 不一致的事件数}, 'samples': [...], 'written'}。
+    """
+    backend = storage.create_backend(*backend_args)
+    conn = backend.connect()
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute("""
+            SELECT log_id, event_id, log_type, log_time FROM event_logs
+            WHERE event_id >= %s AND event_id < %s
+            ORDER BY event_id, log_time, log_id
+        """, (low, high))
+        hot = fetch_columns(cursor, FETCH_SIZE)
+        cursor.close()
+        parts = ([hot] if hot is not None else []) + LogArchive(archive_dir).event_range(low, high)
+        # Hot rows come back sorted; archived months have to be merged (and deduplicated by log_id) first
+        logs = parts[0] if len(parts) == 1 else merge_arrays(parts) if parts else None
+
+        expected = {}
+        if logs is not None:
+            folded = fold_arrays(logs['event_id'], logs['log_type'], logs['log_time'])
+            for event_id, status, start, stop, units in zip(
+                    folded['event_id'].tolist(), folded['event_status'].tolist(), folded['last_start_time'].tolist(),
+                    folded['last_stop_time'].tolist(), folded['total_units'].tolist()):
+                expected[event_id] = {'event_id': event_id, 'event_status': status, 'last_start_time': start,
+                                      'last_stop_time': stop,
+                                      'total_duration_seconds': Decimal(units) / DURATION_UNITS}
+
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT event_id, event_status, last_start_time, last_stop_time, total_duration_seconds
+            FROM event_statistics WHERE event_id >= %s AND event_id < %s
+        """, (low, high))
+        current = {row['event_id']: row for row in cursor.fetchall()}
+        # A statistics row without any logs should be back at the initial state
+        for event_id in current.keys() - expected.keys():
+            expected[event_id] = {'event_id': event_id, 'event_status': 0, 'last_start_time': None,
+                                  'last_stop_time': None, 'total_duration_seconds': Decimal(0)}
+
+        result = {'logs': 0 if logs is None else len(logs['log_id']), 'events': len(expected),
+                  'differences': 0, 'fields': {}, 'samples': [], 'written': 0}
+        changed = []
+        for event_id in sorted(expected):
+            fields = _differences(expected[event_id], current.get(event_id), tolerance)
+            if not fields:
+                continue
+            changed.append(expected[event_id])
+            for name in fields:
+                result['fields'][name] = result['fields'].get(name, 0) + 1
+            if len(result['samples']) < samples:
+                row = current.get(event_id)
+                result['samples'].append((event_id, {name: (row[name] if row else None, expected[event_id][name])
+                                                     for name in fields}))
+        result['differences'] = len(changed)
+        if apply and changed:
+            _write_statistics(cursor, changed)
+            conn.commit()
+            result['written'] = len(changed)
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def shards(backend, archive, shard_size=SHARD_SIZE):
+    """覆盖日志、归档和统计表中所有 event_id 的 [low, high) 区间"""
+    conn = backend.connect()
+    cursor = conn.cursor()
+    try:
+        bounds = []
+        for table in ('event_logs', 'event_statistics'):
+            cursor.execute(f"SELECT MIN(event_id), MAX(event_id) FROM {table}")
+            low, high = cursor.fetchone()
+            if low is not None:
+                bounds.append((low, high))
+    finally:
+        cursor.close()
+        conn.close()
+    archived = archive.event_id_range()
+    if archived:
+        bounds.append(archived)
+    if not bounds:
+        return []
+    low = min(bound[0] for bound in bounds)
+    high = max(bound[1] for bound in bounds) + 1
+    return [(start, min(start + shard_size, high)) for start in range(low, high, shard_size)]
+
+
+def rebuild(backend_args, archive_dir, apply=False, workers=None, shard_size=SHARD_SIZE,
+            tolerance=DURATION_TOLERANCE, samples=20, progress=None):
+    """
+    并行核对（apply=True 时重写）所有事件的统计，返回各分片结果的汇总。
+    backend_args 是 storage.create_backend 的参数，工作进程各自建立连接。
+    """
+    if np is None:
+        raise RuntimeError("numpy is required to rebuild event_statistics")
+    backend = storage.create_backend(*backend_args)
+    ranges = shards(backend, LogArchive(archive_dir), shard_size)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(ranges) or 1))
+    summary = {'shards': len(ranges), 'workers': workers, 'logs': 0, 'events': 0, 'differences': 0,
+               'fields': {}, 'samples': [], 'written': 0}
+
+    def add(result):
+        for key in ('logs', 'events', 'differences', 'written'):
+            summary[key] += result[key]
+        for name, count in result['fields'].items():
+            summary['fields'][name] = summary['fields'].get(name, 0) + count
+        summary['samples'].extend(result['samples'][:max(0, samples - len(summary['samples']))])
+
+    if workers == 1:
+        for done, (low, high) in enumerate(ranges, 1):
+            add(rebuild_shard(backend_args, archive_dir, low, high, apply, tolerance, samples))
+            if progress:
+                progress(done, len(ranges))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(rebuild_shard, backend_args, archive_dir, low, high, apply, tolerance, samples)
+                       for low, high in ranges]
+            for done, future in enumerate(as_completed(futures), 1):
+                add(future.result())
+                if progress:
+                    progress(done, len(ranges))
+    summary['samples'].sort(key=lambda sample: sample[0])
+    return summary
@@ -0,0 +1,317 @@
+import os
+import re
+import sqlite3
+import threading
+import urllib.parse
+from datetime import date, datetime
+from decimal import Decimal
+
+import mysql.connector
+from mysql.connector import errorcode
+
+import migrations
+
+# 路由里统一捕获的数据库异常
+DB_ERRORS = (mysql.connector.Error, sqlite3.Error)
+
+
+def is_duplicate_key(err):
+    if isinstance(err, sqlite3.IntegrityError):
+        return 'UNIQUE constraint failed' in str(err) or 'PRIMARY KEY' in str(err)
+    return getattr(err, 'errno', None) == errorcode.ER_DUP_ENTRY
+
+def is_missing_table(err):
+    if isinstance(err, sqlite3.OperationalError):
+        return 'no such table' in str(err)
+    return getattr(err, 'errno', None) == errorcode.ER_NO_SUCH_TABLE
+
+def is_deadlock(err):
+    """InnoDB 选中本事务作为死锁的牺牲者，整个事务已经回滚（SQLite 的写入是串行的，不会死锁）"""
+    return getattr(err, 'errno', None) == errorcode.ER_LOCK_DEADLOCK
+
+def is_connection_error(err):
+    """连不上、连接断开或数据库文件打不开，而不是语句本身出错"""
+    if isinstance(err, sqlite3.OperationalError):
+        return 'unable to open' in str(err) or 'disk I/O error' in str(err)
+    return isinstance(err, (mysql.connector.errors.InterfaceError, mysql.connector.errors.OperationalError))
+
+
+# --- MySQL / MariaDB ---
+class MySQLBackend:
+    """MySQL / MariaDB，SQL 原样执行"""
+    name = 'mysql'
+    prepared_statements = True
+
+    def __init__(self, config, read_only=False):
+        self.config = dict(config)
+        self.read_only = read_only
+
+    def connect(self):
+        conn = mysql.connector.connect(**self.config)
+        if self.read_only:
+            # A replica that is writable by mistake still rejects writes from this pool
+            cursor = conn.cursor()
+            cursor.execute("SET SESSION TRANSACTION READ ONLY")
+            cursor.close()
+        return conn
+
+    def replica_lag(self, conn):
+        """复制延迟秒数；不是副本时返回 None（延迟未知），复制线程停止时返回无穷大"""
+        cursor = conn.cursor(dictionary=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS") # MySQL 8.0.22+ / MariaDB 10.5.1+
+            except mysql.connector.errors.ProgrammingError:
+                cursor.execute("SHOW SLAVE STATUS")
+            rows = cursor.fetchall() # One row per replication channel
+        finally:
+            cursor.close()
+        if not rows:
+            return None
+        lags = [row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master')) for row in rows]
+        return float('inf') if any(lag is None for lag in lags) else float(max(lags))
+
+    def ensure_schema(self):
+        """执行未执行的结构迁移，返回 [(版本, 描述, [创建的对象])]"""
+        return migrations.migrate(self)
+
+
+# --- SQLite (嵌入式，WAL) ---
+# Conflict targets for translating ON DUPLICATE KEY UPDATE
+SQLITE_UPSERT_KEYS = {
+    'event_statistics': 'event_id',
+    'event_daily_durations': 'event_id, day',
+    'person_summary': 'responsible_person',
+}
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',     # Durable at checkpoints, safe against corruption in WAL mode
+    'busy_timeout': 5000,        # Writers wait for the lock instead of failing immediately
+    'cache_size': -65536,        # 64 MiB page cache
+    'temp_store': 'MEMORY',
+    'mmap_size': 268435456,      # 256 MiB memory-mapped reads
+    'foreign_keys': 'OFF',
+}
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter('DATETIME', lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('DATE', lambda raw: date.fromisoformat(raw.decode()[:10]))
+# No DECIMAL converter on purpose: sqlite renders REAL as text with 15 digits, which would not round-trip.
+# DECIMAL columns come back as float; callers already wrap them in Decimal() before doing arithmetic.
+
+_WRITE_STATEMENT = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+_LOCKING_CLAUSE = re.compile(r'\s+(FOR\s+UPDATE|LOCK\s+IN\s+SHARE\s+MODE)\b', re.IGNORECASE)
+_DATE_ADD = re.compile(r'DATE_ADD\(\s*([^,]+?)\s*,\s*INTERVAL\s+(\d+)\s+DAY\s*\)', re.IGNORECASE)
+_TIMESTAMPDIFF = re.compile(r'TIMESTAMPDIFF\(\s*MICROSECOND\s*,\s*([^,]+?)\s*,\s*([^)]+?)\s*\)\s*/\s*1000000',
+                            re.IGNORECASE)
+_ON_DUPLICATE = re.compile(r'ON\s+DUPLICATE\s+KEY\s+UPDATE', re.IGNORECASE)
+_VALUES_FUNCTION = re.compile(r'\bVALUES\((\w+)\)', re.IGNORECASE)
+_INSERT_TABLE = re.compile(r'INSERT\s+INTO\s+(\w+)', re.IGNORECASE)
+_GREATEST = re.compile(r'\bGREATEST\(', re.IGNORECASE)
+_IF_FUNCTION = re.compile(r'\bIF\(', re.IGNORECASE)
+_CHAR_LENGTH = re.compile(r'\bCHAR_LENGTH\(', re.IGNORECASE)
+
+
+class SQLiteStatement:
+    __slots__ = ('sql', 'writes')
+
+    def __init__(self, sql, writes):
+        self.sql = sql
+        self.writes = writes
+
+
+_statement_cache = {}
+_statement_cache_lock = threading.Lock()
+
+def translate_sql(sql):
+    """
+    把路由里使用的 MySQL 写法改写为 SQLite 写法（结果按 SQL 文本缓存）：
+    %s 占位符、DATE_ADD(.., INTERVAL n DAY)、TIMESTAMPDIFF(MICROSECOND, ..) / 1000000、
+    IF / GREATEST / CHAR_LENGTH、ON DUPLICATE KEY UPDATE ... VALUES(col)、FOR UPDATE / LOCK IN SHARE MODE。
+    关键字和函数名不区分大小写。只覆盖本项目用到的写法，不是通用的方言转换器。
+    """
+    statement = _statement_cache.get(sql)
+    if statement is not None:
+        return statement
+
+    text = sql
+    locking = bool(_LOCKING_CLAUSE.search(text))
+    text = _LOCKING_CLAUSE.sub('', text)
+    text = _DATE_ADD.sub(lambda m: f"datetime({m.group(1)}, '+{m.group(2)} day')", text)
+    text = _TIMESTAMPDIFF.sub(lambda m: f"((julianday({m.group(2)}) - julianday({m.group(1)})) * 86400.0)", text)
+    text = _GREATEST.sub('MAX(', text)
+    text = _IF_FUNCTION.sub('IIF(', text)
+    text = _CHAR_LENGTH.sub('LENGTH(', text) # SQLite LENGTH counts characters
+    if _ON_DUPLICATE.search(text):
+        table = _INSERT_TABLE.search(text).group(1)
+        text = _ON_DUPLICATE.sub(f"ON CONFLICT ({SQLITE_UPSERT_KEYS[table]}) DO UPDATE SET", text)
+        text = _VALUES_FUNCTION.sub(r'excluded.\1', text)
+    text = text.replace('%s', '?')
+
+    # Writes and locking reads take the write lock up front (BEGIN IMMEDIATE), see SQLiteConnection
+    statement = SQLiteStatement(text, locking or bool(_WRITE_STATEMENT.match(text)))
+    with _statement_cache_lock:
+        if len(_statement_cache) > 2048:
+            _statement_cache.clear()
+        _statement_cache[sql] = statement
+    return statement
+
+
+class SQLiteCursor:
+    """mysql.connector 游标接口的子集：execute / executemany / fetch* / lastrowid / rowcount，支持 dictionary 行"""
+
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection._conn.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, sql, params=()):
+        statement = translate_sql(sql)
+        if statement.writes:
+            self._connection._begin()
+        self._cursor.execute(statement.sql, tuple(params or ()))
+
+    def executemany(self, sql, seq_params):
+        statement = translate_sql(sql)
+        if statement.writes:
+            self._connection._begin()
+        self._cursor.executemany(statement.sql, seq_params)
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip([column[0] for column in self._cursor.description], row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        rows = self._cursor.fetchmany(size)
+        return [self._row(row) for row in rows] if self._dictionary else rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        return [self._row(row) for row in rows] if self._dictionary else rows
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """
+    提供路由用到的 mysql.connector 连接接口（cursor / commit / rollback / ping ...）。
+    语句默认自动提交；第一条写语句或加锁读之前执行 BEGIN IMMEDIATE，
+    与 MySQL 一样在 commit() / rollback() 之前保持同一个事务。
+    """
+    unread_result = False
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def _begin(self):
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN IMMEDIATE")
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def cursor(self, dictionary=False, buffered=None, prepared=False):
+        return SQLiteCursor(self, dictionary=dictionary)
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute("COMMIT")
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+
+    def consume_results(self):
+        pass
+
+    def ping(self, reconnect=False):
+        self._conn.execute("SELECT 1").fetchone()
+
+    def is_connected(self):
+        try:
+            self.ping()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLiteBackend:
+    """嵌入式 SQLite：WAL 模式，读写不互相阻塞，适合单节点小规模部署"""
+    name = 'sqlite'
+    prepared_statements = False # sqlite3 already caches compiled statements per connection
+
+    def __init__(self, path, pragmas=None, read_only=False, primary_path=None):
+        self.path = path
+        self.pragmas = dict(SQLITE_PRAGMAS, **(pragmas or {}))
+        self.read_only = read_only
+        self.primary_path = primary_path
+        if read_only:
+            # The journal mode belongs to the file, a read-only connection cannot change it
+            self.pragmas.pop('journal_mode', None)
+
+    def connect(self):
+        target, uri = self.path, False
+        if self.read_only:
+            target, uri = f"file:{urllib.parse.quote(os.path.abspath(self.path))}?mode=ro", True
+        conn = sqlite3.connect(target, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+                               check_same_thread=False, cached_statements=256, uri=uri)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return SQLiteConnection(conn)
+
+    def replica_lag(self, conn):
+        """只读打开主库文件时没有延迟；其他文件（例如定期同步过来的副本）的延迟未知"""
+        if self.primary_path and os.path.realpath(self.path) == os.path.realpath(self.primary_path):
+            return 0.0
+        return None
+
+    def ensure_schema(self):
+        """执行未执行的结构迁移，返回 [(版本, 描述, [创建的对象])]"""
+        return migrations.migrate(self)
+
+
+def create_backend(name, mysql_config, sqlite_path):
+    if name == 'mysql':
+        return MySQLBackend(mysql_config)
+    if name == 'sqlite':
+        return SQLiteBackend(sqlite_path)
+    raise ValueError(f"Unknown DB_BACKEND {name!r}, expected 'mysql' or 'sqlite'")
+
+
+def create_replica_backend(name, mysql_config, sqlite_path, address):
+    """
+    DB_REPLICAS 里的一项 -> 只读副本的后端。
+    MySQL 为 host 或 host:port，用户、密码、库名与主库相同；SQLite 为数据库文件路径，以只读方式打开
+    （可以就是主库文件：读取走单独的连接池，不和写入争用连接）。
+    """
+    if name == 'mysql':
+        host, _, port = address.partition(':')
+        return MySQLBackend(dict(mysql_config, host=host, port=int(port) if port else mysql_config.get('port', 3306)),
+                            read_only=True)
+    if name == 'sqlite':
+        return SQLiteBackend(address, read_only=True, primary_path=sqlite_path)
+    raise ValueError(f"Unknown DB_BACKEND {name!r}, expected 'mysql' or 'sqlite'")